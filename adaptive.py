@@ -0,0 +1,76 @@
+import time
+import numpy as np
+from raster import DensityRaster
+from instrument import phase
+
+
+def render_adaptive(chunks, raster: DensityRaster, tol: float = 0.05, coverage_tol: float = 0.01,
+                    max_points: int = None, max_seconds: float = None, min_points: int = 2**16)->dict:
+    """
+    Adding blocks of points to a raster until the image stops changing. The raster is compared
+    at checkpoints where the number of points has doubled: the change is the total variation
+    distance between the normalized densities counts/points at the two checkpoints, and the
+    coverage change is the fraction of the hit pixels that were first hit since the last
+    checkpoint. Both shrink as the sampling noise goes down, and the more pixels the attractor
+    covers, the more points it takes, so the number of points follows the attractor and the
+    resolution.
+    Arguments:
+        chunks(iterable):
+            blocks of (points, colors), colors being None without color
+        raster(DensityRaster):
+            raster the points are added to
+        tol(float):
+            largest density change of a converged image
+        coverage_tol(float):
+            largest coverage change of a converged image
+        max_points(int):
+            stop after this many points, no limit if None
+        max_seconds(float):
+            stop after this much time, no limit if None
+        min_points(int):
+            points added before the first checkpoint
+    returns:
+        dict:
+            'points' used, 'chunks', 'seconds', the last 'change' and 'coverage_change',
+            whether it 'converged' and the 'reason' it stopped: 'converged', 'points', 'time'
+            or 'exhausted' when chunks ran out
+    """
+    start = time.perf_counter()
+    report = {'points': 0, 'chunks': 0, 'seconds': 0.0, 'change': np.inf, 'coverage_change': np.inf,
+              'converged': False, 'reason': 'exhausted'}
+    snapshot = None
+    checkpoint = min_points
+    with phase('adaptive.render'):
+        for points, colors in chunks:
+            if max_points is not None and report['points'] + len(points) > max_points:
+                keep = max_points - report['points']
+                points = points[:keep]
+                colors = None if colors is None else colors[:keep]
+            raster.add(points, colors)
+            report['points'] += len(points)
+            report['chunks'] += 1
+            elapsed = time.perf_counter() - start
+
+            if report['points'] >= checkpoint:
+                total = raster.counts.sum()
+                if snapshot is not None and total > 0:
+                    old_total, old = snapshot
+                    report['change'] = 0.5*np.abs(raster.counts/total - old/old_total).sum()
+                    hits = np.count_nonzero(raster.counts)
+                    report['coverage_change'] = (hits - np.count_nonzero(old)) / hits
+                    if report['change'] <= tol and report['coverage_change'] <= coverage_tol:
+                        report['converged'] = True
+                        report['reason'] = 'converged'
+                        break
+                if total > 0:
+                    snapshot = (total, raster.counts.copy())
+                checkpoint = 2*report['points']
+
+            if max_points is not None and report['points'] >= max_points:
+                report['reason'] = 'points'
+                break
+            if max_seconds is not None and elapsed >= max_seconds:
+                report['reason'] = 'time'
+                break
+    report['seconds'] = time.perf_counter() - start
+    return report
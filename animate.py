@@ -0,0 +1,177 @@
+import os
+import shutil
+import subprocess
+import matplotlib.image
+import numpy as np
+from raster import DensityRaster
+from instrument import phase
+
+# Suffixes written through ffmpeg when it is installed
+VIDEO_SUFFIXES = ('.mp4', '.mkv', '.mov', '.webm', '.avi', '.gif')
+
+
+class PngSequence:
+    def __init__(self, pattern: str)->None:
+        """
+        Constructor for PngSequence, writing every frame to its own PNG file.
+        Arguments:
+            pattern(str):
+                file name with a format field for the frame number, such as 'frames/{:05d}.png'
+        """
+        folder = os.path.dirname(pattern)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        self.pattern = pattern
+        self.frames = 0
+
+    def write(self, image: np.ndarray)->None:
+        """
+        Writing one frame.
+        Arguments:
+            image(np.ndarray):
+                image with shape (height, width, 3) and values in [0, 1]
+        """
+        matplotlib.image.imsave(self.pattern.format(self.frames), image)
+        self.frames += 1
+
+    def close(self)->None:
+        """
+        Nothing to finish, every frame is already written.
+        """
+
+
+class FfmpegPipe:
+    def __init__(self, outfile: str, width: int, height: int, fps: float = 30, ffmpeg: str = 'ffmpeg')->None:
+        """
+        Constructor for FfmpegPipe, sending the frames as raw RGB bytes to an ffmpeg process
+        that encodes them, so no frame is written to disk.
+        Arguments:
+            outfile(str):
+                Name of the video file
+            width(int):
+                width of the frames in pixels
+            height(int):
+                height of the frames in pixels
+            fps(float):
+                frames per second
+            ffmpeg(str):
+                ffmpeg executable
+        """
+        command = [ffmpeg, '-y', '-loglevel', 'error', '-f', 'rawvideo', '-pix_fmt', 'rgb24',
+                   '-s', f'{width}x{height}', '-r', str(fps), '-i', '-']
+        if not outfile.endswith('.gif'):
+            # Most encoders need even sizes for yuv420p
+            command += ['-vf', 'pad=ceil(iw/2)*2:ceil(ih/2)*2', '-pix_fmt', 'yuv420p']
+        self.outfile = outfile
+        self.shape = (height, width, 3)
+        self.frames = 0
+        self.process = subprocess.Popen(command + [outfile], stdin=subprocess.PIPE)
+
+    def write(self, image: np.ndarray)->None:
+        """
+        Sending one frame to ffmpeg.
+        Arguments:
+            image(np.ndarray):
+                image with shape (height, width, 3) and values in [0, 1]
+        """
+        if image.shape != self.shape:
+            raise ValueError()
+        self.process.stdin.write((image*255 + 0.5).astype(np.uint8).tobytes())
+        self.frames += 1
+
+    def close(self)->None:
+        """
+        Waiting for ffmpeg to finish the file.
+        """
+        self.process.stdin.close()
+        if self.process.wait() != 0:
+            raise RuntimeError(f'ffmpeg failed to write {self.outfile}')
+
+
+def open_writer(outfile: str, width: int, height: int, fps: float = 30):
+    """
+    Choosing how frames are written. A file name with a format field is a PNG sequence, a
+    video file is encoded by ffmpeg if it is installed, and otherwise its frames are written
+    as a PNG sequence next to it, <name>_00000.png and so on.
+    Arguments:
+        outfile(str):
+            file name or pattern
+        width(int):
+            width of the frames in pixels
+        height(int):
+            height of the frames in pixels
+        fps(float):
+            frames per second of a video
+    returns:
+        PngSequence or FfmpegPipe:
+            the writer
+    """
+    if '{' in outfile:
+        return PngSequence(outfile)
+    stem, suffix = os.path.splitext(outfile)
+    if suffix.lower() not in VIDEO_SUFFIXES:
+        raise ValueError()
+    ffmpeg = shutil.which('ffmpeg')
+    if ffmpeg is None:
+        return PngSequence(stem + '_{:05d}.png')
+    return FfmpegPipe(outfile, width, height, fps, ffmpeg)
+
+
+def write_animation(chunks, raster: DensityRaster, writer, every: int, max_points: int = None,
+                    overlay: np.ndarray = None, **kwargs)->dict:
+    """
+    Writing the build-up of an image as frames. The blocks of points are added to one raster,
+    which is never cleared, and a frame is made from it every time another `every` points have
+    been added, splitting the blocks at the frame boundaries. The cost is that of adding the
+    points once plus one image per frame, and only one frame is held in memory.
+    Arguments:
+        chunks(iterable):
+            blocks of (points, colors), colors being None without color
+        raster(DensityRaster):
+            raster the points are added to
+        writer(PngSequence or FfmpegPipe):
+            where the frames go, any object with write(image) and close()
+        every(int):
+            number of points between frames
+        max_points(int):
+            stop after this many points, no limit if None
+        overlay(np.ndarray):
+            points stamped on every frame, such as the corners of an n-gon
+        **kwargs:
+            arguments of DensityRaster.image
+    returns:
+        dict:
+            number of 'points' added and of 'frames' written
+    """
+    if every < 1:
+        raise ValueError()
+    report = {'points': 0, 'frames': 0}
+
+    def frame():
+        with phase('animate.frame', raster.width*raster.height):
+            image = raster.image(**kwargs)
+            if overlay is not None:
+                raster.stamp(image, overlay)
+            writer.write(image)
+        report['frames'] += 1
+
+    try:
+        for points, colors in chunks:
+            if max_points is not None:
+                points = points[:max_points - report['points']]
+                colors = None if colors is None else colors[:len(points)]
+            start = 0
+            while start < len(points):
+                stop = min(len(points), start + every - report['points'] % every)
+                raster.add(points[start:stop], None if colors is None else colors[start:stop])
+                report['points'] += stop - start
+                start = stop
+                if report['points'] % every == 0:
+                    frame()
+            if max_points is not None and report['points'] >= max_points:
+                break
+        if report['points'] % every:
+            frame()
+    finally:
+        writer.close()
+    return report
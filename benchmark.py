@@ -0,0 +1,227 @@
+"""
+Benchmarks of the generators and renderers.
+
+    python benchmark.py                           # run and print a table
+    python benchmark.py --save baseline.json      # store a baseline
+    python benchmark.py --compare baseline.json   # exit with 1 on a regression
+
+Every case is timed over a range of sizes, reporting the best wall time, the throughput in
+points per second and the peak memory traced by tracemalloc.
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+import matplotlib
+import matplotlib.pyplot as plt
+import numpy as np
+
+import fern
+import triangle
+from chaos_game import ChaosGame
+from variations import Variations
+
+SIZES = [10**3, 10**4, 10**5, 10**6, 10**7]
+
+
+def _iterate(N: int):
+    game = ChaosGame(5, 0.4)
+    return lambda: game.iterate(N)
+
+
+def _gradient_color(N: int):
+    game = ChaosGame(5, 0.4)
+    game.iterate(N)
+    return lambda: game.gradient_color
+
+
+def _savepng(N: int):
+    game = ChaosGame(5, 0.4)
+
+    def run():
+        with tempfile.TemporaryDirectory() as folder:
+            game.savepng(os.path.join(folder, 'chaos.png'), color=True, steps=N)
+    return run
+
+
+def _plot(N: int):
+    game = ChaosGame(5, 0.4)
+
+    def run():
+        game.plot(color=True, steps=N)
+        plt.close('all')
+    return run
+
+
+def _fern_iterating(N: int):
+    return lambda: fern.iterating(N=N)
+
+
+def _fern_ifs(N: int):
+    return lambda: fern.barnsley.iterate(N)
+
+
+def _triangle(N: int):
+    def run():
+        triangle.Alternative_iteration_func(N)
+        plt.close('all')
+    return run
+
+
+def _variation(name: str):
+    def make(N: int):
+        x, y = np.random.default_rng(0).uniform(-1, 1, (2, N))
+        return lambda: getattr(Variations, name)(x, y)
+    return make
+
+
+def _variations_batch(N: int):
+    x, y = np.random.default_rng(0).uniform(-1, 1, (2, N))
+    names = ["linear", "handkerchief", "swirl", "disc", "diamond", "power"]
+    return lambda: Variations.batch(x, y, names)
+
+
+# name: (function making the callable to time for a size, largest size)
+CASES = {
+    'chaos_game.iterate': (_iterate, 10**7),
+    'chaos_game.gradient_color': (_gradient_color, 10**7),
+    'chaos_game.plot': (_plot, 10**6),
+    'chaos_game.savepng': (_savepng, 10**6),
+    'fern.iterating': (_fern_iterating, 10**5),
+    'fern.barnsley.iterate': (_fern_ifs, 10**7),
+    'triangle.Alternative_iteration_func': (_triangle, 10**7),
+    'variations.batch': (_variations_batch, 10**7),
+}
+for _name in ["linear", "handkerchief", "swirl", "disc", "diamond", "power"]:
+    CASES['variations.' + _name] = (_variation(_name), 10**7)
+
+
+def measure(make, N: int, repeat: int = 3)->dict:
+    """
+    Timing one case at one size.
+    Arguments:
+        make(callable):
+            function returning the callable to time
+        N(int):
+            number of points
+        repeat(int):
+            number of timed runs, fewer if a run takes more than a second
+    returns:
+        dict:
+            best wall time in seconds, points per second and peak traced memory in bytes
+    """
+    run = make(N)
+    run()
+    best = np.inf
+    for _ in range(repeat):
+        start = time.perf_counter()
+        run()
+        best = min(best, time.perf_counter() - start)
+        if best > 1:
+            break
+
+    tracemalloc.start()
+    run()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return {'seconds': best, 'points_per_s': N/best, 'peak_bytes': peak}
+
+
+def run(cases: list = None, sizes: list = SIZES, repeat: int = 3, out=sys.stdout)->dict:
+    """
+    Running the benchmarks.
+    Arguments:
+        cases(list):
+            names of the cases to run, all if None
+        sizes(list):
+            numbers of points, each case stops at its largest size
+        repeat(int):
+            number of timed runs per size
+        out(file):
+            where the table is printed, nothing is printed if None
+    returns:
+        dict:
+            results by case name and size
+    """
+    results = {}
+    for name in CASES if cases is None else cases:
+        make, largest = CASES[name]
+        results[name] = {}
+        for N in sizes:
+            if N > largest:
+                continue
+            result = measure(make, N, repeat)
+            results[name][str(N)] = result
+            if out is not None:
+                print(f"{name:40s} {N:>9d} {result['seconds']:10.4f} s "
+                      f"{result['points_per_s']:12.3e} pts/s {result['peak_bytes']/2**20:9.1f} MiB", file=out)
+    return results
+
+
+def compare(results: dict, baseline: dict, threshold: float = 0.25)->list:
+    """
+    Finding the results that are slower, or use more memory, than the baseline by more than
+    the threshold. Times below a millisecond are too noisy and only their memory is checked.
+    Arguments:
+        results(dict):
+            results returned by run
+        baseline(dict):
+            earlier results
+        threshold(float):
+            allowed relative increase
+    returns:
+        list:
+            description of every regression
+    """
+    regressions = []
+    for name, by_size in results.items():
+        for N, new in by_size.items():
+            old = baseline.get(name, {}).get(N)
+            if old is None:
+                continue
+            if old['seconds'] > 1e-3 and new['seconds'] > old['seconds']*(1 + threshold):
+                regressions.append(f"{name} N={N}: {old['seconds']:.4f} s -> {new['seconds']:.4f} s")
+            if new['peak_bytes'] > old['peak_bytes']*(1 + threshold) + 2**16:
+                regressions.append(f"{name} N={N}: {old['peak_bytes']} B -> {new['peak_bytes']} B")
+    return regressions
+
+
+def main(argv: list = None)->int:
+    """
+    Command line entry point.
+    Arguments:
+        argv(list):
+            command line arguments, sys.argv[1:] if None
+    returns:
+        int:
+            exit status, 1 if a regression was found
+    """
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--cases', nargs='*', choices=sorted(CASES), help='cases to run, all by default')
+    parser.add_argument('--sizes', nargs='*', type=int, default=SIZES, help='numbers of points')
+    parser.add_argument('--repeat', type=int, default=3, help='timed runs per size')
+    parser.add_argument('--save', help='write the results to this JSON file')
+    parser.add_argument('--compare', help='JSON baseline to compare against')
+    parser.add_argument('--threshold', type=float, default=0.25, help='allowed relative slowdown')
+    args = parser.parse_args(argv)
+    # No window is opened by the plotting cases
+    matplotlib.use('Agg')
+
+    results = run(args.cases, args.sizes, args.repeat)
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(results, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(results, json.load(f), args.threshold)
+        for line in regressions:
+            print('REGRESSION', line)
+        return int(bool(regressions))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
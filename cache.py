@@ -0,0 +1,120 @@
+import os
+import hashlib
+from collections import OrderedDict
+import numpy as np
+
+
+class TrajectoryCache:
+    def __init__(self, max_bytes: int = 2**28, directory: str = None, max_disk_bytes: int = 2**32)->None:
+        """
+        Constructor for TrajectoryCache, a bounded least-recently-used cache of arrays with an
+        optional on-disk .npz tier.
+        Arguments:
+            max_bytes(int):
+                largest total size of the arrays kept in memory
+            directory(str):
+                folder for the .npz files, no disk tier if None
+            max_disk_bytes(int):
+                largest total size of the .npz files, the least recently used are deleted first
+        """
+        self.max_bytes = max_bytes
+        self.directory = directory
+        self.max_disk_bytes = max_disk_bytes
+        self._entries = OrderedDict()
+        self.nbytes = 0
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key: tuple)->str:
+        """
+        Finding the .npz file of a key.
+        Arguments:
+            key(tuple):
+                cache key
+        returns:
+            str:
+                path of the file
+        """
+        name = hashlib.sha1(repr(key).encode()).hexdigest()
+        return os.path.join(self.directory, name + '.npz')
+
+    def get(self, key: tuple):
+        """
+        Looking up a key in memory first and then on disk.
+        Arguments:
+            key(tuple):
+                cache key
+        returns:
+            tuple:
+                the stored arrays, or None if the key is not cached
+        """
+        if key in self._entries:
+            self._entries.move_to_end(key)
+            return self._entries[key]
+
+        if self.directory is not None and os.path.exists(self._path(key)):
+            path = self._path(key)
+            with np.load(path) as data:
+                arrays = tuple(data[f'arr_{i}'] for i in range(len(data.files)))
+            for a in arrays:
+                a.flags.writeable = False
+            os.utime(path)
+            self._store(key, arrays)
+            return arrays
+        return None
+
+    def put(self, key: tuple, arrays: tuple)->None:
+        """
+        Storing arrays under a key, in memory and, if there is one, on disk.
+        Arguments:
+            key(tuple):
+                cache key
+            arrays(tuple):
+                arrays to store, they are made read-only
+        """
+        for a in arrays:
+            a.flags.writeable = False
+        self._store(key, tuple(arrays))
+        if self.directory is not None:
+            np.savez(self._path(key), *arrays)
+            self._evict_disk()
+
+    def _store(self, key: tuple, arrays: tuple)->None:
+        """
+        Putting arrays in the memory tier and evicting the least recently used entries.
+        Arguments:
+            key(tuple):
+                cache key
+            arrays(tuple):
+                arrays to store
+        """
+        size = sum(a.nbytes for a in arrays)
+        if size > self.max_bytes:
+            return
+        if key in self._entries:
+            self.nbytes -= sum(a.nbytes for a in self._entries.pop(key))
+        self._entries[key] = arrays
+        self.nbytes += size
+        while self.nbytes > self.max_bytes:
+            _, old = self._entries.popitem(last=False)
+            self.nbytes -= sum(a.nbytes for a in old)
+
+    def _evict_disk(self)->None:
+        """
+        Deleting the least recently used .npz files until the disk tier fits in max_disk_bytes.
+        """
+        files = [os.path.join(self.directory, f) for f in os.listdir(self.directory) if f.endswith('.npz')]
+        files.sort(key=os.path.getmtime)
+        total = sum(os.path.getsize(f) for f in files)
+        for f in files:
+            if total <= self.max_disk_bytes:
+                break
+            total -= os.path.getsize(f)
+            os.remove(f)
+
+    def clear(self)->None:
+        """
+        Emptying the memory tier. Files on disk are kept.
+        """
+        self._entries.clear()
+        self.nbytes = 0
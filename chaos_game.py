@@ -1,8 +1,278 @@
+import os
+import hashlib
+from functools import lru_cache
 import numpy as np
 import matplotlib.pyplot as plt
+from matplotlib import colormaps
+from raster import DensityRaster
+from parallel import _integers, _random, split_work, seed_streams, run_tasks
+from cache import TrajectoryCache
+from kernels import use_numba, corner_walk
+from instrument import phase
+from store import PointStore
+from trajectory import Trajectory
+from adaptive import render_adaptive
+from animate import open_writer, write_animation
+from rules import VertexRule
+
+# Longest block handled by one cumulative sum in _affine_scan.
+_SCAN_BLOCK = 4096
+# ln(1e278): keeps the rescaled partial sums in _affine_scan finite in float64.
+_LOG_RANGE = 640.0
+# Number of steps evaluated per call to _affine_scan in ChaosGame.iterate.
+_ITERATE_BLOCK = 2**20
+# Modules deciding the points of a seeded iteration, see _code_version.
+_SOURCES = ('chaos_game.py', 'rules.py', 'parallel.py', 'kernels.py', 'trajectory.py')
+
+
+@lru_cache(maxsize=None)
+def _code_version()->str:
+    """
+    Hash of the source of the modules in _SOURCES, part of the keys of ChaosGame.cache so that
+    a disk cache written by another version of the code is not used.
+    returns:
+        str:
+            hex digest
+    """
+    digest = hashlib.sha1()
+    folder = os.path.dirname(os.path.abspath(__file__))
+    for name in _SOURCES:
+        with open(os.path.join(folder, name), 'rb') as f:
+            digest.update(f.read())
+    return digest.hexdigest()
+
+
+def _affine_scan(start: np.ndarray, ratio, offsets: np.ndarray)->np.ndarray:
+    """
+    Evaluating the linear recurrence y[k] = ratio[k]*y[k-1] + offsets[k], with y[-1] = start,
+    without a Python loop over k.
+    The steps are cut into blocks of fixed length. Inside a block the recurrence is solved as a
+    scaled cumulative sum, y[k] = P[k]*(y[-1] + cumsum(offsets/P)[k]) where P is the running product
+    of the ratios, and only the last point of every block is carried into the next one.
+    Arguments:
+        start(np.ndarray):
+            point before the first step, shape offsets.shape[1:]
+        ratio(float or np.ndarray):
+            contraction ratio, either one float or one value per step with shape offsets.shape[:-1]
+        offsets(np.ndarray):
+            additive term for every step, shape (steps, ..., dim)
+    returns:
+        np.ndarray:
+            y for every step, same shape as offsets
+    """
+    offsets = np.asarray(offsets, dtype=float)
+    steps = len(offsets)
+    tail = offsets.shape[1:]
+    out = np.empty((steps,) + tail)
+    if steps == 0:
+        return out
+
+    ratio = np.asarray(ratio, dtype=float)
+    block = int(min(_SCAN_BLOCK, steps, max(1, _LOG_RANGE // -np.log(ratio.min()))))
+    rows = steps // block
+    full = rows*block
+
+    if ratio.ndim == 0:
+        scale = ratio ** np.arange(1, block + 1)
+        scale = scale.reshape((1, block) + (1,)*len(tail))
+        if np.prod(tail) < 16:
+            # Short trailing axes are spelled out so numpy can run one long inner loop
+            scale = np.broadcast_to(scale, (1, block) + tail).copy()
+    else:
+        ratio = np.broadcast_to(ratio, (steps,) + tail[:-1])
+        scale = np.cumprod(ratio[:full].reshape((rows, block) + tail[:-1]), axis=1)[..., None]
+
+    # Unscaled partial sums, cumsum(offsets/P), computed in place
+    head = out[:full].reshape((rows, block) + tail)
+    np.multiply(offsets[:full].reshape(head.shape), 1/scale, out=head)
+    np.cumsum(head, axis=1, out=head)
+
+    # Carrying the last point of every block into the next one
+    last_scale = np.broadcast_to(scale[:, -1], (rows,) + scale.shape[2:])
+    last_sum = head[:, -1].copy()
+    point = np.asarray(start, dtype=float)
+    for b in range(rows):
+        head[b] += point
+        point = last_scale[b]*(point + last_sum[b])
+    head *= scale
+
+    if full < steps:
+        rest = ratio if ratio.ndim == 0 else ratio[full:]
+        out[full:] = _affine_scan(point, rest, offsets[full:])
+    return out
+
+
+def _colors(Indicies: np.ndarray, previous: np.ndarray = None, palette: np.ndarray = None)->np.ndarray:
+    """
+    Evaluating the color recurrence C[i] = (C[i-1] + v[i])/2 for a block of indices, where v[i]
+    is the corner index itself (gradient) or the palette color of the corner (RGB).
+    The recurrence is an exponential filter, so it is evaluated with _affine_scan.
+    Arguments:
+        Indicies(np.ndarray):
+            corner indices of the block, shape (steps,) or (steps, walkers)
+        previous(np.ndarray):
+            color of the point before the block, the color of Indicies[0] for the first block
+        palette(np.ndarray):
+            RGB color of every corner with shape (n, 3), or None for the scalar gradient
+    returns:
+        np.ndarray:
+            color values of the block, with one more axis of length 3 for RGB
+    """
+    values = Indicies[..., None] if palette is None else np.take(palette, Indicies, axis=0)
+    if previous is None:
+        previous = values[0]
+    elif palette is None:
+        previous = np.asarray(previous, dtype=float)[..., None]
+    C = _affine_scan(previous, 1/2, values/2)
+    return C[..., 0] if palette is None else C
+
+
+@lru_cache(maxsize=None)
+def _ngon_corners(n: int)->np.ndarray:
+    """
+    Computing the corners of the regular n-gon once per n.
+    Arguments:
+        n(int):
+            number of corners
+    returns:
+        np.ndarray:
+            read-only corner points, the first corner repeated at the end
+    """
+    theta = np.linspace(0, 2*np.pi, n + 1)
+    Corners = np.column_stack((np.sin(theta), np.cos(theta)))
+    Corners.flags.writeable = False
+    return Corners
+
+
+class AliasTable:
+    def __init__(self, probabilities: np.ndarray)->None:
+        """
+        Constructor for AliasTable, Vose's alias method for sampling from a discrete
+        distribution. The table is built once in O(k) and every sample then costs O(1),
+        whatever the number of outcomes k.
+        Arguments:
+            probabilities(np.ndarray):
+                nonnegative weight of every outcome, normalized here
+        """
+        p = np.asarray(probabilities, dtype=float)
+        if p.ndim != 1 or len(p) == 0 or np.any(p < 0) or p.sum() <= 0:
+            raise ValueError()
+        k = len(p)
+        scaled = p * k / p.sum()
+        self.probabilities = p / p.sum()
+        self.prob = np.ones(k)
+        self.alias = np.arange(k)
+
+        small = [i for i in range(k) if scaled[i] < 1]
+        large = [i for i in range(k) if scaled[i] >= 1]
+        while small and large:
+            s = small.pop()
+            l = large.pop()
+            self.prob[s] = scaled[s]
+            self.alias[s] = l
+            scaled[l] -= 1 - scaled[s]
+            (small if scaled[l] < 1 else large).append(l)
+
+    def sample(self, rng, size)->np.ndarray:
+        """
+        Drawing outcomes with one uniform number each: its integer part picks a column and
+        its fractional part decides between the column and its alias.
+        Arguments:
+            rng(np.random.Generator):
+                random generator, the global np.random state if None
+            size(int or tuple):
+                shape of the output
+        returns:
+            np.ndarray:
+                sampled outcomes
+        """
+        u = _random(rng, size) * len(self.prob)
+        column = u.astype(np.intp)
+        return np.where(u - column < self.prob[column], column, self.alias[column])
+
+
+def sample_polygon(corners: np.ndarray, size: int = None, rng: np.random.Generator = None)->np.ndarray:
+    """
+    Drawing points uniformly over a convex polygon. The polygon is cut into a fan of triangles
+    from its first corner, a triangle is picked for every point with probability proportional
+    to its area, and the point is uniform in that triangle: a + u*(b - a) + v*(c - a) with
+    (u, v) uniform in the unit square, folded to (1 - u, 1 - v) when u + v > 1. All points
+    are drawn with a few array operations. The corners are sorted by angle around their mean
+    first, so they can be given in any order. Corners on one line, which have no area, get
+    uniform (Dirichlet) weights instead.
+    Arguments:
+        corners(np.ndarray):
+            corners of the polygon, shape (n, 2), the first corner may be repeated at the end
+        size(int):
+            number of points, one point if None
+        rng(np.random.Generator):
+            random generator, the global np.random state if None
+    returns:
+        np.ndarray:
+            point with shape (2,), or points with shape (size, 2)
+    """
+    corners = np.asarray(corners, dtype=float)
+    if len(corners) > 1 and np.array_equal(corners[0], corners[-1]):
+        corners = corners[:-1]
+    d = corners - corners.mean(axis=0)
+    corners = corners[np.argsort(np.arctan2(d[:, 1], d[:, 0]))]
+    M = 1 if size is None else size
+
+    a, b, c = corners[0], corners[1:-1] - corners[0], corners[2:] - corners[0]
+    area = np.abs(b[:, 0]*c[:, 1] - b[:, 1]*c[:, 0])
+    if area.sum() > 0:
+        tri = AliasTable(area).sample(rng, M) if len(area) > 1 else np.zeros(M, dtype=int)
+        uv = _random(rng, (M, 2))
+        fold = uv.sum(axis=1) > 1
+        uv[fold] = 1 - uv[fold]
+        points = a + uv[:, :1]*np.take(b, tri, axis=0) + uv[:, 1:]*np.take(c, tri, axis=0)
+    else:
+        weights = -np.log1p(-_random(rng, (M, len(corners))))
+        points = (weights / weights.sum(axis=1, keepdims=True)) @ corners
+    return points[0] if size is None else points
+
+
+def _chaos_task(definition: dict, steps: int, discard: int, seed: np.random.SeedSequence,
+                raster: DensityRaster, color: bool)->tuple:
+    """
+    Running one task of ChaosGame.iterate_parallel in a worker process, on a new game so
+    that the points of earlier runs are neither sent to the worker nor overwritten.
+    Arguments:
+        definition(dict):
+            arguments of the game, see ChaosGame._definition
+        steps(int):
+            number of iterations, including the discarded ones
+        discard(int):
+            number of first values we want to ignore
+        seed(np.random.SeedSequence):
+            seed of the task
+        raster(DensityRaster):
+            raster giving the extent and shape to bin the points into, or None to return
+            the points
+        color(bool):
+            accumulate the gradient color in the raster or not
+    returns:
+        Trajectory or DensityRaster:
+            points and corner indices, or the filled raster
+    """
+    game = ChaosGame(**definition)
+    rng = np.random.default_rng(seed)
+    if raster is None:
+        return game.iterate(steps, discard, rng=rng)
+
+    part = DensityRaster(raster.extent, raster.width, raster.height, raster.channels)
+    for chunk in game.iter_chunks(steps, _ITERATE_BLOCK, discard, rng=rng,
+                                  color='gradient' if color == True else None):
+        part.add(chunk[0], chunk[2] if color == True else None)
+    return part
+
 
 class ChaosGame:
-    def __init__(self, n: int, r: float = 1/2)->None:
+    # Shared cache of seeded iterations, replace it to change the size or add a disk tier
+    cache = TrajectoryCache()
+
+    def __init__(self, n: int, r: float = 1/2, seed: int = None, weights: np.ndarray = None,
+                 ratios: np.ndarray = None, corners: np.ndarray = None, rule: VertexRule = None)->None:
         """
         Constructor for ChaosGame
         Arguments:
@@ -10,90 +280,600 @@ class ChaosGame:
                 number of corners for the n-gon.
             r(float):
                 ratio between two points.  
+            seed(int):
+                seed used by iterate, plot, show and savepng. With a seed the iterations are
+                reproducible and kept in ChaosGame.cache, without one they use np.random.
+            weights(np.ndarray):
+                probability of picking each corner, uniform if None. Corners are then drawn
+                from an AliasTable.
+            ratios(np.ndarray):
+                ratio used when moving towards each corner, r for all corners if None
+            corners(np.ndarray):
+                n arbitrary corner points with shape (n, 2), the regular n-gon if None
+            rule(VertexRule):
+                corner choice depending on the last picks, such as VertexRule.no_repeat(n),
+                independent picks if None. The rule holds its own weights, so it can not be
+                given together with weights.
         """
         if isinstance(n, int) == False or isinstance(r, float) == False:
             raise TypeError()
+        if seed is not None and isinstance(seed, int) == False:
+            raise TypeError()
         
         if n >= 3 and r > 0 and r < 1:
             self.n = n
             self.r = r
+            self.seed = seed
 
         else:
             raise ValueError()
 
+        self.weights = None if weights is None else np.asarray(weights, dtype=float)
+        self.ratios = None if ratios is None else np.asarray(ratios, dtype=float)
+        self.corners = None if corners is None else np.asarray(corners, dtype=float)
+        if self.weights is not None and self.weights.shape != (n,):
+            raise ValueError()
+        if self.ratios is not None and (self.ratios.shape != (n,) or np.any(self.ratios <= 0)
+                                        or np.any(self.ratios >= 1)):
+            raise ValueError()
+        if self.corners is not None and self.corners.shape != (n, 2):
+            raise ValueError()
+        if rule is not None and (rule.n != n or self.weights is not None):
+            raise ValueError()
+        self.rule = rule
+        self._alias = None if self.weights is None else AliasTable(self.weights)
+
         self._generate_ngon()
 
     def _generate_ngon(self) -> np.ndarray:
         """
-        Generating corners of the n-gon.
+        Generating corners of the n-gon. The corners are computed once per n and shared.
+        With custom corners these are returned instead, in the same closed form.
         returns:
             np.ndarray:
                 corner points
         """
-        theta = np.linspace(0, 2*np.pi, self.n + 1)
-        Corners = []
+        if self.corners is not None:
+            return np.vstack((self.corners, self.corners[:1]))
+        return _ngon_corners(self.n)
 
-        for i in theta:
-            Corners.append((np.sin(i), np.cos(i)))
+    def _definition(self)->dict:
+        """
+        Arguments of the constructor giving the same game, without the points of any run.
+        returns:
+            dict:
+                n, r, seed, weights, ratios, corners and rule
+        """
+        return {'n': self.n, 'r': self.r, 'seed': self.seed, 'weights': self.weights,
+                'ratios': self.ratios, 'corners': self.corners, 'rule': self.rule}
 
-        return np.array(Corners)
+    def _pick_corners(self, rng, size, state: np.ndarray = None, fast: bool = False)->np.ndarray:
+        """
+        Drawing corner indices, uniformly, from the alias table of the weights or from the
+        rule, see VertexRule.sample.
+        Arguments:
+            rng(np.random.Generator):
+                random generator, the global np.random state if None
+            size(tuple):
+                shape of the output
+            state(np.ndarray):
+                state of the rule for every walker, updated in place
+            fast(bool):
+                use the compiled kernel of the rule
+        returns:
+            np.ndarray:
+                corner indices
+        """
+        if self.rule is not None:
+            return self.rule.sample(state, _random(rng, size), fast)
+        if self._alias is None:
+            return _integers(rng, self.n, size)
+        return self._alias.sample(rng, size)
+
+    def _step_ratio(self, Indicies: np.ndarray):
+        """
+        Ratio of every step, r or the ratio of the picked corner.
+        Arguments:
+            Indicies(np.ndarray):
+                picked corners
+        returns:
+            float or np.ndarray:
+                ratio of every step
+        """
+        return self.r if self.ratios is None else np.take(self.ratios, Indicies)
 
-    def _starting_point(self)->np.ndarray:
+    def _starting_point(self, walkers: int = None, rng: np.random.Generator = None)->np.ndarray:
         """
-        Picking a random starting point within the n-gon.
+        Picking random starting points uniformly within the n-gon, see sample_polygon.
+        Arguments:
+            walkers(int):
+                number of starting points to pick, one point if None
+            rng(np.random.Generator):
+                random generator, the global np.random state if None
         returns:
             np.ndarray:
-                Starting point x0
+                Starting point x0, or an array of shape (walkers, 2)
 
         """
-        corners = self._generate_ngon()
-        weights = np.random.random(self.n)
-        weights = weights/sum(weights)
-        
-        x0 = 0
-        for i in range(self.n):
-            x0 += corners[i] * weights[i]      
-        return x0
+        return sample_polygon(self._generate_ngon()[:self.n], walkers, rng)
 
-    def iterate(self, steps: int = 30000, discard: int = 5)->np.ndarray:
+    def _walk(self, point: np.ndarray, Indicies: np.ndarray, table: np.ndarray, fast: bool)->np.ndarray:
+        """
+        Evaluating the points of a block of steps from the picked corners.
+        Arguments:
+            point(np.ndarray):
+                point before the block, shape (2,) or (walkers, 2)
+            Indicies(np.ndarray):
+                picked corners, shape (steps,) or (steps, walkers)
+            table(np.ndarray):
+                (1 - ratio)*corner for every corner, shape (n, 2)
+            fast(bool):
+                use kernels.corner_walk instead of _affine_scan
+        returns:
+            np.ndarray:
+                points with shape Indicies.shape + (2,)
+        """
+        if not fast:
+            return _affine_scan(point, self._step_ratio(Indicies), np.take(table, Indicies, axis=0))
+        ratios = np.full(self.n, self.r) if self.ratios is None else self.ratios
+        steps = Indicies.reshape(len(Indicies), -1)
+        out = np.empty(steps.shape + (2,))
+        corner_walk(np.reshape(point, (-1, 2)), steps, ratios, table, out)
+        return out.reshape(Indicies.shape + (2,))
+
+    def iter_chunks(self, total_steps: int = 30000, chunk_size: int = 2**16, discard: int = 5,
+                    walkers: int = 1, rng: np.random.Generator = None, color: str = None,
+                    palette: np.ndarray = None, backend: str = 'numpy'):
+        """
+        Generating the same points as iterate, but yielding them in blocks of chunk_size steps
+        instead of storing them. The last point of every block is carried into the next one,
+        so memory use does not grow with total_steps.
+        Arguments:
+            total_steps(int):
+                number of iterations
+            chunk_size(int):
+                number of steps in every yielded block, the last block can be shorter
+            discard(int):
+                number of first values we want to ignore
+            walkers(int):
+                number of independent points iterated together
+            rng(np.random.Generator):
+                random generator, the global np.random state if None
+            color(str):
+                None for no colors, 'gradient' for the gradient_color values or 'rgb' for
+                the palette_color values. The color of the last point is carried between blocks.
+            palette(np.ndarray):
+                RGB color of every corner for 'rgb', shape (n, 3), see _palette
+            backend(str):
+                'numpy' for _affine_scan or 'numba' for the compiled kernels.corner_walk,
+                which falls back to 'numpy' when numba is not installed
+        yields:
+            tuple:
+                points with shape (steps*walkers, 2) and the corner indices, shape (steps,)
+                for one walker or (steps, walkers) for several, followed by the colors of the
+                points when color is given
+        """
+        if isinstance(walkers, int) == False or isinstance(chunk_size, int) == False:
+            raise TypeError()
+        if walkers < 1 or chunk_size < 1 or color not in (None, 'gradient', 'rgb'):
+            raise ValueError()
+        if color == 'rgb' and palette is None:
+            palette = self._palette()
+        palette = palette if color == 'rgb' else None
+        fast = use_numba(backend)
+        C = None
+
+        corner = self._generate_ngon()[:self.n]
+        table = (1 - (self.r if self.ratios is None else self.ratios[:, None])) * corner
+        shape = () if walkers == 1 else (walkers,)
+        point = self._starting_point(None if walkers == 1 else walkers, rng)
+        state = None if self.rule is None else self.rule.initial(rng, walkers)
+
+        # The first block holds the starting point and the steps that are discarded
+        first = min(total_steps, discard + chunk_size)
+        if first < 1:
+            return
+        Indicies = np.zeros((first,) + shape, dtype=int)
+        Indicies[1:] = self._pick_corners(rng, (first-1,) + shape, state, fast)
+        points = np.empty((first,) + shape + (2,))
+        points[0] = point
+        points[1:] = self._walk(point, Indicies[1:], table, fast)
+        done = first
+        if first > discard:
+            Indicies_kept = Indicies[discard:]
+            if color is None:
+                yield points[discard:].reshape(-1, 2), Indicies_kept
+            else:
+                C = _colors(Indicies_kept, None, palette)
+                yield points[discard:].reshape(-1, 2), Indicies_kept, C.reshape(-1, *C.shape[1 + len(shape):])
+
+        while done < total_steps:
+            size = min(chunk_size, total_steps - done)
+            point = points[-1]
+            Indicies = self._pick_corners(rng, (size,) + shape, state, fast)
+            points = self._walk(point, Indicies, table, fast)
+            done += size
+            if color is None:
+                yield points.reshape(-1, 2), Indicies
+            else:
+                C = _colors(Indicies, None if C is None else C[-1], palette)
+                yield points.reshape(-1, 2), Indicies, C.reshape(-1, *C.shape[1 + len(shape):])
+
+    def _cache_key(self, steps: int, discard: int, walkers: int, seed: int,
+                   dtype: type = np.float64)->tuple:
+        """
+        Key of an iteration in ChaosGame.cache.
+        Arguments:
+            steps(int):
+                number of iterations
+            discard(int):
+                number of first values we want to ignore
+            walkers(int):
+                number of independent points iterated together
+            seed(int):
+                seed of the iteration
+            dtype(type):
+                type of the stored points
+        returns:
+            tuple:
+                hashable key
+        """
+        rule = None if self.rule is None else self.rule.matrix
+        extra = tuple(None if a is None else a.tobytes() for a in (self.weights, self.ratios, self.corners, rule))
+        return (_code_version(), self.n, self.r, steps, discard, walkers, seed, np.dtype(dtype).str) + extra
+
+    def iterate(self, steps: int = 30000, discard: int = 5, walkers: int = 1,
+                rng: np.random.Generator = None, seed: int = None, color: str = None,
+                palette: np.ndarray = None, backend: str = 'numpy', store: str = None,
+                dtype: type = np.float64)->Trajectory:
         """
         Generating points from randomly picked corner, storing generated points and the indicies.
+        The corner indices are drawn in bulk and the points are evaluated block by block
+        with _affine_scan (see iter_chunks), so the result is the same as stepping
+        x_{k+1} = r*x_k + (1-r)*c_j one point at a time.
+        With walkers > 1 an ensemble of independent points is advanced together as a
+        (walkers, 2) array, and discard is applied to every walker. The points are then flattened
+        step by step into X, while Indicies has shape (steps - discard, walkers) so that
+        column m holds the corners picked by walker m.
         Arguments:
             steps(int): 
                 number of iterations
             discard(int):
                 number of first values we want to ignore
+            walkers(int):
+                number of independent points iterated together
+            rng(np.random.Generator):
+                random generator, the global np.random state if None
+            seed(int):
+                seed for a new generator when rng is None, self.seed if None. Seeded
+                iterations are looked up in and stored in ChaosGame.cache, and the returned
+                arrays are then read-only.
+            color(str):
+                None, 'gradient' or 'rgb', see iter_chunks. The colors of the points are
+                computed in the same pass and stored in colors.
+            palette(np.ndarray):
+                RGB color of every corner for 'rgb', shape (n, 3)
+            backend(str):
+                'numpy' or 'numba', see iter_chunks
+            store(str):
+                if given, the points, indices and colors are written block by block into
+                memory-mapped .npy files in this directory (see PointStore), and X, Indicies
+                and colors are those memory maps. Such runs are not cached.
+            dtype(type):
+                np.float32 or np.float64, type of the stored points and colors. Ignored
+                with a store, which keeps float64.
+        returns:
+            Trajectory:
+                generated points, the corner index used for each point and the colors, also
+                stored in trajectory. X, Indicies and colors are views of it, and it unpacks
+                as X, Indicies.
         """
-        corner = self._generate_ngon()
-        x0 = self._starting_point()
-        x_list = [x0]
-        Indicies = [0]
-        for i in range(steps-1):
-            j = np.random.randint(low=0, high=self.n)
-            x_list.append(self.r * x_list[i] + (1-self.r) * corner[j])
-            Indicies.append(j)
-
-        # Discarding starting points
-        Indicies = Indicies[discard:]
-        x_list = x_list[discard:]
-        self.Indicies = np.array(Indicies)
-        self.X = np.array(x_list)
+        key = None
+        if rng is None:
+            seed = self.seed if seed is None else seed
+        if rng is None and seed is not None and store is not None:
+            rng = np.random.default_rng(seed)
+        if rng is None and seed is not None:
+            key = self._cache_key(steps, discard, walkers, seed, dtype)
+            cached = self.cache.get(key)
+            if cached is not None:
+                colors = None
+                self.trajectory = Trajectory(*cached)
+                self.X, self.Indicies = self.trajectory
+                if color is not None and len(self.Indicies):
+                    colors = self._flat_colors(color, palette).astype(dtype, copy=False)
+                self.trajectory.colors = self.colors = colors
+                return self.trajectory
+            rng = np.random.default_rng(seed)
+
+        kept = max(steps - discard, 0)
+        shape = (kept,) if walkers == 1 else (kept, walkers)
+        if store is not None:
+            self.store = PointStore.create(store, kept*walkers, shape, self.n, color)
+            self.trajectory = Trajectory(self.store.X.T, self.store.Indicies, self.store.colors)
+        else:
+            self.trajectory = Trajectory.empty(kept, walkers, self.n, color, dtype)
+        self.X, self.Indicies = self.trajectory
+        self.colors = self.trajectory.colors
+
+        done = 0
+        chunk_size = max(1, _ITERATE_BLOCK // walkers)
+        with phase('chaos_game.iterate', kept*walkers):
+            for chunk in self.iter_chunks(steps, chunk_size, discard, walkers, rng, color, palette, backend):
+                points, Indicies = chunk[:2]
+                rows = slice(done*walkers, (done + len(Indicies))*walkers)
+                self.trajectory.data[:, rows] = points.T
+                self.Indicies[done:done + len(Indicies)] = Indicies
+                if color is not None:
+                    self.colors[rows] = chunk[2]
+                done += len(Indicies)
+
+        if store is not None:
+            self.store.flush()
+        if key is not None:
+            self.cache.put(key, (self.trajectory.data, self.Indicies))
+        return self.trajectory
+
+    def _level_maps(self, k: int)->tuple:
+        """
+        Composing the corner maps f_j(x) = r_j*x + (1 - r_j)*c_j along every address of length k.
+        The map of the address w = d1 d2 ... dk is f_d1(f_d2(...f_dk(x))), and w has the code
+        d1*n**(k-1) + ... + dk, which is also its position in the returned arrays.
+        Arguments:
+            k(int):
+                length of the addresses
+        returns:
+            tuple:
+                scale and offset of f_w(x) = scale*x + offset, and color_scale and color_offset
+                of the gradient color C(f_w(x)) = color_scale*C(x) + color_offset, one per address
+        """
+        ratios = np.full(self.n, self.r) if self.ratios is None else self.ratios
+        corners = self._generate_ngon()[:self.n]
+        table = (1 - ratios[:, None]) * corners
+        scale = np.ones(1)
+        offset = np.zeros((1, 2))
+        color_scale = np.ones(1)
+        color_offset = np.zeros(1)
+        for _ in range(k):
+            # Appending the digit j as the innermost map: f_w(f_j(x)), code w*n + j
+            offset = (scale[:, None, None]*table + offset[:, None]).reshape(-1, 2)
+            color_offset = (color_offset[:, None] + color_scale[:, None]*np.arange(self.n)/2).reshape(-1)
+            scale = (scale[:, None]*ratios).reshape(-1)
+            color_scale = np.repeat(color_scale/2, self.n)
+        return scale, offset, color_scale, color_offset
+
+    def iter_level(self, k: int, chunk_size: int = 2**20, raster: DensityRaster = None,
+                   color: bool = False):
+        """
+        Enumerating the level-k approximation of the attractor without randomness: the n**k points
+        f_w(c_0) for every address w of length k, where c_0 is the first corner, a point of the
+        attractor. The last m digits are enumerated once by broadcasting, with n**m at most
+        chunk_size, and the first k - m digits are walked depth first, so memory stays at one
+        chunk plus O(k) whatever k is.
+        Arguments:
+            k(int):
+                length of the addresses
+            chunk_size(int):
+                largest number of points held at a time
+            raster(DensityRaster):
+                if given, only the first point landing in every pixel of the raster is kept,
+                and points outside of it are dropped
+            color(bool):
+                also yield the gradient color of the points
+        yields:
+            tuple:
+                points with shape (N, 2) and their address codes, see addresses, followed by
+                their gradient colors if color is True. Games with a rule are not supported,
+                since only some addresses can occur.
+        """
+        if isinstance(k, int) == False:
+            raise TypeError()
+        if k < 0 or self.n ** k >= 2**63 or self.rule is not None:
+            raise ValueError()
+        # Largest m with n**m <= chunk_size, in integers so exact powers are not rounded down
+        m = 0
+        while m < k and self.n**(m + 1) <= chunk_size:
+            m += 1
+        m = min(k, max(1, m))
+        scale, offset, _, inner_colors = self._level_maps(m)
+        inner = scale[:, None]*self._generate_ngon()[0] + offset
+        inner_codes = np.arange(len(inner), dtype=np.int64)
+        seen = None if raster is None else np.zeros(raster.width*raster.height, dtype=bool)
+
+        ratios = np.full(self.n, self.r) if self.ratios is None else self.ratios
+        table = (1 - ratios[:, None]) * self._generate_ngon()[:self.n]
+        # The outer digits are counted like an odometer, stack[i] holding the scale, offset,
+        # color_scale and color_offset of the first i digits, so only O(k) maps are kept
+        digits = [0]*(k - m)
+        stack = [(1.0, np.zeros(2), 1.0, 0.0)]
+        prefix = 0
+        while True:
+            while len(stack) <= len(digits):
+                s, o, cs, co = stack[-1]
+                j = digits[len(stack) - 1]
+                stack.append((s*ratios[j], s*table[j] + o, cs/2, co + cs*j/2))
+            s, o, cs, co = stack[-1]
+
+            points = s*inner + o
+            codes = prefix*len(inner) + inner_codes
+            colors = cs*inner_colors + co
+            if seen is not None:
+                flat, inside = raster._pixels(points)
+                pixels, first = np.unique(flat, return_index=True)
+                new = ~seen[pixels]
+                seen[pixels[new]] = True
+                keep = np.flatnonzero(inside)[first[new]]
+                points, codes, colors = points[keep], codes[keep], colors[keep]
+            if color:
+                yield points, codes, colors
+            else:
+                yield points, codes
+
+            prefix += 1
+            i = len(digits) - 1
+            while i >= 0 and digits[i] == self.n - 1:
+                digits[i] = 0
+                i -= 1
+            if i < 0:
+                return
+            digits[i] += 1
+            del stack[i + 1:]
+
+    def level(self, k: int, raster: DensityRaster = None)->tuple:
+        """
+        The level-k approximation of the attractor in one array, see iter_level.
+        Arguments:
+            k(int):
+                length of the addresses
+            raster(DensityRaster):
+                if given, only one point per pixel of the raster is kept
+        returns:
+            tuple:
+                points with shape (N, 2) and their address codes
+        """
+        chunks = list(self.iter_level(k, raster=raster))
+        return np.concatenate([c[0] for c in chunks]), np.concatenate([c[1] for c in chunks])
+
+    def addresses(self, codes: np.ndarray, k: int)->np.ndarray:
+        """
+        Turning address codes of iter_level into their digits, the corner indices d1 ... dk of
+        the maps f_d1(f_d2(...f_dk(c_0))), d1 being the last corner picked.
+        Arguments:
+            codes(np.ndarray):
+                address codes
+            k(int):
+                length of the addresses
+        returns:
+            np.ndarray:
+                digits with shape (N, k)
+        """
+        powers = self.n ** np.arange(k - 1, -1, -1, dtype=np.int64)
+        return (np.asarray(codes, dtype=np.int64)[:, None] // powers) % self.n
+
+    def render_level(self, k: int, width: int = 1000, color: bool = False, dedup: bool = False,
+                     chunk_size: int = 2**20)->DensityRaster:
+        """
+        Binning the level-k approximation of the attractor into a DensityRaster covering the n-gon.
+        With equal corner weights the counts are the exact level-k density, with no sampling noise.
+        Arguments:
+            k(int):
+                length of the addresses
+            width(int):
+                number of pixel columns
+            color(bool):
+                accumulate the gradient color of the points or not
+            dedup(bool):
+                keep one point per pixel, giving the shape of the attractor only
+            chunk_size(int):
+                largest number of points held at a time
+        returns:
+            DensityRaster:
+                raster holding the point counts
+        """
+        raster = DensityRaster.fit(self._generate_ngon(), width, channels=int(color))
+        with phase('chaos_game.level', self.n ** k):
+            for chunk in self.iter_level(k, chunk_size, raster if dedup else None, color):
+                raster.add(chunk[0], chunk[2] if color else None)
+        return raster
+
+    def iterate_parallel(self, steps: int = 30000, discard: int = 5, seed: int = None,
+                         workers: int = None, tasks: int = 32, raster: DensityRaster = None,
+                         color: bool = False):
+        """
+        Generating points on several processes. The steps are split into a fixed number of
+        tasks, each running its own trajectory (with its own discard) from an independent
+        np.random.Generator spawned from one SeedSequence. Since the split only depends on
+        steps and tasks, a given seed gives the same output whatever the number of workers.
+        Arguments:
+            steps(int):
+                total number of iterations
+            discard(int):
+                number of first values ignored in every task
+            seed(int):
+                root seed, fresh entropy if None
+            workers(int):
+                number of processes, all cores if None
+            tasks(int):
+                number of independent trajectories
+            raster(DensityRaster):
+                if given, every task bins its points into a raster of the same shape and
+                these are summed into it, instead of returning the points
+            color(bool):
+                accumulate the gradient color in the raster or not
+        returns:
+            Trajectory or DensityRaster:
+                generated points and corner indices, stored in trajectory, or the raster
+        """
+        seeds = seed_streams(seed, tasks)
+        sizes = split_work(steps, tasks)
+        definition = self._definition()
+        results = run_tasks(_chaos_task, [(definition, size + discard, discard, s, raster, color)
+                                          for size, s in zip(sizes, seeds)], workers)
+        if raster is not None:
+            for part in results:
+                raster.merge(part)
+            return raster
+
+        self.trajectory = Trajectory(np.concatenate([x.T for x, _ in results], axis=1),
+                                     np.concatenate([index for _, index in results]))
+        self.X, self.Indicies = self.trajectory
+        self.colors = None
+        return self.trajectory
+
+    def _palette(self, cmap: str = 'hsv')->np.ndarray:
+        """
+        Picking one RGB color per corner from a colormap.
+        Arguments:
+            cmap(str):
+                registered colormap name
+        returns:
+            np.ndarray:
+                colors with shape (n, 3)
+        """
+        return colormaps[cmap](np.arange(self.n)/self.n)[:, :3]
+
+    def _flat_colors(self, color: str, palette: np.ndarray = None)->np.ndarray:
+        """
+        Computing the colors of the points stored in X from Indicies, iterating first if
+        there are no points.
+        Arguments:
+            color(str):
+                'gradient' or 'rgb'
+            palette(np.ndarray):
+                RGB color of every corner for 'rgb'
+        returns:
+            np.ndarray:
+                one color per point of X
+        """
+        if not hasattr(self, 'X'):
+            self.iterate()
+        with phase('chaos_game.colors', len(self.X)):
+            if color == 'rgb':
+                C = _colors(self.Indicies, None, self._palette() if palette is None else palette)
+                return C.reshape(-1, 3)
+            return _colors(self.Indicies).reshape(-1)
 
     @property
     def gradient_color(self)->np.ndarray:
         """
         Defining colors for the plot by computing individual RGB color value for each point.
+        The colors belong to the points stored in X, iterate is only called if there are none.
         return:
             np.ndarray:
                 Array of the color values 
         """
-        self.iterate()
-        C = np.zeros(len(self.X))
-        C[0] = self.Indicies[0]
-        for i in range(len(self.X)-1):
-            C[i+1] =(C[i] + self.Indicies[i+1])/2
-        
-        return C
+        return self._flat_colors('gradient')
+
+    @property
+    def palette_color(self)->np.ndarray:
+        """
+        Defining RGB colors for the plot, where every step mixes the color of the point with
+        the palette color of the picked corner, C[i+1] = (C[i] + palette[j])/2.
+        return:
+            np.ndarray:
+                Array of the RGB values, shape (N, 3)
+        """
+        return self._flat_colors('rgb')
 
     def plot_ngon(self)->None:
         """
@@ -101,32 +881,136 @@ class ChaosGame:
         """
     
         plt.figure()
-        plt.scatter(*zip(*self._generate_ngon()), c='b')
+        plt.scatter(*self._generate_ngon().T, c='b')
         plt.show()
 
-    def plot(self, color: bool =False, cmap: str ='rainbow')->None:
+    def raster(self, color: bool = False, steps: int = 30000, chunk_size: int = None,
+               width: int = 1500)->DensityRaster:
+        """
+        Binning the generated points into a DensityRaster covering the n-gon.
+        Arguments:
+            color(bool):
+                accumulate the gradient color of the points or not
+            steps(int):
+                number of iterations
+            chunk_size(int):
+                if given, the points are streamed from iter_chunks and binned block by block
+                instead of being stored in X
+            width(int):
+                number of pixel columns
+        returns:
+            DensityRaster:
+                raster holding the point counts
+        """
+        corners = self._generate_ngon()
+        raster = DensityRaster.fit(corners, width, channels=int(color))
+        mode = 'gradient' if color == True else None
+        if chunk_size is not None:
+            rng = None if self.seed is None else np.random.default_rng(self.seed)
+            # The phase also holds the raster.add phases of the chunks
+            with phase('chaos_game.stream', steps):
+                for chunk in self.iter_chunks(steps, chunk_size, rng=rng, color=mode):
+                    raster.add(chunk[0], chunk[2] if color == True else None)
+        else:
+            self.iterate(steps, color=mode)
+            raster.add(self.X, self.colors)
+        return raster
+
+    def raster_adaptive(self, color: bool = False, width: int = 1500, tol: float = 0.05,
+                        coverage_tol: float = 0.01, max_steps: int = 10**8, max_seconds: float = None,
+                        chunk_size: int = 2**16)->tuple:
+        """
+        Binning points into a DensityRaster covering the n-gon until the image stops changing,
+        see adaptive.render_adaptive, instead of running a fixed number of steps.
+        Arguments:
+            color(bool):
+                accumulate the gradient color of the points or not
+            width(int):
+                number of pixel columns
+            tol(float):
+                largest density change of a converged image
+            coverage_tol(float):
+                largest pixel coverage change of a converged image
+            max_steps(int):
+                largest number of steps
+            max_seconds(float):
+                time budget, no limit if None
+            chunk_size(int):
+                number of steps per block
+        returns:
+            tuple:
+                the raster and the report of render_adaptive, whose 'points' is the number of
+                steps used
+        """
+        raster = DensityRaster.fit(self._generate_ngon(), width, channels=int(color))
+        rng = None if self.seed is None else np.random.default_rng(self.seed)
+        chunks = ((chunk[0], chunk[2] if color else None) for chunk in
+                  self.iter_chunks(max_steps, chunk_size, rng=rng, color='gradient' if color else None))
+        report = render_adaptive(chunks, raster, tol, coverage_tol, max_steps, max_seconds)
+        return raster, report
+
+    def animate(self, outfile: str, steps: int = 10**6, every: int = 10**4, color: bool = False,
+                cmap: str = 'rainbow', width: int = 800, fps: float = 30, chunk_size: int = 2**16)->dict:
+        """
+        Writing an animation of the attractor building up, one frame every `every` steps,
+        see animate.write_animation. The points are generated once and streamed into one
+        raster, so the cost grows with steps plus frames instead of steps times frames.
+        Arguments:
+            outfile(str):
+                video file encoded by ffmpeg if installed, or PNG file pattern such as
+                'frames/{:05d}.png', see animate.open_writer
+            steps(int):
+                number of iterations
+            every(int):
+                number of steps between frames
+            color(bool):
+                colored frames or not
+            cmap(str):
+                registered colormap name
+            width(int):
+                number of pixel columns
+            fps(float):
+                frames per second of a video
+            chunk_size(int):
+                number of steps per block
+        returns:
+            dict:
+                number of 'points' added and of 'frames' written
+        """
+        corners = self._generate_ngon()
+        raster = DensityRaster.fit(corners, width, channels=int(color))
+        rng = None if self.seed is None else np.random.default_rng(self.seed)
+        chunks = ((chunk[0], chunk[2] if color else None) for chunk in
+                  self.iter_chunks(steps, chunk_size, rng=rng, color='gradient' if color else None))
+        writer = open_writer(outfile, raster.width, raster.height, fps)
+        return write_animation(chunks, raster, writer, every, overlay=corners, cmap=cmap)
+
+    def plot(self, color: bool =False, cmap: str ='rainbow', steps: int = 30000,
+             chunk_size: int = None)->None:
         """
         Plotting the generated points with a choice to have them colored or not.
+        The points are binned into a DensityRaster and drawn as one image.
         Arguments:
             color(bool):
                 colored plot or not
             cmap(str):
                 registered colormap name
+            steps(int):
+                number of iterations
+            chunk_size(int):
+                if given, the points are streamed from iter_chunks and binned block by block
+                instead of being stored in X
         """
-        self.iterate()
-
-        if color == True:
-            colors = self.gradient_color
-        else:
-            colors = 'black'
-            
-        
-        plt.scatter(self.X[:,0], self.X[:,1], c=colors, cmap=cmap, s = .4, marker = '.') 
-        plt.scatter(*zip(*self._generate_ngon()), c = 'b')  
+        raster = self.raster(color, steps, chunk_size)
+        image = raster.image(cmap=cmap)
+        with phase('chaos_game.draw', raster.width*raster.height):
+            plt.imshow(image, extent=raster.extent, interpolation='nearest')
+            plt.scatter(*self._generate_ngon().T, c = 'b')  
         plt.axis('equal')
         plt.axis('off')
     
-    def show(self, color: bool = False, cmap: str ='rainbow')->None:
+    def show(self, color: bool = False, cmap: str ='rainbow', steps: int = 30000,
+             chunk_size: int = None)->None:
         """
         Shows the plot.
         Arguments:
@@ -134,14 +1018,20 @@ class ChaosGame:
                 colored plot or not
             cmap(str):
                 registered colormap name
+            steps(int):
+                number of iterations
+            chunk_size(int):
+                stream the points in blocks of this many steps, see plot
         """
-        self.plot(color, cmap=cmap)
+        self.plot(color, cmap=cmap, steps=steps, chunk_size=chunk_size)
         plt.show()
 
 
-    def savepng(self, outfile: str, color: bool = False, cmap: str ='rainbow')->None:
+    def savepng(self, outfile: str, color: bool = False, cmap: str ='rainbow', steps: int = 30000,
+                chunk_size: int = None)->None:
         """
-        Saves the plot.
+        Saves the plot. The image is written directly from the DensityRaster, without
+        drawing a matplotlib figure.
         Arguments:
             outfile(str):
                 Name we want the file to be saved as
@@ -149,12 +1039,18 @@ class ChaosGame:
                 colored plot or not
             cmap(str):
                 registered colormap name
+            steps(int):
+                number of iterations
+            chunk_size(int):
+                stream the points in blocks of this many steps, see plot
         """
         if '.png' not in outfile:
             outfile = outfile + '.png'
-        self.plot(color, cmap=cmap)
-        plt.savefig(outfile, dpi=300, transparent=False)
-        plt.clf() #clears figure after each figure
+        raster = self.raster(color, steps, chunk_size)
+        image = raster.image(cmap=cmap)
+        with phase('chaos_game.corners', self.n):
+            raster.stamp(image, self._generate_ngon())
+        raster.save(outfile, image)
 
 
 
@@ -174,10 +1070,9 @@ if __name__ == "__main__":
     Genererer 1000 tilfeldig tall for å sjekke om startpunktet x0 er innenfor femkanten.'''
 
     pentagon = ChaosGame(5)
-    for i in range(11): #1001
-        x = pentagon._starting_point()
-        plt.scatter(x[0], x[1], c = 'r')
-        plt.scatter(*zip(*pentagon._generate_ngon()), c='b')
+    x = pentagon._starting_point(1001)
+    plt.scatter(x[:, 0], x[:, 1], c = 'r')
+    plt.scatter(*pentagon._generate_ngon().T, c='b')
 
     plt.show()
     
@@ -0,0 +1,182 @@
+import numpy as np
+from instrument import phase
+
+# Finest grids with at most this many boxes use one byte per box
+_BYTE_BOXES = 2**24
+# Finest grids with at most this many boxes use one bit per box, larger ones a set of box codes
+_BIT_BOXES = 2**28
+
+
+def _spread(v: np.ndarray)->np.ndarray:
+    """
+    Moving bit i of every value to bit 2*i.
+    Arguments:
+        v(np.ndarray):
+            integers below 2**31
+    returns:
+        np.ndarray:
+            spread integers, as np.uint64
+    """
+    v = v.astype(np.uint64)
+    for shift, mask in ((16, 0x0000FFFF0000FFFF), (8, 0x00FF00FF00FF00FF), (4, 0x0F0F0F0F0F0F0F0F),
+                        (2, 0x3333333333333333), (1, 0x5555555555555555)):
+        v = (v | (v << np.uint64(shift))) & np.uint64(mask)
+    return v
+
+
+def _sorted_unique(codes: np.ndarray)->np.ndarray:
+    """
+    Sorted distinct values of an integer array, by sorting in place and dropping repeats.
+    Arguments:
+        codes(np.ndarray):
+            integers, reordered by the call
+    returns:
+        np.ndarray:
+            sorted distinct values
+    """
+    codes.sort()
+    keep = np.ones(len(codes), dtype=bool)
+    np.not_equal(codes[1:], codes[:-1], out=keep[1:])
+    return codes[keep]
+
+
+class BoxCounter:
+    def __init__(self, extent: tuple, levels: int = 12)->None:
+        """
+        Constructor for BoxCounter, counting the boxes of a square grid hit by a stream of points
+        at several scales at once. At level L the square covering extent is cut into 2**L by 2**L
+        boxes. Only the finest level is stored, as the Morton (Z-order) codes of the hit boxes:
+        the box holding a box of level L at level L - 1 has the code shifted right by two bits,
+        so every coarser count is found from the sorted finest codes. The finest level is a byte
+        or bit per box for grids of up to 2**28 boxes and a sorted array of codes beyond,
+        so no Python object is made per point.
+        Arguments:
+            extent(tuple):
+                (xmin, xmax, ymin, ymax) of the region holding the points
+            levels(int):
+                finest level, at most 31
+        """
+        xmin, xmax, ymin, ymax = (float(v) for v in extent)
+        if xmax <= xmin or ymax <= ymin or levels < 1 or levels > 31:
+            raise ValueError()
+        self.origin = np.array([xmin, ymin])
+        self.size = max(xmax - xmin, ymax - ymin)
+        self.levels = levels
+        self.points = 0
+        boxes = 4**levels
+        self._bytes = np.zeros(boxes, dtype=bool) if boxes <= _BYTE_BOXES else None
+        self._bits = np.zeros(boxes//8, dtype=np.uint8) if _BYTE_BOXES < boxes <= _BIT_BOXES else None
+        self._codes = np.zeros(0, dtype=np.int64)
+        self._pending = []
+
+    def add(self, points: np.ndarray)->None:
+        """
+        Adding a block of points. Points outside the square are ignored, as are nan points.
+        Arguments:
+            points(np.ndarray):
+                points with shape (N, 2)
+        """
+        points = np.asarray(points, dtype=float)
+        with phase('dimension.add', len(points)):
+            cells = (points - self.origin) * (2**self.levels / self.size)
+            inside = np.all((cells >= 0) & (cells < 2**self.levels), axis=1)
+            cells = cells[inside].astype(np.int64)
+            self.points += len(cells)
+            code = (_spread(cells[:, 0]) | (_spread(cells[:, 1]) << np.uint64(1))).astype(np.int64)
+            if self._bytes is not None:
+                self._bytes[code] = True
+            elif self._bits is not None:
+                # Codes sharing a byte but not a bit must not be written in the same pass
+                byte, bit = code >> 3, code & 7
+                for b in range(8):
+                    self._bits[byte[bit == b]] |= np.uint8(1 << b)
+            else:
+                self._pending.append(_sorted_unique(code))
+                if sum(len(p) for p in self._pending) > max(len(self._codes), 2**22):
+                    self._merge()
+
+    def _merge(self)->None:
+        """
+        Merging the codes added since the last merge into the sorted set.
+        """
+        self._codes = _sorted_unique(np.concatenate([self._codes] + self._pending))
+        self._pending = []
+
+    def codes(self)->np.ndarray:
+        """
+        Sorted Morton codes of the hit boxes at the finest level.
+        returns:
+            np.ndarray:
+                codes
+        """
+        if self._bytes is not None:
+            return np.flatnonzero(self._bytes)
+        if self._bits is not None:
+            byte = np.flatnonzero(self._bits)
+            hit = np.unpackbits(self._bits[byte][:, None], axis=1, bitorder='little').astype(bool)
+            return (byte[:, None]*8 + np.arange(8))[hit]
+        self._merge()
+        return self._codes
+
+    def counts(self)->np.ndarray:
+        """
+        Number of hit boxes at every level.
+        returns:
+            np.ndarray:
+                count for the levels 1 ... levels
+        """
+        codes = self.codes()
+        if len(codes) == 0:
+            return np.zeros(self.levels, dtype=int)
+        return np.array([1 + np.count_nonzero(np.diff(codes >> 2*(self.levels - L)))
+                         for L in range(1, self.levels + 1)])
+
+    def dimension(self, low: int = 3, high: int = None)->float:
+        """
+        Box-counting dimension, the slope of log(count) against log(2**L) fitted by least squares.
+        Levels where the boxes are so small that most of them hold a single point are left out,
+        since the points no longer resolve the set there.
+        Arguments:
+            low(int):
+                coarsest level used in the fit
+            high(int):
+                finest level used in the fit, the finest level with on average at least 8 points
+                per hit box if None
+        returns:
+            float:
+                estimated dimension
+        """
+        counts = self.counts()
+        if high is None:
+            resolved = np.flatnonzero(counts * 8 <= self.points) + 1
+            high = resolved.max() if len(resolved) else low + 1
+        high = min(high, self.levels)
+        if high - low < 1:
+            raise ValueError()
+        L = np.arange(low, high + 1)
+        return float(np.polyfit(L*np.log(2), np.log(counts[L - 1]), 1)[0])
+
+
+def box_dimension(chunks, extent: tuple, levels: int = 12, low: int = 3, high: int = None)->float:
+    """
+    Estimating the box-counting dimension of the points of a chunked generator, such as
+    ChaosGame.iter_chunks, IFS.iter_chunks, Flame.iter_chunks or PointStore.chunks.
+    Arguments:
+        chunks(iterable):
+            blocks of points with shape (N, 2), or tuples starting with such a block
+        extent(tuple):
+            (xmin, xmax, ymin, ymax) of the region holding the points
+        levels(int):
+            finest level of the grid
+        low(int):
+            coarsest level used in the fit
+        high(int):
+            finest level used in the fit, see BoxCounter.dimension
+    returns:
+        float:
+            estimated dimension
+    """
+    counter = BoxCounter(extent, levels)
+    for chunk in chunks:
+        counter.add(chunk[0] if isinstance(chunk, tuple) else chunk)
+    return counter.dimension(low, high)
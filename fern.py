@@ -1,5 +1,10 @@
 import numpy as np
 import matplotlib.pyplot as plt
+from raster import DensityRaster
+from parallel import _random, split_work, seed_streams, run_tasks
+from kernels import use_numba, ifs_walk
+from instrument import phase
+from adaptive import render_adaptive
 
 class AffineTransform:
     def __init__(self, a: int = 0, b: int = 0, c: int = 0, d: int = 0, e: int = 0, f: int = 0)->None:  
@@ -27,91 +32,338 @@ class AffineTransform:
             list:
                 point resulting from transformation f(x,y)
         """
-        x = self.a*x + self.b*y + self.e
-        y = self.c*x + self.d*y + self.f
-        return [x, y]
-
+        return [self.a*x + self.b*y + self.e, self.c*x + self.d*y + self.f]
 
+    @property
+    def matrix(self)->np.ndarray:
+        """
+        Coefficients of the transform as a 2x3 matrix [[a, b, e], [c, d, f]].
+        returns:
+            np.ndarray:
+                coefficient matrix
+        """
+        return np.array([[self.a, self.b, self.e], [self.c, self.d, self.f]], dtype=float)
 
 
-if __name__ == "__main__":
-    
-    f1 = AffineTransform(d=0.16)
-    f2 = AffineTransform(a=0.85, b=0.04, c=-0.04, d=0.85, f=1.60)
-    f3 = AffineTransform(a=0.2, b=-0.26, c=0.23, d=0.22, f=1.6)
-    f4 = AffineTransform(a=-0.15, b=0.28, c=0.26, d=0.24, f=0.44)
+class IFS:
+    def __init__(self, transforms: list, probabilities: list = None)->None:
+        """
+        Constructor for IFS, an iterated function system compiled from a list of
+        AffineTransforms into one (k, 2, 3) coefficient stack.
+        Arguments:
+            transforms(list):
+                the AffineTransforms of the system
+            probabilities(list):
+                probability of picking each transform, equal probabilities if None
+        """
+        k = len(transforms)
+        if probabilities is None:
+            probabilities = np.full(k, 1/k)
+        probabilities = np.asarray(probabilities, dtype=float)
+        if k < 1 or len(probabilities) != k or np.any(probabilities < 0):
+            raise ValueError()
 
-    def non_uniform(x:int , y:int)-> AffineTransform:
+        self.transforms = list(transforms)
+        self.coefficients = np.array([t.matrix for t in transforms])
+        self.probabilities = probabilities / probabilities.sum()
+        self._linear = np.ascontiguousarray(self.coefficients[:, :, :2])
+        self._shift = np.ascontiguousarray(self.coefficients[:, :, 2])
+        self._cdf = np.cumsum(self.probabilities)
+        self._cdf[-1] = 1.0
 
+    def choose(self, u: np.ndarray)->np.ndarray:
         """
-        Picking one of four functions at random given probabilities for each function.
+        Picking transforms from uniform random numbers with a binary search in the
+        precomputed cumulative probabilities.
         Arguments:
-            x(int):
-                 x value of the point
-            y(int):
-                y value of the point
-        Returns:
-            AffineTransform:
-                Transformed point
+            u(np.ndarray):
+                random numbers in [0, 1)
+        returns:
+            np.ndarray:
+                index of the picked transform for every number
         """
+        return np.searchsorted(self._cdf, u, side='right')
 
-        functions = np.array([f1, f2, f3, f4])
-        p_functions = np.array([0.01, 0.85, 0.07, 0.07])
-        assert(np.sum(p_functions) == 1)
+    def apply(self, points: np.ndarray, choice: np.ndarray)->np.ndarray:
+        """
+        Applying the picked transform to every point at once, as a batched matrix product.
+        Arguments:
+            points(np.ndarray):
+                points with shape (N, 2)
+            choice(np.ndarray):
+                index of the transform applied to each point, shape (N,)
+        returns:
+            np.ndarray:
+                transformed points, shape (N, 2)
+        """
+        linear = np.take(self._linear, choice, axis=0)
+        return np.einsum('nij,nj->ni', linear, points) + np.take(self._shift, choice, axis=0)
 
-        p_cumulative = np.cumsum(p_functions, axis = 0) # cumulative sum of the probabilities.
-        
-        #Check that probabilities sums up to 1
+    def iter_chunks(self, N: int = 50000, chunk_size: int = 2**16, walkers: int = 1000,
+                    discard: int = 20, start: tuple = (0, 0), rng: np.random.Generator = None,
+                    backend: str = 'numpy'):
+        """
+        Generating N points with many walkers moving in parallel, yielded in blocks.
+        Every step picks one transform per walker and applies them all with one batched matrix
+        product. The walkers start at start and their first discard steps are ignored.
+        Arguments:
+            N(int):
+                number of points
+            chunk_size(int):
+                approximate number of points in every block, rounded to whole steps
+            walkers(int):
+                number of points moving in parallel
+            discard(int):
+                number of first steps of every walker we want to ignore
+            start(tuple):
+                starting point of the walkers
+            rng(np.random.Generator):
+                random generator, the global np.random state if None
+            backend(str):
+                'numpy' for one batched product per step or 'numba' for the compiled
+                kernels.ifs_walk, which falls back to 'numpy' when numba is not installed
+        yields:
+            tuple:
+                points with shape (steps*walkers, 2), ordered step by step, and the index of
+                the transform that produced each point
+        """
+        walkers = max(1, min(walkers, N))
+        fast = use_numba(backend)
+        steps_per_chunk = max(1, chunk_size // walkers)
+        points = np.tile(np.asarray(start, dtype=float), (walkers, 1))
+        for _ in range(discard):
+            points = self.apply(points, self.choose(_random(rng, walkers)))
 
-        #picking one of 4 probabilities at random
-        # r is the random point. interval: [0,1)
-        r = np.random.random()
-        for j, p in enumerate(p_cumulative):
-            if r < p:
-                return functions[j](x,y)
+        done = 0
+        while done < N:
+            steps = min(steps_per_chunk, -(-(N - done) // walkers))
+            block = np.empty((steps, walkers, 2))
+            choice = self.choose(_random(rng, (steps, walkers)))
+            if fast:
+                ifs_walk(points, choice, self._linear, self._shift, block)
+                points = block[-1]
+            else:
+                for i in range(steps):
+                    points = self.apply(points, choice[i])
+                    block[i] = points
+            size = min(steps*walkers, N - done)
+            done += size
+            yield block.reshape(-1, 2)[:size], choice.reshape(-1)[:size]
 
-    def iterating(x0: int = 0, y0: int = 0, N: int = 50000)-> np.ndarray:
+    def iterate(self, N: int = 50000, walkers: int = 1000, discard: int = 20,
+                start: tuple = (0, 0), rng: np.random.Generator = None,
+                backend: str = 'numpy')->np.ndarray:
         """
-        Iterating new points by picking one of four functions randomly according
-        to their probability.
+        Generating N points, see iter_chunks.
         Arguments:
-            x0(int):
-                x value of startpoint
-            y0(int):
-                y value of Startpoint
             N(int):
-                Number of iterations
+                number of points
+            walkers(int):
+                number of points moving in parallel
+            discard(int):
+                number of first steps of every walker we want to ignore
+            start(tuple):
+                starting point of the walkers
+            rng(np.random.Generator):
+                random generator, the global np.random state if None
+            backend(str):
+                'numpy' or 'numba', see iter_chunks
         returns:
             np.ndarray:
-                list of generated points.
+                generated points, shape (N, 2)
         """
-        x_list = np.zeros((N, 2))
-        x_list[0] = [x0, y0]
+        x_list = np.empty((N, 2))
+        done = 0
+        with phase('fern.iterate', N):
+            for points, _ in self.iter_chunks(N, 2**20, walkers, discard, start, rng, backend):
+                x_list[done:done + len(points)] = points
+                done += len(points)
+        return x_list
+
+
+
+
+f1 = AffineTransform(d=0.16)
+f2 = AffineTransform(a=0.85, b=0.04, c=-0.04, d=0.85, f=1.60)
+f3 = AffineTransform(a=0.2, b=-0.26, c=0.23, d=0.22, f=1.6)
+f4 = AffineTransform(a=-0.15, b=0.28, c=0.26, d=0.24, f=0.44)
+
+barnsley = IFS([f1, f2, f3, f4], [0.01, 0.85, 0.07, 0.07])
+
+def non_uniform(x:int , y:int, rng: np.random.Generator = None)-> AffineTransform:
+
+    """
+    Picking one of four functions at random given probabilities for each function.
+    Arguments:
+        x(int):
+             x value of the point
+        y(int):
+            y value of the point
+        rng(np.random.Generator):
+            random generator, the global np.random state if None
+    Returns:
+        AffineTransform:
+            Transformed point
+    """
+
+    # picking one of 4 functions at random from the precomputed cumulative probabilities
+    # r is the random point. interval: [0,1)
+    r = _random(rng, None)
+    return barnsley.transforms[barnsley.choose(r)](x, y)
+
+def iterating(x0: int = 0, y0: int = 0, N: int = 50000, rng: np.random.Generator = None,
+              backend: str = 'numpy')-> np.ndarray:
+    """
+    Iterating new points by picking one of four functions randomly according
+    to their probability. With backend='numba' the random numbers are drawn in bulk
+    and the trajectory is run by the compiled kernels.ifs_walk, giving the same points.
+    Arguments:
+        x0(int):
+            x value of startpoint
+        y0(int):
+            y value of Startpoint
+        N(int):
+            Number of iterations
+        rng(np.random.Generator):
+            random generator, the global np.random state if None
+        backend(str):
+            'numpy' or 'numba', falls back to 'numpy' when numba is not installed
+    returns:
+        np.ndarray:
+            list of generated points.
+    """
+    x_list = np.zeros((N, 2))
+    x_list[0] = [x0, y0]
+    with phase('fern.iterating', N):
+        if use_numba(backend):
+            choice = barnsley.choose(_random(rng, (N-1, 1)))
+            ifs_walk(x_list[:1], choice, barnsley._linear, barnsley._shift, x_list[1:, None])
+            return x_list
         for i in range(N-1):
-            x_list[i+1] = non_uniform(x_list[i][0], x_list[i][1])
+            x_list[i+1] = non_uniform(x_list[i][0], x_list[i][1], rng)
+    return x_list
+
+def _fern_task(N: int, seed: np.random.SeedSequence, raster: DensityRaster):
+    """
+    Running one task of iterating_parallel in a worker process.
+    Arguments:
+        N(int):
+            Number of iterations
+        seed(np.random.SeedSequence):
+            seed of the task
+        raster(DensityRaster):
+            raster giving the extent and shape to bin the points into, or None to return
+            the points
+    returns:
+        np.ndarray or DensityRaster:
+            generated points, or the filled raster
+    """
+    x_list = barnsley.iterate(N, rng=np.random.default_rng(seed))
+    if raster is None:
         return x_list
+    part = DensityRaster(raster.extent, raster.width, raster.height, raster.channels)
+    part.add(x_list)
+    return part
 
-    def plot()->None:
-        """
-        Plotting the the generated points.
-        """
-        x_list = iterating()
-        plt.scatter(*zip(*x_list), c='forestgreen', s=0.1)
-        plt.axis('equal')
-        plt.axis('off')
+def iterating_parallel(N: int = 50000, seed: int = None, workers: int = None, tasks: int = 32,
+                       raster: DensityRaster = None):
+    """
+    Generating fern points on several processes. The points are split into a fixed number of
+    tasks, each running barnsley.iterate with an independent np.random.Generator spawned from one
+    SeedSequence, so a given seed gives the same output whatever the number of workers.
+    Arguments:
+        N(int):
+            total number of points
+        seed(int):
+            root seed, fresh entropy if None
+        workers(int):
+            number of processes, all cores if None
+        tasks(int):
+            number of independent trajectories
+        raster(DensityRaster):
+            if given, the points of every task are binned and summed into this raster
+            instead of being returned
+    returns:
+        np.ndarray or DensityRaster:
+            generated points, or the raster
+    """
+    seeds = seed_streams(seed, tasks)
+    results = run_tasks(_fern_task, [(size, s, raster) for size, s in zip(split_work(N, tasks), seeds)
+                                     if size > 0], workers)
+    if raster is None:
+        return np.concatenate(results)
+    for part in results:
+        raster.merge(part)
+    return raster
 
-    def savepng(outfile: str)->None:
-        """
-        Saving the plot to a file.
-        Arguments:
-            outfile(str):
-                Chosen name to the file.
-        """
-        if '.png' not in outfile:
-            outfile + '.png'
-        plot()
-        plt.savefig(outfile, dpi=300, transparent=False)
-        plt.clf()
-    
+def rasterize(N: int = 50000, width: int = 800)->DensityRaster:
+    """
+    Binning the generated points into a DensityRaster covering the fern.
+    Arguments:
+        N(int):
+            Number of iterations
+        width(int):
+            number of pixel columns
+    returns:
+        DensityRaster:
+            raster holding the point counts
+    """
+    x_list = barnsley.iterate(N)
+    raster = DensityRaster.fit(x_list, width)
+    raster.add(x_list)
+    return raster
+
+def rasterize_adaptive(width: int = 800, tol: float = 0.05, coverage_tol: float = 0.01,
+                       max_points: int = 10**8, max_seconds: float = None,
+                       rng: np.random.Generator = None)->tuple:
+    """
+    Binning fern points into a DensityRaster until the image stops changing, see
+    adaptive.render_adaptive, instead of generating a fixed number of points.
+    Arguments:
+        width(int):
+            number of pixel columns
+        tol(float):
+            largest density change of a converged image
+        coverage_tol(float):
+            largest pixel coverage change of a converged image
+        max_points(int):
+            largest number of points
+        max_seconds(float):
+            time budget, no limit if None
+        rng(np.random.Generator):
+            random generator, the global np.random state if None
+    returns:
+        tuple:
+            the raster and the report of render_adaptive
+    """
+    # The fern lies in [-2.2, 2.7] x [0, 10]
+    raster = DensityRaster((-2.4, 2.9, -0.2, 10.2), width)
+    chunks = ((points, None) for points, _ in barnsley.iter_chunks(max_points, 2**16, rng=rng))
+    report = render_adaptive(chunks, raster, tol, coverage_tol, max_points, max_seconds)
+    return raster, report
+
+def plot()->None:
+    """
+    Plotting the the generated points.
+    The points are binned into a DensityRaster and drawn as one image.
+    """
+    raster = rasterize()
+    plt.imshow(raster.image(color='forestgreen'), extent=raster.extent, interpolation='nearest')
+    plt.axis('equal')
+    plt.axis('off')
+
+def savepng(outfile: str)->None:
+    """
+    Saving the plot to a file. The image is written directly from the DensityRaster,
+    without drawing a matplotlib figure.
+    Arguments:
+        outfile(str):
+            Chosen name to the file.
+    """
+    if '.png' not in outfile:
+        outfile = outfile + '.png'
+    rasterize().save(outfile, color='forestgreen')
+
+
+if __name__ == "__main__":
     savepng('barnsley_fern.png')
-    
\ No newline at end of file
@@ -0,0 +1,349 @@
+import numpy as np
+import matplotlib.pyplot as plt
+from raster import DensityRaster
+from parallel import _random, split_work, seed_streams, run_tasks
+from fern import AffineTransform, IFS
+from variations import Variations, VARIATIONS
+from chaos_game import ChaosGame
+from adaptive import render_adaptive
+
+
+class Flame:
+    def __init__(self, transforms, variations, probabilities: list = None, colors: list = None)->None:
+        """
+        Constructor for Flame, a fractal flame: every step applies a randomly picked affine map
+        followed by a weighted sum of variations, and the result is fed back into the next step.
+        Arguments:
+            transforms(list or IFS):
+                the AffineTransforms of the system, or an IFS holding them and their probabilities
+            variations(dict or list):
+                weight of every variation name, shared by all maps, or one such dict per map
+            probabilities(list):
+                probability of picking each map, those of the IFS or equal if None
+            colors(list):
+                color value in [0, 1] of every map, evenly spread if None
+        """
+        if isinstance(transforms, IFS):
+            ifs = transforms if probabilities is None else IFS(transforms.transforms, probabilities)
+        else:
+            ifs = IFS(transforms, probabilities)
+        k = len(ifs.transforms)
+
+        per_map = [variations] * k if isinstance(variations, dict) else list(variations)
+        if len(per_map) != k:
+            raise ValueError()
+        names = sorted({name for v in per_map for name in v})
+        for name in names:
+            if name not in VARIATIONS:
+                raise ValueError()
+
+        self.ifs = ifs
+        self.names = names
+        self.weights = np.array([[v.get(name, 0.0) for name in names] for v in per_map], dtype=float)
+        self.map_colors = np.linspace(0, 1, k) if colors is None else np.asarray(colors, dtype=float)
+        if self.map_colors.shape != (k,):
+            raise ValueError()
+        # With the same weights for every map the blend is one matrix-vector product
+        self._shared = bool(np.all(self.weights == self.weights[0]))
+
+    @classmethod
+    def from_chaos_game(cls, game: ChaosGame, variations, colors: list = None):
+        """
+        Creating a Flame from the corner maps of a ChaosGame, x -> r*x + (1 - r)*corner, with the
+        same corner weights and ratios. The maps of a Flame are picked independently, so games
+        with a rule are not supported.
+        Arguments:
+            game(ChaosGame):
+                instance of ChaosGame
+            variations(dict or list):
+                weight of every variation name, shared by all maps, or one such dict per map
+            colors(list):
+                color value of every corner, evenly spread if None
+        returns:
+            Flame:
+                flame with one map per corner
+        """
+        if game.rule is not None:
+            raise ValueError()
+        corners = game._generate_ngon()[:game.n]
+        ratios = np.full(game.n, game.r) if game.ratios is None else game.ratios
+        transforms = [AffineTransform(a=r, d=r, e=(1 - r)*cx, f=(1 - r)*cy)
+                      for r, (cx, cy) in zip(ratios, corners)]
+        return cls(transforms, variations, game.weights, colors)
+
+    def step(self, points: np.ndarray, colors: np.ndarray, choice: np.ndarray,
+             components: np.ndarray)->tuple:
+        """
+        Moving every walker one step: affine map, variations and color blending.
+        Arguments:
+            points(np.ndarray):
+                walker positions, shape (walkers, 2)
+            colors(np.ndarray):
+                walker color values, shape (walkers,)
+            choice(np.ndarray):
+                index of the map applied to each walker
+            components(np.ndarray):
+                work space with shape (len(names), 2, walkers)
+        returns:
+            tuple:
+                new positions with shape (2, walkers) and new color values
+        """
+        moved = self.ifs.apply(points, choice)
+        Variations.batch(moved[:, 0], moved[:, 1], self.names, out=dict(zip(self.names, components)))
+        k = len(self.names)
+        if self._shared:
+            new = np.dot(self.weights[0], components.reshape(k, -1)).reshape(2, -1)
+        else:
+            new = np.einsum('nv,vcn->cn', np.take(self.weights, choice, axis=0), components)
+        colors = (colors + np.take(self.map_colors, choice)) / 2
+        return new, colors
+
+    def iter_chunks(self, N: int = 10**6, chunk_size: int = 2**20, walkers: int = 2**14,
+                    discard: int = 20, rng: np.random.Generator = None):
+        """
+        Generating N flame points with many walkers moving in parallel, yielded in blocks.
+        The walkers start at random points in [-1, 1]^2 and their first discard steps are
+        ignored. A walker whose position becomes nan or infinite is restarted at a new random
+        point, and that step is yielded as nan so it is skipped by DensityRaster.add.
+        Arguments:
+            N(int):
+                number of points
+            chunk_size(int):
+                approximate number of points in every block, rounded to whole steps
+            walkers(int):
+                number of points moving in parallel
+            discard(int):
+                number of first steps of every walker we want to ignore
+            rng(np.random.Generator):
+                random generator, the global np.random state if None
+        yields:
+            tuple:
+                points with shape (steps*walkers, 2), ordered step by step, and their color values
+        """
+        walkers = max(1, min(walkers, N))
+        steps_per_chunk = max(1, chunk_size // walkers)
+        points = 2*_random(rng, (walkers, 2)) - 1
+        colors = _random(rng, walkers)
+        components = np.empty((len(self.names), 2, walkers))
+
+        def advance(points, colors, u):
+            new, colors = self.step(points, colors, self.ifs.choose(u), components)
+            points = new.T
+            bad = ~np.isfinite(points).all(axis=1)
+            if bad.any():
+                restart = 2*_random(rng, (int(bad.sum()), 2)) - 1
+                points = points.copy()
+                points[bad] = restart
+                return points, colors, bad
+            return points, colors, None
+
+        with np.errstate(all='ignore'):
+            for _ in range(discard):
+                points, colors, _ = advance(points, colors, _random(rng, walkers))
+
+            done = 0
+            while done < N:
+                steps = min(steps_per_chunk, -(-(N - done) // walkers))
+                block = np.empty((steps, walkers, 2))
+                shade = np.empty((steps, walkers))
+                u = _random(rng, (steps, walkers))
+                for i in range(steps):
+                    points, colors, bad = advance(points, colors, u[i])
+                    block[i] = points
+                    shade[i] = colors
+                    if bad is not None:
+                        block[i][bad] = np.nan
+                size = min(steps*walkers, N - done)
+                done += size
+                yield block.reshape(-1, 2)[:size], shade.reshape(-1)[:size]
+
+    def iterate(self, N: int = 10**6, walkers: int = 2**14, discard: int = 20,
+                rng: np.random.Generator = None)->tuple:
+        """
+        Generating N flame points, see iter_chunks.
+        Arguments:
+            N(int):
+                number of points
+            walkers(int):
+                number of points moving in parallel
+            discard(int):
+                number of first steps of every walker we want to ignore
+            rng(np.random.Generator):
+                random generator, the global np.random state if None
+        returns:
+            tuple:
+                points with shape (N, 2) and their color values
+        """
+        x_list = np.empty((N, 2))
+        colors = np.empty(N)
+        done = 0
+        for points, shade in self.iter_chunks(N, 2**20, walkers, discard, rng):
+            x_list[done:done + len(points)] = points
+            colors[done:done + len(points)] = shade
+            done += len(points)
+        return x_list, colors
+
+    def fit_raster(self, width: int = 1000, samples: int = 2**16, percentile: float = 0.5,
+                   rng: np.random.Generator = None)->DensityRaster:
+        """
+        Creating an empty colored raster from a short run. Flames often have a few points very
+        far out, so the extent covers the points between two percentiles instead of all of them.
+        Arguments:
+            width(int):
+                number of pixel columns
+            samples(int):
+                number of points in the short run
+            percentile(float):
+                percentage of the points cut off on each side
+            rng(np.random.Generator):
+                random generator, the global np.random state if None
+        returns:
+            DensityRaster:
+                empty raster with one color channel
+        """
+        points = self.iterate(samples, walkers=min(samples, 2**12), rng=rng)[0]
+        points = points[np.isfinite(points).all(axis=1)]
+        low = np.percentile(points, percentile, axis=0)
+        high = np.percentile(points, 100 - percentile, axis=0)
+        pad = np.maximum((high - low) * 0.05, 1e-12)
+        low, high = low - pad, high + pad
+        return DensityRaster((low[0], high[0], low[1], high[1]), width, channels=1)
+
+    def render(self, N: int = 10**6, raster: DensityRaster = None, width: int = 1000,
+               walkers: int = 2**14, rng: np.random.Generator = None)->DensityRaster:
+        """
+        Accumulating N flame points and their colors into a raster, block by block, so the
+        points are never stored all at once.
+        Arguments:
+            N(int):
+                number of points
+            raster(DensityRaster):
+                raster with one color channel to add to, fitted with fit_raster if None
+            width(int):
+                number of pixel columns of a fitted raster
+            walkers(int):
+                number of points moving in parallel
+            rng(np.random.Generator):
+                random generator, the global np.random state if None
+        returns:
+            DensityRaster:
+                the raster
+        """
+        if raster is None:
+            raster = self.fit_raster(width, rng=rng)
+        for points, shade in self.iter_chunks(N, 2**20, walkers, rng=rng):
+            raster.add(points, shade)
+        return raster
+
+    def render_adaptive(self, raster: DensityRaster = None, width: int = 1000, tol: float = 0.05,
+                        coverage_tol: float = 0.01, max_points: int = 10**9, max_seconds: float = None,
+                        walkers: int = 2**14, rng: np.random.Generator = None)->tuple:
+        """
+        Accumulating flame points until the image stops changing, see adaptive.render_adaptive.
+        Arguments:
+            raster(DensityRaster):
+                raster with one color channel to add to, fitted with fit_raster if None
+            width(int):
+                number of pixel columns of a fitted raster
+            tol(float):
+                largest density change of a converged image
+            coverage_tol(float):
+                largest pixel coverage change of a converged image
+            max_points(int):
+                largest number of points
+            max_seconds(float):
+                time budget, no limit if None
+            walkers(int):
+                number of points moving in parallel
+            rng(np.random.Generator):
+                random generator, the global np.random state if None
+        returns:
+            tuple:
+                the raster and the report of render_adaptive
+        """
+        if raster is None:
+            raster = self.fit_raster(width, rng=rng)
+        chunks = self.iter_chunks(max_points, 2**18, walkers, rng=rng)
+        return raster, render_adaptive(chunks, raster, tol, coverage_tol, max_points, max_seconds)
+
+    def render_parallel(self, N: int = 10**7, seed: int = None, workers: int = None,
+                        tasks: int = 32, raster: DensityRaster = None, width: int = 1000)->DensityRaster:
+        """
+        Rendering on several processes. The points are split into a fixed number of tasks with
+        independent generators spawned from one SeedSequence, so a given seed gives the same
+        raster whatever the number of workers.
+        Arguments:
+            N(int):
+                total number of points
+            seed(int):
+                root seed, fresh entropy if None
+            workers(int):
+                number of processes, all cores if None
+            tasks(int):
+                number of independent trajectories
+            raster(DensityRaster):
+                raster with one color channel to add to, fitted with fit_raster if None
+            width(int):
+                number of pixel columns of a fitted raster
+        returns:
+            DensityRaster:
+                the raster
+        """
+        seeds = seed_streams(seed, tasks + 1)
+        if raster is None:
+            raster = self.fit_raster(width, rng=np.random.default_rng(seeds[-1]))
+        results = run_tasks(_flame_task, [(self, size, s, raster) for size, s in
+                                          zip(split_work(N, tasks), seeds) if size > 0], workers)
+        for part in results:
+            raster.merge(part)
+        return raster
+
+    def savepng(self, outfile: str, N: int = 10**6, width: int = 1000, cmap: str = 'inferno',
+                background: str = 'black')->None:
+        """
+        Rendering the flame and writing the image straight to a file.
+        Arguments:
+            outfile(str):
+                Name of the file
+            N(int):
+                number of points
+            width(int):
+                number of pixel columns
+            cmap(str):
+                registered colormap name
+            background(str):
+                color of empty pixels
+        """
+        if '.png' not in outfile:
+            outfile = outfile + '.png'
+        self.render(N, width=width).save(outfile, cmap=cmap, background=background)
+
+
+def _flame_task(flame: Flame, N: int, seed: np.random.SeedSequence, raster: DensityRaster)->DensityRaster:
+    """
+    Running one task of Flame.render_parallel in a worker process.
+    Arguments:
+        flame(Flame):
+            flame to render
+        N(int):
+            number of points
+        seed(np.random.SeedSequence):
+            seed of the task
+        raster(DensityRaster):
+            raster giving the extent and shape to bin the points into
+    returns:
+        DensityRaster:
+            the filled raster
+    """
+    part = DensityRaster(raster.extent, raster.width, raster.height, raster.channels)
+    return flame.render(N, part, rng=np.random.default_rng(seed))
+
+
+if __name__ == "__main__":
+    flame = Flame.from_chaos_game(ChaosGame(3), {"linear": 0.6, "swirl": 0.3, "disc": 0.1})
+    raster = flame.render(10**6)
+    plt.imshow(raster.image(cmap='inferno', background='black'), extent=raster.extent,
+               interpolation='nearest')
+    plt.axis('equal')
+    plt.axis('off')
+    plt.show()
@@ -0,0 +1,175 @@
+import json
+import time
+import tracemalloc
+
+# Profiler receiving the phases, None when instrumentation is disabled
+_active = None
+
+
+class _NullPhase:
+    """
+    Phase returned while no Profiler is active, entering and leaving it does nothing.
+    """
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc)->bool:
+        return False
+
+
+_NULL_PHASE = _NullPhase()
+
+
+class _Phase:
+    def __init__(self, profiler, name: str, points: int)->None:
+        """
+        One timed run of a phase of an active Profiler.
+        Arguments:
+            profiler(Profiler):
+                profiler the phase reports to
+            name(str):
+                name of the phase
+            points(int):
+                number of points handled in the phase
+        """
+        self.profiler = profiler
+        self.name = name
+        self.points = points
+
+    def __enter__(self):
+        self.profiler._enter()
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc)->bool:
+        seconds = time.perf_counter() - self.start
+        self.profiler._exit(self.name, seconds, self.points)
+        return False
+
+
+def phase(name: str, points: int = 0):
+    """
+    Context manager timing a phase in the active Profiler. Without an active Profiler a shared
+    do-nothing object is returned, so instrumented code costs one global lookup.
+    Arguments:
+        name(str):
+            name of the phase, such as 'chaos_game.iterate'
+        points(int):
+            number of points handled in the phase
+    returns:
+        context manager
+    """
+    if _active is None:
+        return _NULL_PHASE
+    return _Phase(_active, name, points)
+
+
+class Profiler:
+    def __init__(self, memory: bool = False, hooks: list = None)->None:
+        """
+        Constructor for Profiler, recording the wall time, point count and memory of the phases
+        run while it is active:
+
+            with Profiler(memory=True) as prof:
+                game.savepng('chaos.png')
+            print(prof.to_json())
+
+        Arguments:
+            memory(bool):
+                also record the peak memory allocated in every phase with tracemalloc, which
+                slows the code down
+            hooks(list):
+                functions called as hook(name, seconds, points, nbytes) after every phase
+        """
+        self.memory = memory
+        self.hooks = list(hooks or [])
+        self.phases = {}
+        self._stack = []
+        self._previous = None
+        self._started = False
+
+    def __enter__(self):
+        global _active
+        self._previous = _active
+        _active = self
+        if self.memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started = True
+        return self
+
+    def __exit__(self, *exc)->bool:
+        global _active
+        _active = self._previous
+        if self._started:
+            tracemalloc.stop()
+            self._started = False
+        return False
+
+    def _enter(self)->None:
+        """
+        Starting the memory measurement of a phase. Phases can be nested: the peak of an inner
+        phase is carried to the phases around it.
+        """
+        if self.memory:
+            current, peak = tracemalloc.get_traced_memory()
+            if self._stack:
+                self._stack[-1][1] = max(self._stack[-1][1], peak)
+            tracemalloc.reset_peak()
+            self._stack.append([current, current])
+
+    def _exit(self, name: str, seconds: float, points: int)->None:
+        """
+        Adding a finished phase to the records and calling the hooks.
+        Arguments:
+            name(str):
+                name of the phase
+            seconds(float):
+                wall time of the phase
+            points(int):
+                number of points handled in the phase
+        """
+        nbytes = 0
+        if self.memory:
+            start, peak = self._stack.pop()
+            peak = max(peak, tracemalloc.get_traced_memory()[1])
+            nbytes = peak - start
+            if self._stack:
+                self._stack[-1][1] = max(self._stack[-1][1], peak)
+
+        record = self.phases.setdefault(name, {'calls': 0, 'seconds': 0.0, 'points': 0, 'peak_bytes': 0})
+        record['calls'] += 1
+        record['seconds'] += seconds
+        record['points'] += points
+        record['peak_bytes'] = max(record['peak_bytes'], nbytes)
+        for hook in self.hooks:
+            hook(name, seconds, points, nbytes)
+
+    def to_dict(self)->dict:
+        """
+        Records of every phase, with the throughput in points per second.
+        returns:
+            dict:
+                calls, seconds, points, points_per_s and peak_bytes by phase name
+        """
+        result = {}
+        for name, record in self.phases.items():
+            record = dict(record)
+            record['points_per_s'] = record['points']/record['seconds'] if record['seconds'] > 0 else 0.0
+            result[name] = record
+        return result
+
+    def to_json(self, outfile: str = None)->str:
+        """
+        Records of every phase as JSON.
+        Arguments:
+            outfile(str):
+                file to write the JSON to, if given
+        returns:
+            str:
+                the JSON text
+        """
+        text = json.dumps(self.to_dict(), indent=2)
+        if outfile is not None:
+            with open(outfile, 'w') as f:
+                f.write(text)
+        return text
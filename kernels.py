@@ -0,0 +1,136 @@
+import numpy as np
+
+try:
+    from numba import njit
+    NUMBA = True
+except ImportError:
+    NUMBA = False
+
+    def njit(*args, **kwargs):
+        """
+        Stand-in for numba.njit when numba is not installed: the kernels stay plain Python
+        functions, so they can still be called and tested.
+        """
+        if len(args) == 1 and callable(args[0]) and not kwargs:
+            return args[0]
+        return lambda func: func
+
+
+BACKENDS = ('numpy', 'numba')
+
+
+def use_numba(backend: str)->bool:
+    """
+    Checking a backend name and telling whether the compiled kernels should be used.
+    With backend='numba' and numba not installed the NumPy path is used instead.
+    Arguments:
+        backend(str):
+            'numpy' or 'numba'
+    returns:
+        bool:
+            True if the numba kernels are available and asked for
+    """
+    if backend not in BACKENDS:
+        raise ValueError()
+    return backend == 'numba' and NUMBA
+
+
+@njit(cache=True)
+def corner_walk(start: np.ndarray, Indicies: np.ndarray, ratios: np.ndarray, table: np.ndarray,
+                out: np.ndarray)->np.ndarray:
+    """
+    Chaos game steps x = ratios[j]*x + table[j] for every walker, one step at a time.
+    Arguments:
+        start(np.ndarray):
+            point of every walker before the first step, shape (walkers, 2)
+        Indicies(np.ndarray):
+            picked corner of every step and walker, shape (steps, walkers)
+        ratios(np.ndarray):
+            ratio of every corner, shape (n,)
+        table(np.ndarray):
+            (1 - ratio)*corner for every corner, shape (n, 2)
+        out(np.ndarray):
+            buffer for the points, shape (steps, walkers, 2)
+    returns:
+        np.ndarray:
+            out
+    """
+    steps, walkers = Indicies.shape
+    for m in range(walkers):
+        x = start[m, 0]
+        y = start[m, 1]
+        for k in range(steps):
+            j = Indicies[k, m]
+            x = ratios[j]*x + table[j, 0]
+            y = ratios[j]*y + table[j, 1]
+            out[k, m, 0] = x
+            out[k, m, 1] = y
+    return out
+
+
+@njit(cache=True)
+def ifs_walk(start: np.ndarray, choice: np.ndarray, linear: np.ndarray, shift: np.ndarray,
+             out: np.ndarray)->np.ndarray:
+    """
+    IFS steps x = linear[j] @ x + shift[j] for every walker, one step at a time.
+    Arguments:
+        start(np.ndarray):
+            point of every walker before the first step, shape (walkers, 2)
+        choice(np.ndarray):
+            picked transform of every step and walker, shape (steps, walkers)
+        linear(np.ndarray):
+            2x2 matrix of every transform, shape (k, 2, 2)
+        shift(np.ndarray):
+            translation of every transform, shape (k, 2)
+        out(np.ndarray):
+            buffer for the points, shape (steps, walkers, 2)
+    returns:
+        np.ndarray:
+            out
+    """
+    steps, walkers = choice.shape
+    for m in range(walkers):
+        x = start[m, 0]
+        y = start[m, 1]
+        for k in range(steps):
+            j = choice[k, m]
+            x, y = (linear[j, 0, 0]*x + linear[j, 0, 1]*y + shift[j, 0],
+                    linear[j, 1, 0]*x + linear[j, 1, 1]*y + shift[j, 1])
+            out[k, m, 0] = x
+            out[k, m, 1] = y
+    return out
+
+
+@njit(cache=True)
+def markov_walk(state: np.ndarray, u: np.ndarray, cum: np.ndarray, n: int, out: np.ndarray)->np.ndarray:
+    """
+    Corner picks of a Markov rule for every walker, one step at a time: the pick is the
+    number of entries of the cumulative row of the state that are <= u, and the new state
+    drops the oldest pick and appends the new one.
+    Arguments:
+        state(np.ndarray):
+            state of every walker, shape (walkers,), updated in place
+        u(np.ndarray):
+            uniform numbers, shape (steps, walkers)
+        cum(np.ndarray):
+            cumulative transition probabilities, shape (states, n), ending with 1
+        n(int):
+            number of corners
+        out(np.ndarray):
+            buffer for the picks, shape (steps, walkers)
+    returns:
+        np.ndarray:
+            out
+    """
+    steps, walkers = u.shape
+    keep = cum.shape[0] // n
+    for m in range(walkers):
+        s = state[m]
+        for k in range(steps):
+            j = 0
+            while j < n - 1 and cum[s, j] <= u[k, m]:
+                j += 1
+            s = (s % keep)*n + j
+            out[k, m] = j
+        state[m] = s
+    return out
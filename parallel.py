@@ -0,0 +1,95 @@
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+
+
+def _integers(rng, high: int, size)->np.ndarray:
+    """
+    Drawing random integers in [0, high) from a np.random.Generator, or from the global
+    np.random state when rng is None.
+    Arguments:
+        rng(np.random.Generator):
+            random generator, or None for the global state
+        high(int):
+            upper bound, excluded
+        size(int or tuple):
+            shape of the output
+    returns:
+        np.ndarray:
+            random integers
+    """
+    if rng is None:
+        return np.random.randint(low=0, high=high, size=size)
+    return rng.integers(0, high, size=size)
+
+
+def _random(rng, size)->np.ndarray:
+    """
+    Drawing random floats in [0, 1) from a np.random.Generator, or from the global
+    np.random state when rng is None.
+    Arguments:
+        rng(np.random.Generator):
+            random generator, or None for the global state
+        size(int or tuple):
+            shape of the output
+    returns:
+        np.ndarray:
+            random floats
+    """
+    if rng is None:
+        return np.random.random(size)
+    return rng.random(size)
+
+
+def split_work(total: int, tasks: int)->list:
+    """
+    Splitting total steps into tasks parts whose sizes differ by at most one.
+    Arguments:
+        total(int):
+            number of steps
+        tasks(int):
+            number of parts
+    returns:
+        list:
+            size of every part
+    """
+    if tasks < 1:
+        raise ValueError()
+    return [total//tasks + (i < total % tasks) for i in range(tasks)]
+
+
+def seed_streams(seed, tasks: int)->list:
+    """
+    Spawning one independent seed per task from a single SeedSequence.
+    Arguments:
+        seed(int or np.random.SeedSequence):
+            root seed, fresh entropy if None
+        tasks(int):
+            number of seeds
+    returns:
+        list:
+            np.random.SeedSequence for every task
+    """
+    if not isinstance(seed, np.random.SeedSequence):
+        seed = np.random.SeedSequence(seed)
+    return seed.spawn(tasks)
+
+
+def run_tasks(func, arguments: list, workers: int = None)->list:
+    """
+    Running func on every tuple of arguments on a ProcessPoolExecutor and returning the results
+    in the order of the arguments, whatever the number of workers.
+    Arguments:
+        func(callable):
+            module-level function, so it can be sent to the worker processes
+        arguments(list):
+            one tuple of arguments per task
+        workers(int):
+            number of processes, all cores if None and no pool at all if 1
+    returns:
+        list:
+            result of every task
+    """
+    if workers == 1 or len(arguments) <= 1:
+        return [func(*args) for args in arguments]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(func, *zip(*arguments)))
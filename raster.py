@@ -0,0 +1,213 @@
+import numpy as np
+import matplotlib.image
+from matplotlib import colormaps
+from matplotlib.colors import to_rgb
+from instrument import phase
+
+
+class DensityRaster:
+    def __init__(self, extent: tuple, width: int = 1000, height: int = None, channels: int = 0)->None:
+        """
+        Constructor for DensityRaster, a fixed-size 2D buffer counting how many points land in
+        every pixel.
+        Arguments:
+            extent(tuple):
+                (xmin, xmax, ymin, ymax) of the region that is rendered
+            width(int):
+                number of pixel columns
+            height(int):
+                number of pixel rows, chosen to keep the aspect ratio of extent if None
+            channels(int):
+                number of color values summed per pixel, 0 for no color, 1 for a scalar
+                color mapped through a colormap and 3 for RGB colors
+        """
+        xmin, xmax, ymin, ymax = (float(v) for v in extent)
+        if xmax <= xmin or ymax <= ymin or width < 1:
+            raise ValueError()
+        if height is None:
+            height = max(1, int(round(width * (ymax - ymin)/(xmax - xmin))))
+
+        self.extent = (xmin, xmax, ymin, ymax)
+        self.width = width
+        self.height = height
+        self.channels = channels
+        self.counts = np.zeros((height, width), dtype=np.int64)
+        self.colors = np.zeros((channels, height, width))
+        self.vmin = np.inf
+        self.vmax = -np.inf
+
+    @classmethod
+    def fit(cls, points: np.ndarray, width: int = 1000, channels: int = 0, margin: float = 0.05):
+        """
+        Creating a DensityRaster whose extent covers the given points.
+        Arguments:
+            points(np.ndarray):
+                points with shape (N, 2)
+            width(int):
+                number of pixel columns
+            channels(int):
+                number of color values summed per pixel
+            margin(float):
+                empty border added on each side, as a fraction of the size of the point cloud
+        returns:
+            DensityRaster:
+                empty raster
+        """
+        points = np.asarray(points)
+        low = points.min(axis=0)
+        high = points.max(axis=0)
+        pad = np.maximum((high - low) * margin, 1e-12)
+        low, high = low - pad, high + pad
+        return cls((low[0], high[0], low[1], high[1]), width, channels=channels)
+
+    def _pixels(self, points: np.ndarray)->tuple:
+        """
+        Finding the flat pixel index of every point inside the extent.
+        Arguments:
+            points(np.ndarray):
+                points with shape (N, 2)
+        returns:
+            tuple:
+                flat pixel indices and a mask of the points that were kept
+        """
+        xmin, xmax, ymin, ymax = self.extent
+        col = (points[:, 0] - xmin) * (self.width/(xmax - xmin))
+        row = (ymax - points[:, 1]) * (self.height/(ymax - ymin))
+        inside = (col >= 0) & (col < self.width) & (row >= 0) & (row < self.height)
+        flat = row[inside].astype(np.intp) * self.width + col[inside].astype(np.intp)
+        return flat, inside
+
+    def add(self, points: np.ndarray, colors: np.ndarray = None)->None:
+        """
+        Binning a block of points into the buffers. Can be called once per chunk so the
+        buffers are accumulated incrementally.
+        Arguments:
+            points(np.ndarray):
+                points with shape (N, 2)
+            colors(np.ndarray):
+                color of every point, shape (N,) for one channel or (N, channels)
+        """
+        with phase('raster.add', len(points)):
+            flat, inside = self._pixels(np.asarray(points))
+            size = self.width * self.height
+            self.counts += np.bincount(flat, minlength=size).reshape(self.counts.shape)
+
+            if self.channels and colors is not None:
+                colors = np.asarray(colors, dtype=float).reshape(len(inside), -1)[inside]
+                if len(colors):
+                    self.vmin = min(self.vmin, colors.min())
+                    self.vmax = max(self.vmax, colors.max())
+                for c in range(self.channels):
+                    self.colors[c] += np.bincount(flat, weights=colors[:, c],
+                                                  minlength=size).reshape(self.counts.shape)
+
+    def merge(self, other)->None:
+        """
+        Adding the buffers of another raster with the same shape and extent.
+        Arguments:
+            other(DensityRaster):
+                raster to add
+        """
+        if other.counts.shape != self.counts.shape or other.extent != self.extent:
+            raise ValueError()
+        self.counts += other.counts
+        self.colors += other.colors
+        self.vmin = min(self.vmin, other.vmin)
+        self.vmax = max(self.vmax, other.vmax)
+
+    def clear(self)->None:
+        """
+        Resetting the buffers to zero.
+        """
+        self.counts[:] = 0
+        self.colors[:] = 0
+        self.vmin = np.inf
+        self.vmax = -np.inf
+
+    def image(self, cmap: str = 'rainbow', color: str = 'black', background: str = 'white',
+              gamma: float = 2.2, vmin: float = None, vmax: float = None,
+              percentile: float = 99.5)->np.ndarray:
+        """
+        Turning the buffers into an RGB image with log-density tone mapping. The opacity of a
+        pixel is log(1 + count)/log(1 + peak) raised to 1/gamma, where peak is a high percentile
+        of the counts of the pixels that were hit, so a few very dense pixels do not wash out
+        the rest of the image.
+        Arguments:
+            cmap(str):
+                registered colormap name, used for one color channel
+            color(str):
+                color of the points when the raster has no color channels
+            background(str):
+                color of empty pixels
+            gamma(float):
+                gamma correction of the opacity
+            vmin(float):
+                color value mapped to the bottom of the colormap, smallest added value if None
+            vmax(float):
+                color value mapped to the top of the colormap, largest added value if None
+            percentile(float):
+                percentile of the nonzero counts that is given full opacity
+        returns:
+            np.ndarray:
+                image with shape (height, width, 3) and values in [0, 1]
+        """
+        with phase('raster.image', self.width*self.height):
+            counts = self.counts
+            hits = counts[counts > 0]
+            peak = np.percentile(hits, percentile) if len(hits) else 0
+            alpha = np.log1p(counts) / np.log1p(peak) if peak > 0 else np.zeros(counts.shape)
+            alpha = np.minimum(alpha, 1) ** (1/gamma)
+
+            hit = np.maximum(counts, 1)
+            if self.channels == 1:
+                vmin = self.vmin if vmin is None else vmin
+                vmax = self.vmax if vmax is None else vmax
+                mean = self.colors[0] / hit
+                span = vmax - vmin if np.isfinite(vmax - vmin) and vmax > vmin else 1
+                vmin = vmin if np.isfinite(vmin) else 0
+                front = colormaps[cmap]((mean - vmin)/span)[..., :3]
+            elif self.channels:
+                front = np.moveaxis(self.colors[:3] / hit, 0, -1)
+            else:
+                front = np.array(to_rgb(color))
+
+            back = np.array(to_rgb(background))
+            return np.clip(back + (front - back) * alpha[..., None], 0, 1)
+
+    def stamp(self, image: np.ndarray, points: np.ndarray, color: str = 'b', radius: int = 6)->np.ndarray:
+        """
+        Painting a few filled circles, such as the corners of an n-gon, on top of an image.
+        Arguments:
+            image(np.ndarray):
+                image returned by image()
+            points(np.ndarray):
+                centres of the circles, shape (N, 2)
+            color(str):
+                color of the circles
+            radius(int):
+                radius of the circles in pixels
+        returns:
+            np.ndarray:
+                the same image
+        """
+        xmin, xmax, ymin, ymax = self.extent
+        rows, cols = np.ogrid[:self.height, :self.width]
+        for x, y in np.asarray(points):
+            col = (x - xmin) * self.width/(xmax - xmin)
+            row = (ymax - y) * self.height/(ymax - ymin)
+            image[(cols + 0.5 - col)**2 + (rows + 0.5 - row)**2 <= radius**2] = to_rgb(color)
+        return image
+
+    def save(self, outfile: str, image: np.ndarray = None, **kwargs)->None:
+        """
+        Writing the image straight to a file, without going through a matplotlib figure.
+        Arguments:
+            outfile(str):
+                Name of the file
+            image(np.ndarray):
+                image to write, image(**kwargs) if None
+        """
+        if image is None:
+            image = self.image(**kwargs)
+        with phase('raster.save', self.width*self.height):
+            matplotlib.image.imsave(outfile, image)
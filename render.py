@@ -0,0 +1,259 @@
+"""
+Batch rendering of a gallery from a manifest of jobs.
+
+    python render.py gallery.json [--workers 4] [--force] [--dry-run]
+
+The manifest is JSON or TOML with a list of jobs, and optionally defaults shared by all jobs:
+
+    {"defaults": {"steps": 100000, "width": 1000, "seed": 0},
+     "jobs": [{"generator": "chaos_game", "n": 3, "r": 0.5, "output": "figures/chaos1.png"},
+              {"generator": "variation", "n": 4, "r": 0.3, "variation": "swirl", "color": true,
+               "output": "figures/swirl.png"}]}
+
+Generators are chaos_game, fern, variation and flame. The images are written straight from
+DensityRaster, without pyplot. A job is skipped when its output exists and was made from the
+same parameters and the same version of the code, which is recorded in <manifest>.state.json.
+"""
+import argparse
+import hashlib
+import json
+import os
+import sys
+import numpy as np
+
+from parallel import run_tasks
+
+# Parameters of a job that are not given in the manifest
+DEFAULTS = {
+    'n': 3,
+    'r': 0.5,
+    'steps': 100000,
+    'color': False,
+    'cmap': 'rainbow',
+    'ink': 'black',
+    'background': 'white',
+    'width': 1000,
+    'seed': 0,
+    'variation': 'linear',
+    'variations': {'linear': 1.0},
+}
+
+GENERATORS = ('chaos_game', 'fern', 'variation', 'flame')
+
+# Modules whose source is part of the code version of a render
+SOURCES = ('chaos_game.py', 'fern.py', 'flame.py', 'variations.py', 'raster.py', 'kernels.py',
+           'parallel.py', 'cache.py', 'store.py', 'trajectory.py', 'rules.py', 'instrument.py',
+           'render.py')
+
+
+def load_manifest(path: str)->list:
+    """
+    Reading the jobs of a JSON or TOML manifest, with the defaults filled in.
+    Relative output paths are taken relative to the folder of the manifest.
+    Arguments:
+        path(str):
+            manifest file, .toml for TOML and JSON otherwise
+    returns:
+        list:
+            one dict of parameters per job
+    """
+    if path.endswith('.toml'):
+        import tomllib
+        with open(path, 'rb') as f:
+            manifest = tomllib.load(f)
+    else:
+        with open(path) as f:
+            manifest = json.load(f)
+    if isinstance(manifest, list):
+        manifest = {'jobs': manifest}
+
+    defaults = dict(DEFAULTS, **manifest.get('defaults', {}))
+    folder = os.path.dirname(os.path.abspath(path))
+    jobs = []
+    for job in manifest['jobs']:
+        job = dict(defaults, **job)
+        if job.get('generator') not in GENERATORS or 'output' not in job:
+            raise ValueError()
+        job['output'] = os.path.join(folder, job['output'])
+        jobs.append(job)
+    return jobs
+
+
+def code_version()->str:
+    """
+    Hash of the source of the rendering modules, so a change in the code invalidates the outputs.
+    returns:
+        str:
+            hex digest
+    """
+    digest = hashlib.sha1()
+    folder = os.path.dirname(os.path.abspath(__file__))
+    for name in SOURCES:
+        with open(os.path.join(folder, name), 'rb') as f:
+            digest.update(f.read())
+    return digest.hexdigest()
+
+
+def job_key(job: dict, version: str)->str:
+    """
+    Hash of the parameters of a job and the code version.
+    Arguments:
+        job(dict):
+            parameters of the job
+        version(str):
+            code version, see code_version
+    returns:
+        str:
+            hex digest
+    """
+    text = json.dumps(job, sort_keys=True) + version
+    return hashlib.sha1(text.encode()).hexdigest()
+
+
+def render_job(job: dict)->None:
+    """
+    Rendering one job to its output file.
+    Arguments:
+        job(dict):
+            parameters of the job, with the defaults filled in
+    """
+    from chaos_game import ChaosGame
+    from raster import DensityRaster
+
+    rng = np.random.default_rng(job['seed'])
+    steps, width = job['steps'], job['width']
+    folder = os.path.dirname(job['output'])
+    if folder:
+        os.makedirs(folder, exist_ok=True)
+
+    if job['generator'] == 'chaos_game':
+        game = ChaosGame(job['n'], float(job['r']), seed=job['seed'])
+        raster = game.raster(bool(job['color']), steps, chunk_size=2**16, width=width)
+        image = raster.image(cmap=job['cmap'], color=job['ink'], background=job['background'])
+        raster.save(job['output'], raster.stamp(image, game._generate_ngon()))
+
+    elif job['generator'] == 'fern':
+        from fern import barnsley
+        x_list = barnsley.iterate(steps, rng=rng)
+        raster = DensityRaster.fit(x_list, width)
+        raster.add(x_list)
+        raster.save(job['output'], color=job['ink'], background=job['background'])
+
+    elif job['generator'] == 'variation':
+        from variations import Variations
+        game = ChaosGame(job['n'], float(job['r']))
+        run = game.iterate(steps, rng=rng, color='gradient' if job['color'] else None)
+        u, v = Variations.batch(run.x, -run.y, [job['variation']])[job['variation']]
+        finite = np.isfinite(u) & np.isfinite(v)
+        points = np.column_stack([u[finite], -v[finite]])
+        colors = game.colors[finite] if job['color'] else None
+        raster = DensityRaster.fit(points, width, channels=int(bool(job['color'])))
+        raster.add(points, colors)
+        raster.save(job['output'], cmap=job['cmap'], color=job['ink'], background=job['background'])
+
+    else:
+        from flame import Flame
+        flame = Flame.from_chaos_game(ChaosGame(job['n'], float(job['r'])), job['variations'])
+        raster = flame.render(steps, width=width, rng=rng)
+        raster.save(job['output'], cmap=job['cmap'], background=job['background'])
+
+
+def _render_task(job: dict)->str:
+    """
+    Running render_job in a worker process, returning the error instead of raising it so the
+    other jobs are still recorded.
+    Arguments:
+        job(dict):
+            parameters of the job
+    returns:
+        str:
+            None on success, the error message otherwise
+    """
+    try:
+        render_job(job)
+    except Exception as error:
+        return f'{type(error).__name__}: {error}'
+    return None
+
+
+def render_manifest(path: str, workers: int = None, force: bool = False, dry_run: bool = False,
+                    out=sys.stdout)->dict:
+    """
+    Rendering the jobs of a manifest that are not up to date.
+    Arguments:
+        path(str):
+            manifest file
+        workers(int):
+            number of processes, all cores if None
+        force(bool):
+            render every job, even the up to date ones
+        dry_run(bool):
+            only report which jobs would be rendered
+        out(file):
+            where progress is printed, nothing is printed if None
+    returns:
+        dict:
+            'rendered', 'skipped' and 'failed' lists of output paths
+    """
+    jobs = load_manifest(path)
+    state_path = path + '.state.json'
+    state = {}
+    if os.path.exists(state_path):
+        with open(state_path) as f:
+            state = json.load(f)
+
+    version = code_version()
+    keys = [job_key(job, version) for job in jobs]
+    todo = [i for i, (job, key) in enumerate(zip(jobs, keys))
+            if force or state.get(job['output']) != key or not os.path.exists(job['output'])]
+    result = {'rendered': [], 'skipped': [jobs[i]['output'] for i in range(len(jobs)) if i not in todo],
+              'failed': []}
+    if dry_run:
+        result['rendered'] = [jobs[i]['output'] for i in todo]
+        return result
+
+    errors = run_tasks(_render_task, [(jobs[i],) for i in todo], workers)
+    for i, error in zip(todo, errors):
+        output = jobs[i]['output']
+        if error is None:
+            state[output] = keys[i]
+            result['rendered'].append(output)
+        else:
+            state.pop(output, None)
+            result['failed'].append(output)
+        if out is not None:
+            print(('rendered ' + output) if error is None else f'failed {output}: {error}', file=out)
+
+    with open(state_path, 'w') as f:
+        json.dump(state, f, indent=2, sort_keys=True)
+    return result
+
+
+def main(argv: list = None)->int:
+    """
+    Command line entry point.
+    Arguments:
+        argv(list):
+            command line arguments, sys.argv[1:] if None
+    returns:
+        int:
+            exit status, 1 if a job failed
+    """
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('manifest', help='JSON or TOML manifest of render jobs')
+    parser.add_argument('--workers', type=int, default=None, help='number of processes, all cores by default')
+    parser.add_argument('--force', action='store_true', help='render up to date jobs too')
+    parser.add_argument('--dry-run', action='store_true', help='only list the jobs that would be rendered')
+    args = parser.parse_args(argv)
+
+    result = render_manifest(args.manifest, args.workers, args.force, args.dry_run)
+    if args.dry_run:
+        for output in result['rendered']:
+            print('would render ' + output)
+    print(f"{len(result['rendered'])} rendered, {len(result['skipped'])} up to date, "
+          f"{len(result['failed'])} failed")
+    return int(bool(result['failed']))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
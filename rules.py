@@ -0,0 +1,333 @@
+import numpy as np
+from parallel import _integers
+from kernels import markov_walk
+
+# Number of steps of a block of _markov_scan, the blocks are walked in parallel
+_SCAN_BLOCK = 128
+# Largest number of (block, walker, state) maps composed at once by _markov_scan
+_SCAN_SIZE = 2**22
+# Largest number of (bucket, state, corner) entries of the tables of _markov_scan, rules with
+# more are sampled with kernels.markov_walk
+_MAX_MAPS = 2**24
+# Number of steps of a block of _markov_coupled
+_COUPLE_BLOCK = 4096
+
+
+def _compose_scan(maps: np.ndarray)->np.ndarray:
+    """
+    Running composition of state maps along the first axis, G[t] = maps[t] o ... o maps[0],
+    by recursive doubling: after the pass with distance d, G[t] holds the composition of the
+    last 2*d maps up to t, so log2(T) array operations replace T steps.
+    Arguments:
+        maps(np.ndarray):
+            maps[t, ..., s] is the state after step t from state s before it
+    returns:
+        np.ndarray:
+            the composed maps, same shape
+    """
+    G = maps.copy()
+    d = 1
+    while d < len(G):
+        G[d:] = np.take_along_axis(G[d:], G[:-d], axis=-1)
+        d *= 2
+    return G
+
+
+def _markov_scan(state: np.ndarray, bucket: np.ndarray, maps: np.ndarray)->tuple:
+    """
+    Sampling the states of a Markov rule for a block of steps with a loop over a short block
+    instead of every step. The uniform number of a step turns it into a map from every state
+    to the next one, given by its bucket. The steps are cut into blocks of _SCAN_BLOCK steps
+    that are walked side by side: a first pass composes the maps of every block for all the
+    states at once, the states before the blocks are then found by chaining these compositions
+    with _compose_scan, and a second pass walks every block from its own state. The result is
+    the same as stepping the chain one step at a time.
+    Arguments:
+        state(np.ndarray):
+            state of every walker before the block, shape (walkers,)
+        bucket(np.ndarray):
+            bucket of the uniform number of every step, shape (steps, walkers)
+        maps(np.ndarray):
+            next state for every bucket and state, shape (buckets, states)
+    returns:
+        np.ndarray:
+            state after every step, shape (steps, walkers)
+    """
+    T, W = bucket.shape
+    S = maps.shape[1]
+    flat = maps.ravel()
+    B = min(_SCAN_BLOCK, T)
+    blocks = -(-T // B)
+    padded = np.zeros((blocks*B, W), dtype=np.intp)
+    padded[:T] = bucket
+    rows = (padded*S).reshape(blocks, B, W)
+
+    before = np.empty((blocks, W), dtype=np.intp)
+    before[0] = state
+    if blocks > 1:
+        total = np.broadcast_to(np.arange(S), (blocks - 1, W, S)).copy()
+        for i in range(B):
+            total = np.take(flat, rows[:-1, i, :, None] + total)
+        chained = _compose_scan(total)
+        start = np.broadcast_to(state[:, None], (blocks - 1, W, 1))
+        before[1:] = np.take_along_axis(chained, start, axis=-1)[..., 0]
+
+    states = np.empty((blocks, B, W), dtype=np.intp)
+    x = before
+    for i in range(B):
+        x = states[:, i] = np.take(flat, rows[:, i] + x)
+    return states.reshape(-1, W)[:T]
+
+
+def _markov_coupled(state: np.ndarray, u: np.ndarray, cum: np.ndarray, n: int)->np.ndarray:
+    """
+    Sampling the states of a Markov rule without the tables of _markov_scan. The steps are
+    cut into blocks of _COUPLE_BLOCK steps that are walked side by side, every block but the
+    first from state 0. Walks with the same uniform numbers usually meet after a few steps
+    and agree from then on, so the last state of a block rarely depends on where it started.
+    Every block is then walked again from the last state of the block before it, all blocks
+    side by side, each only until it meets its first walk; a block that does not meet it
+    changes its last state and the block after it is walked again. The result is the same
+    as stepping the chain one step at a time.
+    Arguments:
+        state(np.ndarray):
+            state of every walker before the block, shape (walkers,)
+        u(np.ndarray):
+            uniform numbers, shape (steps, walkers)
+        cum(np.ndarray):
+            cumulative rows of the rule, shape (states, n)
+        n(int):
+            number of corners
+    returns:
+        np.ndarray:
+            state after every step, shape (steps, walkers)
+    """
+    T, W = u.shape
+    keep = len(cum) // n
+    rows = cum[:, :-1]
+    B = min(_COUPLE_BLOCK, T)
+    blocks = -(-T // B)
+    padded = np.zeros((blocks*B, W))
+    padded[:T] = u
+    padded = padded.reshape(blocks, B, W, 1)
+
+    states = np.empty((blocks, B, W), dtype=np.intp)
+    x = np.zeros((blocks, W), dtype=np.intp)
+    x[0] = state
+    for i in range(B):
+        x = states[:, i] = (x % keep)*n + (rows[x] <= padded[:, i]).sum(axis=-1)
+
+    redo = np.arange(1, blocks)
+    while len(redo):
+        active = redo
+        x = states[active - 1, -1]
+        for i in range(B):
+            x = (x % keep)*n + (rows[x] <= padded[active, i]).sum(axis=-1)
+            met = (x == states[active, i]).all(axis=1)
+            states[active, i] = x
+            active, x = active[~met], x[~met]
+            if len(active) == 0:
+                break
+        redo = active[active + 1 < blocks] + 1
+    return states.reshape(-1, W)[:T]
+
+
+class VertexRule:
+    def __init__(self, matrix: np.ndarray, order: int = 1)->None:
+        """
+        Constructor for VertexRule, a corner choice that depends on the last picks. The state
+        is the last `order` picks p_1 ... p_order, oldest first, encoded as the number
+        p_1*n**(order-1) + ... + p_order, and row s of the matrix holds the probabilities of
+        the next pick in state s. The picks are made from cumulative rows: the pick of a
+        uniform number u is the number of entries of the row that are <= u.
+        Arguments:
+            matrix(np.ndarray):
+                nonnegative weights with shape (n**order, n), every row is normalized
+            order(int):
+                number of earlier picks the choice depends on
+        """
+        matrix = np.asarray(matrix, dtype=float)
+        if order < 1 or matrix.ndim != 2:
+            raise ValueError()
+        n = matrix.shape[1]
+        if matrix.shape[0] != n**order or np.any(matrix < 0) or np.any(matrix.sum(axis=1) <= 0):
+            raise ValueError()
+        self.n = n
+        self.order = order
+        self.matrix = matrix / matrix.sum(axis=1, keepdims=True)
+        self.cum = self._cumulative(self.matrix)
+        # Tables of _markov_scan, built by _tables on the first sample that needs them
+        self._breaks = None
+        self._maps = None
+
+        # A rule on the offset from the last pick only is sampled with a cumulative sum
+        self._offsets = None
+        rolled = np.array([np.roll(self.matrix[0], s) for s in range(n)])
+        if order == 1 and np.allclose(rolled, self.matrix, rtol=1e-12, atol=0):
+            self._offsets = self.cum[0]
+
+    @staticmethod
+    def _cumulative(matrix: np.ndarray)->np.ndarray:
+        """
+        Cumulative rows, set to exactly 1 from the last possible pick on so that no uniform
+        number in [0, 1) picks a corner of probability 0.
+        Arguments:
+            matrix(np.ndarray):
+                normalized transition probabilities
+        returns:
+            np.ndarray:
+                cumulative probabilities, same shape
+        """
+        cum = np.cumsum(matrix, axis=1)
+        last = matrix.shape[1] - 1 - np.argmax(matrix[:, ::-1] > 0, axis=1)
+        cum[np.arange(matrix.shape[1]) >= last[:, None]] = 1.0
+        return cum
+
+    @classmethod
+    def from_function(cls, n: int, allowed, order: int = 1, weights: np.ndarray = None):
+        """
+        Creating a rule from a test of the next pick.
+        Arguments:
+            n(int):
+                number of corners
+            allowed(callable):
+                allowed(previous, j) tells if corner j may follow the tuple of the last
+                `order` picks, oldest first
+            order(int):
+                number of earlier picks the choice depends on
+            weights(np.ndarray):
+                weight of every corner among the allowed ones, equal if None
+        returns:
+            VertexRule:
+                the rule
+        """
+        weights = np.ones(n) if weights is None else np.asarray(weights, dtype=float)
+        matrix = np.zeros((n**order, n))
+        for s in range(n**order):
+            previous = tuple(s // n**(order - 1 - i) % n for i in range(order))
+            for j in range(n):
+                if allowed(previous, j):
+                    matrix[s, j] = weights[j]
+        return cls(matrix, order)
+
+    @classmethod
+    def forbid_offsets(cls, n: int, offsets: list, weights: np.ndarray = None):
+        """
+        Rule forbidding the corners at some offsets from the last pick, such as [0] for never
+        the same corner twice or [1, -1] for never a neighbour of the last corner.
+        Arguments:
+            n(int):
+                number of corners
+            offsets(list):
+                forbidden values of (next - last) modulo n
+            weights(np.ndarray):
+                weight of every corner among the allowed ones, equal if None
+        returns:
+            VertexRule:
+                the rule
+        """
+        forbidden = {k % n for k in offsets}
+        return cls.from_function(n, lambda previous, j: (j - previous[0]) % n not in forbidden,
+                                 weights=weights)
+
+    @classmethod
+    def no_repeat(cls, n: int):
+        """
+        Rule where a corner is never picked twice in a row.
+        Arguments:
+            n(int):
+                number of corners
+        returns:
+            VertexRule:
+                the rule
+        """
+        return cls.forbid_offsets(n, [0])
+
+    @classmethod
+    def no_neighbour(cls, n: int):
+        """
+        Rule where the next corner is never a neighbour of the last one.
+        Arguments:
+            n(int):
+                number of corners
+        returns:
+            VertexRule:
+                the rule
+        """
+        return cls.forbid_offsets(n, [1, -1])
+
+    def _tables(self)->bool:
+        """
+        Building the tables of _markov_scan. Uniform numbers between two consecutive entries
+        of the rows pick the same corner in every state, so the bucket of a number gives the
+        pick and the next state of all states. There are up to n**order*(n-1) buckets, so the
+        tables are only built when they have at most _MAX_MAPS entries, larger rules are
+        sampled with _markov_coupled.
+        returns:
+            bool:
+                True if the tables are available
+        """
+        if self._maps is None:
+            breaks = np.unique(self.cum[:, :-1])
+            if (len(breaks) + 1)*self.cum.size > _MAX_MAPS:
+                return False
+            lower = np.concatenate(([-1.0], breaks))
+            picks = (self.cum[None, :, :-1] <= lower[:, None, None]).sum(axis=-1)
+            self._breaks = breaks
+            self._maps = (np.arange(len(self.cum)) % (len(self.cum) // self.n))*self.n + picks
+        return True
+
+    def initial(self, rng, walkers: int = 1)->np.ndarray:
+        """
+        Drawing a random state for every walker.
+        Arguments:
+            rng(np.random.Generator):
+                random generator, the global np.random state if None
+            walkers(int):
+                number of walkers
+        returns:
+            np.ndarray:
+                states, shape (walkers,)
+        """
+        return np.asarray(_integers(rng, len(self.matrix), walkers), dtype=np.intp).reshape(walkers)
+
+    def sample(self, state: np.ndarray, u: np.ndarray, fast: bool = False)->np.ndarray:
+        """
+        Picking corners for a block of steps from uniform numbers, the states of the walkers
+        being carried from one block to the next. Rules on the offset from the last pick add
+        up offsets drawn independently, the others use kernels.markov_walk when fast is True,
+        _markov_scan otherwise and _markov_coupled when the tables of _markov_scan would be
+        too large, which all give the same picks.
+        Arguments:
+            state(np.ndarray):
+                state of every walker, shape (walkers,), updated in place
+            u(np.ndarray):
+                uniform numbers, shape (steps,) for one walker or (steps, walkers)
+            fast(bool):
+                use the compiled kernel
+        returns:
+            np.ndarray:
+                picked corners, same shape as u
+        """
+        steps = u.reshape(len(u), -1)
+        if len(steps) == 0:
+            return np.zeros(u.shape, dtype=np.intp)
+        if self._offsets is not None:
+            offsets = np.searchsorted(self._offsets, steps, side='right')
+            picks = (state + np.cumsum(offsets, axis=0)) % self.n
+            state[:] = picks[-1]
+        elif fast:
+            picks = markov_walk(state, steps, self.cum, self.n, np.empty(steps.shape, dtype=np.intp))
+        elif not self._tables():
+            states = _markov_coupled(state, steps, self.cum, self.n)
+            picks = states % self.n
+            state[:] = states[-1]
+        else:
+            bucket = np.searchsorted(self._breaks, steps, side='right')
+            picks = np.empty(steps.shape, dtype=np.intp)
+            rows = _SCAN_BLOCK*max(1, _SCAN_SIZE // (_SCAN_BLOCK*steps.shape[1]*len(self.cum)))
+            for start in range(0, len(steps), rows):
+                states = _markov_scan(state, bucket[start:start + rows], self._maps)
+                picks[start:start + rows] = states % self.n
+                state[:] = states[-1]
+        return picks.reshape(u.shape)
@@ -0,0 +1,179 @@
+import os
+import numpy as np
+from raster import DensityRaster
+from instrument import phase
+
+
+class PointStore:
+    def __init__(self, directory: str, X: np.ndarray, Indicies: np.ndarray, colors: np.ndarray = None)->None:
+        """
+        Constructor for PointStore, points and corner indices kept in memory-mapped .npy files
+        (points.npy, indices.npy and colors.npy) in one directory, so the size of a trajectory
+        is limited by disk instead of RAM. Use create or open instead of calling it directly.
+        Arguments:
+            directory(str):
+                folder of the files
+            X(np.ndarray):
+                memory-mapped points, shape (N, 2)
+            Indicies(np.ndarray):
+                memory-mapped corner indices, shape (steps,) or (steps, walkers)
+            colors(np.ndarray):
+                memory-mapped colors, or None
+        """
+        self.directory = directory
+        self.X = X
+        self.Indicies = Indicies
+        self.colors = colors
+
+    @classmethod
+    def create(cls, directory: str, points: int, index_shape: tuple, n: int, color: str = None):
+        """
+        Creating empty files for a trajectory. The corner indices use the smallest unsigned
+        integer type that holds n - 1.
+        Arguments:
+            directory(str):
+                folder of the files, created if missing
+            points(int):
+                number of points
+            index_shape(tuple):
+                shape of the corner indices
+            n(int):
+                number of corners
+            color(str):
+                None, 'gradient' or 'rgb', the kind of colors stored with the points
+        returns:
+            PointStore:
+                store open for writing
+        """
+        os.makedirs(directory, exist_ok=True)
+        X = np.lib.format.open_memmap(os.path.join(directory, 'points.npy'), mode='w+',
+                                      dtype=np.float64, shape=(points, 2))
+        Indicies = np.lib.format.open_memmap(os.path.join(directory, 'indices.npy'), mode='w+',
+                                             dtype=np.min_scalar_type(max(n - 1, 0)), shape=index_shape)
+        colors = None
+        path = os.path.join(directory, 'colors.npy')
+        if color is not None:
+            shape = (points, 3) if color == 'rgb' else (points,)
+            colors = np.lib.format.open_memmap(path, mode='w+', dtype=np.float64, shape=shape)
+        elif os.path.exists(path):
+            os.remove(path)
+        return cls(directory, X, Indicies, colors)
+
+    @classmethod
+    def open(cls, directory: str, mode: str = 'r'):
+        """
+        Opening the files of a stored trajectory without reading them.
+        Arguments:
+            directory(str):
+                folder of the files
+            mode(str):
+                'r' for read-only or 'r+' to modify the files
+        returns:
+            PointStore:
+                the store
+        """
+        def load(name):
+            path = os.path.join(directory, name)
+            return np.load(path, mmap_mode=mode) if os.path.exists(path) else None
+        X = load('points.npy')
+        if X is None:
+            raise FileNotFoundError(os.path.join(directory, 'points.npy'))
+        return cls(directory, X, load('indices.npy'), load('colors.npy'))
+
+    def __len__(self)->int:
+        return len(self.X)
+
+    @property
+    def walkers(self)->int:
+        """
+        Number of walkers, the points are stored step by step.
+        """
+        return 1 if self.Indicies.ndim == 1 else self.Indicies.shape[1]
+
+    def flush(self)->None:
+        """
+        Writing the changes of the memory maps to disk.
+        """
+        for a in (self.X, self.Indicies, self.colors):
+            if isinstance(a, np.memmap):
+                a.flush()
+
+    def chunks(self, chunk_size: int = 2**20):
+        """
+        Reading the points in slices. The slices are views of the memory maps, so only the
+        pages that are used are read from disk.
+        Arguments:
+            chunk_size(int):
+                number of points in every slice, rounded down to whole steps
+        yields:
+            tuple:
+                points, corner indices and colors (or None) of the slice
+        """
+        walkers = self.walkers
+        steps = max(1, chunk_size // walkers)
+        for start in range(0, len(self.Indicies), steps):
+            rows = slice(start*walkers, (start + steps)*walkers)
+            colors = None if self.colors is None else self.colors[rows]
+            yield self.X[rows], self.Indicies[start:start + steps], colors
+
+    def bounds(self, chunk_size: int = 2**20)->np.ndarray:
+        """
+        Smallest and largest coordinates of the points, found one slice at a time.
+        Arguments:
+            chunk_size(int):
+                number of points read at a time
+        returns:
+            np.ndarray:
+                [[xmin, ymin], [xmax, ymax]]
+        """
+        low = np.full(2, np.inf)
+        high = np.full(2, -np.inf)
+        for points, _, _ in self.chunks(chunk_size):
+            low = np.minimum(low, points.min(axis=0))
+            high = np.maximum(high, points.max(axis=0))
+        return np.array([low, high])
+
+    def corner_counts(self, n: int = None, chunk_size: int = 2**20)->np.ndarray:
+        """
+        Number of times every corner was picked, counted one slice at a time.
+        Arguments:
+            n(int):
+                number of corners, the largest stored index + 1 if None
+            chunk_size(int):
+                number of points read at a time
+        returns:
+            np.ndarray:
+                count of every corner
+        """
+        counts = np.zeros(0 if n is None else n, dtype=np.int64)
+        for _, Indicies, _ in self.chunks(chunk_size):
+            part = np.bincount(Indicies.reshape(-1), minlength=len(counts))
+            part[:len(counts)] += counts
+            counts = part
+        return counts
+
+    def raster(self, raster: DensityRaster = None, width: int = 1000, color: bool = False,
+               chunk_size: int = 2**20)->DensityRaster:
+        """
+        Binning the stored points into a DensityRaster one slice at a time.
+        Arguments:
+            raster(DensityRaster):
+                raster to add to, one covering all the points if None
+            width(int):
+                number of pixel columns of a new raster
+            color(bool):
+                add the stored colors or not
+            chunk_size(int):
+                number of points read at a time
+        returns:
+            DensityRaster:
+                the raster
+        """
+        color = color and self.colors is not None
+        if raster is None:
+            channels = 0 if not color else (3 if self.colors.ndim == 2 else 1)
+            raster = DensityRaster.fit(self.bounds(chunk_size), width, channels)
+        with phase('store.raster', len(self)):
+            for points, _, colors in self.chunks(chunk_size):
+                raster.add(points, colors if color else None)
+        return raster
@@ -0,0 +1,34 @@
+import numpy as np
+from adaptive import render_adaptive
+from chaos_game import ChaosGame
+from raster import DensityRaster
+
+def _uniform(rng, size=2**14):
+    while True:
+        yield rng.random((size, 2)), None
+
+def test_converges_sooner_at_lower_resolution():
+    reports = []
+    for width in (20, 80):
+        raster = DensityRaster((0, 1, 0, 1), width)
+        reports.append(render_adaptive(_uniform(np.random.default_rng(0)), raster, max_points=10**8))
+        assert reports[-1]["converged"] and reports[-1]["reason"] == "converged"
+        assert raster.counts.sum() == reports[-1]["points"]
+    assert reports[0]["points"] < reports[1]["points"]
+
+def test_point_budget():
+    raster = DensityRaster((0, 1, 0, 1), 500)
+    report = render_adaptive(_uniform(np.random.default_rng(1), 1000), raster, tol=1e-6, max_points=12345)
+    assert report["reason"] == "points" and report["points"] == 12345 == raster.counts.sum()
+
+def test_time_budget_and_exhausted_stream():
+    raster = DensityRaster((0, 1, 0, 1), 500)
+    assert render_adaptive(_uniform(np.random.default_rng(2)), raster, tol=1e-6, max_seconds=0.05)["reason"] == "time"
+    report = render_adaptive(iter([(np.random.default_rng(3).random((10, 2)), None)]), raster)
+    assert report["reason"] == "exhausted" and report["points"] == 10
+
+def test_chaos_game_raster_adaptive():
+    raster, report = ChaosGame(3, seed=4).raster_adaptive(color=True, width=200)
+    assert report["converged"]
+    assert raster.counts.sum() == report["points"]
+    assert raster.channels == 1
@@ -0,0 +1,69 @@
+import os
+import stat
+import numpy as np
+import pytest
+import animate
+from animate import PngSequence, FfmpegPipe, open_writer, write_animation
+from chaos_game import ChaosGame
+from raster import DensityRaster
+
+
+class Frames:
+    def __init__(self):
+        self.images = []
+        self.closed = False
+
+    def write(self, image):
+        self.images.append(image.copy())
+
+    def close(self):
+        self.closed = True
+
+
+def _chunks(points, size):
+    for start in range(0, len(points), size):
+        yield points[start:start + size], None
+
+@pytest.mark.parametrize("every, chunk", [(1000, 700), (1000, 2500), (1500, 1500)])
+
+def test_frames_match_prefix_images(every, chunk):
+    points = ChaosGame(3).iterate(4505, rng=np.random.default_rng(0)).X
+    raster = DensityRaster.fit(points, width=40)
+    frames = Frames()
+    report = write_animation(_chunks(points, chunk), raster, frames, every)
+    assert frames.closed and report == {'points': len(points), 'frames': -(-len(points) // every)}
+    for k, image in enumerate(frames.images):
+        expected = DensityRaster(raster.extent, 40, raster.height)
+        expected.add(points[:min((k + 1)*every, len(points))])
+        assert np.array_equal(image, expected.image())
+
+def test_max_points():
+    points = np.random.default_rng(1).random((5000, 2))
+    frames = Frames()
+    report = write_animation(_chunks(points, 800), DensityRaster((0, 1, 0, 1), 20), frames, 1000,
+                             max_points=2500)
+    assert report == {'points': 2500, 'frames': 3}
+
+def test_png_sequence(tmp_path):
+    report = ChaosGame(4, 0.4).animate(str(tmp_path / "frames" / "{:03d}.png"), steps=3000, every=1000,
+                                       color=True, width=60)
+    assert report['frames'] == 3
+    assert sorted(os.listdir(tmp_path / "frames")) == ["000.png", "001.png", "002.png"]
+
+def test_video_without_ffmpeg_writes_pngs(tmp_path, monkeypatch):
+    monkeypatch.setattr(animate.shutil, "which", lambda name: None)
+    writer = open_writer(str(tmp_path / "build.mp4"), 30, 20)
+    assert isinstance(writer, PngSequence) and writer.pattern.endswith("build_{:05d}.png")
+    with pytest.raises(ValueError):
+        open_writer(str(tmp_path / "build.txt"), 30, 20)
+
+def test_ffmpeg_pipe_gets_raw_frames(tmp_path, monkeypatch):
+    fake = tmp_path / "ffmpeg"
+    fake.write_text('#!/bin/sh\nfor last; do :; done\ncat > "$last"\n')
+    fake.chmod(fake.stat().st_mode | stat.S_IEXEC)
+    monkeypatch.setattr(animate.shutil, "which", lambda name: str(fake))
+    writer = open_writer(str(tmp_path / "build.mp4"), 30, 20)
+    assert isinstance(writer, FfmpegPipe)
+    points = np.random.default_rng(2).random((3000, 2))
+    write_animation(_chunks(points, 500), DensityRaster((0, 1, 0, 1), 30, 20), writer, 1000)
+    assert os.path.getsize(tmp_path / "build.mp4") == 3 * 20*30*3
@@ -0,0 +1,14 @@
+import pytest
+import io
+from benchmark import run, compare
+
+def test_run_reports_every_size():
+    results = run(["chaos_game.iterate", "variations.swirl"], sizes=[100, 1000], repeat=1, out=io.StringIO())
+    assert set(results["chaos_game.iterate"]) == {"100", "1000"}
+    assert results["variations.swirl"]["1000"]["points_per_s"] > 0
+
+@pytest.mark.parametrize("seconds, peak, expected", [(0.011, 1000, 0), (0.02, 1000, 1), (0.011, 10**6, 1)])
+def test_compare_flags_regressions(seconds, peak, expected):
+    baseline = {"case": {"1000": {"seconds": 0.01, "points_per_s": 1e5, "peak_bytes": 1000}}}
+    results = {"case": {"1000": {"seconds": seconds, "points_per_s": 1000/seconds, "peak_bytes": peak}}}
+    assert len(compare(results, baseline, threshold=0.25)) == expected
@@ -0,0 +1,24 @@
+import numpy as np
+from cache import TrajectoryCache
+
+def test_memory_tier_evicts_least_recently_used():
+    cache = TrajectoryCache(max_bytes=3*800)
+    for key in range(3):
+        cache.put(key, (np.zeros(100),))
+    cache.get(0)
+    cache.put(3, (np.zeros(100),))
+    assert cache.get(1) is None
+    assert cache.get(0) is not None and cache.get(3) is not None
+    assert cache.nbytes <= cache.max_bytes
+
+def test_disk_tier_round_trip(tmp_path):
+    arrays = (np.arange(10.0), np.arange(5))
+    TrajectoryCache(directory=str(tmp_path)).put(('a', 1), arrays)
+    loaded = TrajectoryCache(directory=str(tmp_path)).get(('a', 1))
+    assert all(np.array_equal(a, b) for a, b in zip(arrays, loaded))
+
+def test_disk_tier_size_eviction(tmp_path):
+    cache = TrajectoryCache(directory=str(tmp_path), max_disk_bytes=2000)
+    for key in range(5):
+        cache.put(key, (np.zeros(100),))
+    assert sum(f.stat().st_size for f in tmp_path.iterdir()) <= 2000
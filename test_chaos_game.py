@@ -1,6 +1,11 @@
+import pickle
+import tracemalloc
 import pytest
 import numpy as np
-from chaos_game import ChaosGame
+import chaos_game
+from chaos_game import ChaosGame, AliasTable, sample_polygon, _affine_scan
+from raster import DensityRaster
+from cache import TrajectoryCache
 
 @pytest.mark.parametrize("n, r", [
     (1, 1/2), (4, -1.5), (4, 1.2)])
@@ -24,3 +29,228 @@ def test_iterate(steps, length, discard):
     x, index = figure.iterate(steps, discard=discard)
     assert(len(x) == length)
 
+
+def _loop_iterate(figure, steps, discard):
+    """Reference implementation stepping one point at a time."""
+    corner = figure._generate_ngon()
+    x_list = [figure._starting_point()]
+    Indicies = [0]
+    for i in range(steps-1):
+        j = np.random.randint(low=0, high=figure.n)
+        x_list.append(figure.r * x_list[i] + (1-figure.r) * corner[j])
+        Indicies.append(j)
+    return np.array(x_list[discard:]), np.array(Indicies[discard:])
+
+@pytest.mark.parametrize("n, r", [
+    (3, 1/2), (5, 1/3), (6, 0.9), (4, 0.01)])
+
+def test_iterate_matches_loop(n, r):
+    figure = ChaosGame(n, r)
+    np.random.seed(1)
+    x_loop, index_loop = _loop_iterate(figure, 5000, 5)
+    np.random.seed(1)
+    x, index = figure.iterate(5000, discard=5)
+    assert np.array_equal(index, index_loop)
+    assert np.allclose(x, x_loop, rtol=0, atol=1e-12)
+
+def test_affine_scan_with_ratio_per_step():
+    rng = np.random.default_rng(0)
+    ratio = rng.uniform(0.01, 0.99, 3000)
+    offsets = rng.random((3000, 2))
+    y = np.array([0.3, 0.2])
+    expected = []
+    for k in range(3000):
+        y = ratio[k]*y + offsets[k]
+        expected.append(y)
+    assert np.allclose(_affine_scan([0.3, 0.2], ratio, offsets), expected, rtol=0, atol=1e-12)
+
+@pytest.mark.parametrize("steps, discard, walkers", [
+    (10, 0, 3), (100, 20, 50), (24, 4, 1000)])
+
+def test_iterate_walkers(steps, discard, walkers):
+    figure = ChaosGame(n=4, r=1/3)
+    x, index = figure.iterate(steps, discard=discard, walkers=walkers)
+    assert x.shape == ((steps - discard)*walkers, 2)
+    assert index.shape == (steps - discard, walkers)
+
+    # every walker follows its own trajectory
+    points = x.reshape(steps - discard, walkers, 2)
+    corner = figure._generate_ngon()
+    expected = figure.r * points[:-1] + (1 - figure.r) * corner[index[1:]]
+    assert np.allclose(points[1:], expected)
+
+def test_iter_chunks_matches_iterate():
+    figure = ChaosGame(n=5, r=1/3)
+    np.random.seed(4)
+    x, index = figure.iterate(1000, discard=7)
+    np.random.seed(4)
+    chunks = list(figure.iter_chunks(1000, chunk_size=64, discard=7))
+    assert [len(c[1]) for c in chunks[:-1]] == [64]*(len(chunks) - 1)
+    assert np.array_equal(np.concatenate([c[1] for c in chunks]), index)
+    assert np.allclose(np.concatenate([c[0] for c in chunks]), x)
+
+@pytest.mark.parametrize("workers", [1, 2, 3])
+
+def test_iterate_parallel_independent_of_workers(workers):
+    figure = ChaosGame(n=3)
+    x, index = figure.iterate_parallel(1000, seed=7, workers=workers, tasks=4)
+    x_serial, index_serial = ChaosGame(n=3).iterate_parallel(1000, seed=7, workers=1, tasks=4)
+    assert x.shape == (1000, 2)
+    assert np.array_equal(index, index_serial)
+    assert np.array_equal(x, x_serial)
+
+def test_iterate_parallel_sends_only_the_game(monkeypatch):
+    figure = ChaosGame(n=5, r=0.4)
+    figure.iterate(20000, color='rgb')
+    sent = []
+    original = chaos_game.run_tasks
+    monkeypatch.setattr(chaos_game, "run_tasks", lambda func, arguments, workers: sent.append(arguments)
+                        or original(func, arguments, workers))
+    x, index = figure.iterate_parallel(1000, seed=7, workers=1, tasks=4)
+    assert len(pickle.dumps(sent[0])) < 20000
+    assert figure.colors is None and np.shares_memory(figure.X, x)
+
+def test_iterate_parallel_raster_sums_tasks():
+    figure = ChaosGame(n=4, r=1/3)
+    raster = DensityRaster.fit(figure._generate_ngon(), width=50)
+    figure.iterate_parallel(2000, seed=3, workers=2, tasks=4, raster=raster)
+    x, _ = figure.iterate_parallel(2000, seed=3, workers=1, tasks=4)
+    expected = DensityRaster.fit(figure._generate_ngon(), width=50)
+    expected.add(x)
+    assert np.array_equal(raster.counts, expected.counts)
+
+def test_seeded_iterate_is_cached():
+    figure = ChaosGame(n=5, r=1/3, seed=11)
+    x, index = figure.iterate(500)
+    again = ChaosGame(n=5, r=1/3, seed=11).iterate(500)
+    assert again.data is figure.trajectory.data and again.Indicies is index
+    assert len(figure.gradient_color) == len(x)
+
+    other, _ = ChaosGame(n=5, r=1/3, seed=12).iterate(500)
+    assert not np.array_equal(other, x)
+
+def test_disk_cache_depends_on_code_version(tmp_path, monkeypatch):
+    monkeypatch.setattr(ChaosGame, "cache", TrajectoryCache(directory=str(tmp_path)))
+    ChaosGame(n=5, r=1/3, seed=11).iterate(500)
+    ChaosGame.cache.clear()
+    assert ChaosGame.cache.get(ChaosGame(n=5, r=1/3)._cache_key(500, 5, 1, 11)) is not None
+    monkeypatch.setattr(chaos_game, "_code_version", lambda: "other")
+    assert ChaosGame.cache.get(ChaosGame(n=5, r=1/3)._cache_key(500, 5, 1, 11)) is None
+
+@pytest.mark.parametrize("walkers", [1, 4])
+
+def test_gradient_color_matches_loop(walkers):
+    figure = ChaosGame(n=4, r=1/3)
+    figure.iterate(300, walkers=walkers)
+    index = figure.Indicies.reshape(len(figure.Indicies), -1)
+    C = np.zeros(index.shape)
+    C[0] = index[0]
+    for i in range(len(index) - 1):
+        C[i+1] = (C[i] + index[i+1])/2
+    assert np.allclose(figure.gradient_color, C.reshape(-1))
+
+@pytest.mark.parametrize("color", ["gradient", "rgb"])
+
+def test_iter_chunks_colors_match_iterate(color):
+    figure = ChaosGame(n=5, r=1/3)
+    np.random.seed(2)
+    figure.iterate(1000, discard=10, color=color)
+    np.random.seed(2)
+    chunks = list(figure.iter_chunks(1000, chunk_size=100, discard=10, color=color))
+    assert np.allclose(np.concatenate([c[2] for c in chunks]), figure.colors)
+    expected = figure.palette_color if color == "rgb" else figure.gradient_color
+    assert np.allclose(figure.colors, expected)
+
+def test_alias_table_follows_weights():
+    weights = np.array([5, 1, 0, 2, 2.0])
+    samples = AliasTable(weights).sample(np.random.default_rng(0), 200000)
+    assert np.allclose(np.bincount(samples, minlength=5)/200000, weights/weights.sum(), atol=0.005)
+
+def test_weighted_game_with_ratios_and_corners():
+    corners = np.array([[0, 0], [1, 0], [0.5, 1], [0.2, 0.7]])
+    ratios = np.array([0.5, 0.4, 0.3, 0.6])
+    figure = ChaosGame(4, corners=corners, weights=[0.1, 0.2, 0.3, 0.4], ratios=ratios)
+    x, index = figure.iterate(5000, discard=0, rng=np.random.default_rng(1))
+    expected = ratios[index[1:], None]*x[:-1] + (1 - ratios[index[1:], None])*corners[index[1:]]
+    assert np.allclose(x[1:], expected)
+    assert np.allclose(np.bincount(index[1:])/4999, [0.1, 0.2, 0.3, 0.4], atol=0.03)
+
+@pytest.mark.parametrize("keyword, value", [
+    ("weights", [1, 1, 1]), ("ratios", [0.5, 0.5, 0.5, 1.0]), ("corners", np.zeros((3, 2)))])
+
+def test_invalid_corner_options_raise_value_error(keyword, value):
+    with pytest.raises(ValueError):
+        ChaosGame(4, **{keyword: value})
+
+def _compose(game, digits):
+    corners = game._generate_ngon()[:game.n]
+    ratios = np.full(game.n, game.r) if game.ratios is None else game.ratios
+    x = corners[0]
+    for d in digits[::-1]:
+        x = ratios[d]*x + (1 - ratios[d])*corners[d]
+    return x
+
+@pytest.mark.parametrize("chunk_size", [4, 2**20])
+def test_level_points_follow_their_addresses(chunk_size):
+    game = ChaosGame(4, 0.4, ratios=np.array([0.3, 0.4, 0.5, 0.45]))
+    chunks = list(game.iter_level(4, chunk_size))
+    points = np.concatenate([c[0] for c in chunks])
+    codes = np.concatenate([c[1] for c in chunks])
+    assert len(points) == 4**4 and np.array_equal(codes, np.arange(4**4))
+    digits = game.addresses(codes, 4)
+    assert np.allclose(points, [_compose(game, d) for d in digits])
+
+@pytest.mark.parametrize("n, m", [(3, 5), (5, 3), (10, 2)])
+def test_level_chunks_use_exact_powers(n, m):
+    chunks = ChaosGame(n).iter_level(m + 1, chunk_size=n**m)
+    assert len(next(chunks)[0]) == n**m
+
+def test_level_memory_does_not_grow_with_k():
+    game = ChaosGame(3)
+    peaks = []
+    for k in (6, 9, 12):
+        tracemalloc.start()
+        for _ in game.iter_level(k, chunk_size=27):
+            pass
+        peaks.append(tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+    assert peaks[-1] < 2*peaks[0]
+
+def test_level_colors_are_the_gradient_of_the_address():
+    game = ChaosGame(3)
+    _, codes, colors = next(game.iter_level(5, color=True))
+    digits = game.addresses(codes, 5)
+    assert np.allclose(colors, digits @ (0.5 ** np.arange(1, 6)))
+
+def test_level_dedup_keeps_one_point_per_pixel():
+    game = ChaosGame(3)
+    raster = DensityRaster.fit(game._generate_ngon(), 64)
+    points, codes = game.level(9, raster=raster)
+    raster.add(points)
+    assert raster.counts.max() == 1
+    assert raster.counts.sum() == len(points) < 3**9
+    assert np.array_equal(game.render_level(9, 64, dedup=True).counts > 0, raster.counts > 0)
+
+@pytest.mark.parametrize("corners", [[(0, 0), (4, 0), (4, 1), (0, 3)],
+                                     [(4, 1), (0, 0), (0, 3), (4, 0)],
+                                     [(0, 0), (1, 0), (0.5, 2)]])
+
+def test_sample_polygon_is_uniform(corners):
+    points = sample_polygon(corners, 200000, np.random.default_rng(0))
+    corners = np.array(corners, dtype=float)
+    d = corners - corners.mean(axis=0)
+    ordered = corners[np.argsort(np.arctan2(d[:, 1], d[:, 0]))]
+    ordered = np.vstack((ordered, ordered[:1]))
+    cross = ordered[:-1, 0]*ordered[1:, 1] - ordered[1:, 0]*ordered[:-1, 1]
+    centroid = (ordered[:-1] + ordered[1:]).T @ cross / (3*cross.sum())
+    edge = ordered[1:] - ordered[:-1]
+    side = edge[:, 0]*(points[:, 1:] - ordered[:-1, 1]) - edge[:, 1]*(points[:, :1] - ordered[:-1, 0])
+    assert np.all(side >= -1e-12)
+    assert np.allclose(points.mean(axis=0), centroid, atol=0.01)
+
+def test_sample_polygon_shapes():
+    assert sample_polygon(ChaosGame(5)._generate_ngon()).shape == (2,)
+    line = sample_polygon([(0, 0), (1, 1), (2, 2)], 100, np.random.default_rng(1))
+    assert line.shape == (100, 2) and np.allclose(line[:, 0], line[:, 1])
+    walkers = ChaosGame(6)._starting_point(1000, np.random.default_rng(2))
+    assert walkers.shape == (1000, 2) and np.all(np.hypot(*walkers.T) <= 1)
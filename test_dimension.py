@@ -0,0 +1,41 @@
+import pytest
+import numpy as np
+from chaos_game import ChaosGame
+from fern import IFS, AffineTransform, barnsley
+from flame import Flame
+from dimension import BoxCounter, box_dimension
+
+@pytest.mark.parametrize("levels", [8, 13, 15])
+def test_counts_match_brute_force(levels):
+    points = np.random.default_rng(0).random((20000, 2))
+    counter = BoxCounter((0, 1, 0, 1), levels)
+    for i in range(0, 20000, 3000):
+        counter.add(points[i:i + 3000])
+    for L in (1, 4, levels):
+        boxes = np.unique(np.floor(points * 2**L).astype(int), axis=0)
+        assert counter.counts()[L - 1] == len(boxes)
+
+def test_sierpinski_dimension():
+    game = ChaosGame(3)
+    corners = game._generate_ngon()
+    extent = (corners[:, 0].min(), corners[:, 0].max(), corners[:, 1].min(), corners[:, 1].max())
+    d = box_dimension(game.iter_chunks(10**6, 2**18, rng=np.random.default_rng(1)), extent, levels=10)
+    assert d == pytest.approx(np.log(3)/np.log(2), abs=0.03)
+
+def test_ifs_and_flame_streams():
+    square = IFS([AffineTransform(a=0.5, d=0.5, e=e, f=f) for e in (0, 0.5) for f in (0, 0.5)])
+    assert box_dimension(square.iter_chunks(10**5, rng=np.random.default_rng(2)), (0, 1, 0, 1), levels=8) \
+        == pytest.approx(2, abs=0.02)
+    flame = Flame.from_chaos_game(ChaosGame(3), {"linear": 1.0})
+    d = box_dimension(flame.iter_chunks(10**5, rng=np.random.default_rng(3)), (-1, 1, -1, 1), levels=8)
+    assert d == pytest.approx(np.log(3)/np.log(2), abs=0.05)
+
+def test_fern_dimension():
+    d = box_dimension(barnsley.iter_chunks(10**6, rng=np.random.default_rng(4)), (-2.75, 2.75, -0.25, 10.25),
+                      levels=9)
+    assert np.isfinite(d) and 1.6 < d < 1.9
+
+def test_points_outside_are_ignored():
+    counter = BoxCounter((0, 1, 0, 1), 4)
+    counter.add(np.array([[0.5, 0.5], [2, 0.5], [np.nan, 0.1]]))
+    assert counter.points == 1 and counter.counts()[-1] == 1
@@ -0,0 +1,26 @@
+import pytest
+import numpy as np
+from fern import AffineTransform, IFS, barnsley
+
+def test_affine_transform_uses_original_x():
+    f = AffineTransform(a=1, b=2, c=3, d=4, e=5, f=6)
+    assert f(1, 1) == [8, 13]
+
+def test_ifs_apply_matches_transforms():
+    rng = np.random.default_rng(0)
+    points = rng.random((200, 2))
+    choice = barnsley.choose(rng.random(200))
+    expected = [barnsley.transforms[j](x, y) for (x, y), j in zip(points, choice)]
+    assert np.allclose(barnsley.apply(points, choice), expected)
+
+def test_ifs_choose_follows_probabilities():
+    choice = barnsley.choose(np.random.default_rng(1).random(100000))
+    assert np.allclose(np.bincount(choice, minlength=4)/100000, barnsley.probabilities, atol=0.01)
+
+@pytest.mark.parametrize("N, walkers", [(10, 1), (1000, 64), (12345, 1000)])
+
+def test_ifs_iterate_shape(N, walkers):
+    ifs = IFS([AffineTransform(a=0.5, d=0.5), AffineTransform(a=0.5, d=0.5, e=0.5)])
+    x = ifs.iterate(N, walkers=walkers, rng=np.random.default_rng(2))
+    assert x.shape == (N, 2)
+    assert x.min() >= 0 and x[:, 0].max() <= 1 and np.all(x[:, 1] == 0)
@@ -0,0 +1,42 @@
+import pytest
+import numpy as np
+from chaos_game import ChaosGame
+from fern import AffineTransform
+from flame import Flame
+
+def test_linear_flame_is_the_chaos_game():
+    game = ChaosGame(3)
+    flame = Flame.from_chaos_game(game, {"linear": 1.0})
+    points, colors = flame.iterate(5000, walkers=100, rng=np.random.default_rng(0))
+    corners = game._generate_ngon()[:3]
+    weights = np.linalg.solve(np.vstack([corners.T, np.ones(3)]), np.vstack([points.T, np.ones(5000)]))
+    assert weights.min() > -1e-9
+    assert colors.min() >= 0 and colors.max() <= 1
+
+def test_bad_points_are_restarted_and_skipped():
+    # the first map overflows to infinity after a few steps, those steps come out as nan
+    flame = Flame([AffineTransform(a=1e100, d=1e100), AffineTransform(a=0.5, d=0.5)], {"linear": 1.0})
+    points, _ = flame.iterate(2000, walkers=50, rng=np.random.default_rng(1))
+    assert np.isnan(points).any()
+    assert np.all(np.isfinite(points) | np.isnan(points))
+    raster = flame.render(2000, walkers=50, rng=np.random.default_rng(1))
+    assert raster.counts.sum() <= np.isfinite(points).all(axis=1).sum()
+
+def test_per_map_variations():
+    flame = Flame.from_chaos_game(ChaosGame(4, 0.3), [{"swirl": 1.0}, {"linear": 1.0},
+                                                    {"disc": 0.5, "handkerchief": 0.5}, {"linear": 1.0}])
+    assert flame.weights.shape == (4, 4) and not flame._shared
+    points, _ = flame.iterate(1000, walkers=10, rng=np.random.default_rng(2))
+    assert points.shape == (1000, 2)
+
+def test_render_parallel_does_not_depend_on_workers():
+    flame = Flame.from_chaos_game(ChaosGame(3), {"linear": 0.7, "swirl": 0.3})
+    one = flame.render_parallel(20000, seed=3, workers=1, tasks=4, width=50)
+    two = flame.render_parallel(20000, seed=3, workers=2, tasks=4, width=50)
+    assert one.counts.sum() == 20000
+    assert np.array_equal(one.counts, two.counts)
+
+@pytest.mark.parametrize("name", ["spiral", "batch", "sweep", "from_chaos_game", "transform"])
+def test_unknown_variation(name):
+    with pytest.raises(ValueError):
+        Flame.from_chaos_game(ChaosGame(3), {name: 1.0})
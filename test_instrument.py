@@ -0,0 +1,37 @@
+import json
+import numpy as np
+import instrument
+from instrument import Profiler, phase
+from chaos_game import ChaosGame
+from variations import Variations
+
+def test_disabled_phase_is_shared_no_op():
+    assert instrument._active is None
+    assert phase("a", 10) is phase("b")
+
+def test_profiler_records_phases(tmp_path):
+    calls = []
+    with Profiler(memory=True, hooks=[lambda *args: calls.append(args)]) as prof:
+        ChaosGame(4, 0.4, seed=None).savepng(str(tmp_path / "chaos.png"), color=True, steps=5000)
+        x, y = np.random.default_rng(0).uniform(-1, 1, (2, 1000))
+        Variations(x, y, "swirl").transform()
+    records = prof.to_dict()
+    for name in ["chaos_game.iterate", "chaos_game.corners", "raster.add", "raster.image", "raster.save",
+                 "variations.swirl"]:
+        assert records[name]["calls"] >= 1
+        assert records[name]["seconds"] >= 0
+    assert records["chaos_game.iterate"]["points"] == 4995
+    assert records["chaos_game.iterate"]["peak_bytes"] >= 4995*2*8
+    assert len(calls) == sum(r["calls"] for r in records.values())
+    assert json.loads(prof.to_json(str(tmp_path / "profile.json"))) == records
+    assert instrument._active is None
+
+def test_nested_phase_peak_reaches_outer_phase():
+    with Profiler(memory=True) as prof:
+        with phase("outer"):
+            with phase("inner"):
+                a = np.ones(10**6)
+            del a
+    records = prof.to_dict()
+    assert records["inner"]["peak_bytes"] >= 8*10**6
+    assert records["outer"]["peak_bytes"] >= records["inner"]["peak_bytes"]
@@ -0,0 +1,100 @@
+import pytest
+import numpy as np
+import kernels
+import rules
+import fern
+from chaos_game import ChaosGame, _affine_scan
+from kernels import corner_walk, ifs_walk, markov_walk
+from rules import VertexRule
+
+# Without numba the kernels are plain Python, so these tests check the same algorithms either way
+
+@pytest.fixture
+def numba_on(monkeypatch):
+    monkeypatch.setattr(kernels, "NUMBA", True)
+
+@pytest.mark.parametrize("walkers", [1, 7])
+def test_corner_walk_matches_affine_scan(walkers):
+    rng = np.random.default_rng(0)
+    ratios = np.array([0.5, 0.3, 0.7])
+    table = rng.random((3, 2))
+    Indicies = rng.integers(0, 3, (500, walkers))
+    start = rng.random((walkers, 2))
+    out = corner_walk(start, Indicies, ratios, table, np.empty((500, walkers, 2)))
+    expected = _affine_scan(start, ratios[Indicies], table[Indicies])
+    assert np.allclose(out, expected)
+
+def test_ifs_walk_matches_apply():
+    rng = np.random.default_rng(1)
+    choice = fern.barnsley.choose(rng.random((300, 5)))
+    points = rng.random((5, 2))
+    out = ifs_walk(points, choice, fern.barnsley._linear, fern.barnsley._shift, np.empty((300, 5, 2)))
+    for i in range(300):
+        points = fern.barnsley.apply(points, choice[i])
+        assert np.allclose(out[i], points)
+
+@pytest.mark.parametrize("walkers", [1, 4])
+def test_chaos_game_backends_agree(numba_on, walkers):
+    game = ChaosGame(5, 0.4, ratios=np.linspace(0.3, 0.6, 5))
+    X = game.iterate(2000, walkers=walkers, rng=np.random.default_rng(2))[0].copy()
+    Y = game.iterate(2000, walkers=walkers, rng=np.random.default_rng(2), backend="numba")[0]
+    assert np.allclose(X, Y)
+
+def test_fern_backends_agree(numba_on):
+    x = fern.iterating(N=2000, rng=np.random.default_rng(3))
+    y = fern.iterating(N=2000, rng=np.random.default_rng(3), backend="numba")
+    assert np.allclose(x, y)
+    a = fern.barnsley.iterate(3000, walkers=30, rng=np.random.default_rng(4))
+    b = fern.barnsley.iterate(3000, walkers=30, rng=np.random.default_rng(4), backend="numba")
+    assert np.allclose(a, b)
+
+@pytest.mark.parametrize("order, steps, walkers", [(1, 1, 1), (1, 3000, 3), (2, 700, 1), (2, 5000, 4)])
+def test_markov_walk_matches_scan(order, steps, walkers):
+    rng = np.random.default_rng(order)
+    matrix = rng.random((4**order, 4)) * (rng.random((4**order, 4)) < 0.7)
+    matrix[:, 0] += 0.1
+    rule = VertexRule(matrix, order)
+    u = rng.random((steps, walkers))
+    state = rule.initial(rng, walkers)
+    scan_state = state.copy()
+    picks = rule.sample(scan_state, u)
+    out = markov_walk(state, u, rule.cum, 4, np.empty((steps, walkers), dtype=np.intp))
+    assert np.array_equal(picks, out) and np.array_equal(scan_state, state)
+
+@pytest.mark.parametrize("walkers", [1, 4])
+def test_rule_backends_agree(numba_on, walkers):
+    rule = VertexRule.from_function(5, lambda p, j: not (p[0] == p[1] and (j - p[1]) % 5 in (1, 4)), order=2)
+    game = ChaosGame(5, 0.4, rule=rule)
+    X, Indicies = game.iterate(2000, walkers=walkers, rng=np.random.default_rng(5))
+    Y, Indicies_fast = game.iterate(2000, walkers=walkers, rng=np.random.default_rng(5), backend="numba")
+    assert np.array_equal(Indicies, Indicies_fast) and np.allclose(X, Y)
+
+def test_large_rules_skip_the_scan_tables():
+    rule = VertexRule(np.random.default_rng(6).random((10**4, 10)), order=4)
+    assert rule._maps is None
+    u = np.random.default_rng(7).random((300, 2))
+    state = rule.initial(np.random.default_rng(8), 2)
+    picks = rule.sample(state.copy(), u)
+    assert rule._maps is None
+    assert np.array_equal(picks, markov_walk(state, u, rule.cum, 10, np.empty(u.shape, dtype=np.intp)))
+    small = VertexRule.no_repeat(4)
+    small.sample(small.initial(None), u[:, 0])
+    assert small._maps is None
+
+@pytest.mark.parametrize("walkers", [1, 3])
+def test_coupled_walk_matches_kernel(monkeypatch, walkers):
+    monkeypatch.setattr(rules, "_COUPLE_BLOCK", 64)
+    # A permutation rule, whose walks from different states never meet
+    matrix = np.eye(7)[np.random.default_rng(9).permutation(7)]
+    for rule in (VertexRule(matrix), VertexRule(np.random.default_rng(10).random((36, 6)), order=2)):
+        u = np.random.default_rng(11).random((1000, walkers))
+        state = rule.initial(np.random.default_rng(12), walkers)
+        states = rules._markov_coupled(state, u, rule.cum, rule.n)
+        out = markov_walk(state, u, rule.cum, rule.n, np.empty(u.shape, dtype=np.intp))
+        assert np.array_equal(states % rule.n, out) and np.array_equal(states[-1], state)
+
+def test_numba_falls_back_without_numba(monkeypatch):
+    monkeypatch.setattr(kernels, "NUMBA", False)
+    assert kernels.use_numba("numba") == False
+    with pytest.raises(ValueError):
+        kernels.use_numba("cuda")
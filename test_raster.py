@@ -0,0 +1,28 @@
+import pytest
+import numpy as np
+from raster import DensityRaster
+
+def test_add_counts_points_in_pixels():
+    raster = DensityRaster((0, 1, 0, 1), width=2, height=2)
+    raster.add(np.array([[0.1, 0.9], [0.2, 0.8], [0.9, 0.1], [1.5, 0.5]]))
+    assert np.array_equal(raster.counts, [[2, 0], [0, 1]])
+
+def test_chunked_add_equals_single_add():
+    points = np.random.default_rng(0).random((1000, 2))
+    colors = points[:, 0]
+    whole = DensityRaster((0, 1, 0, 1), width=16, channels=1)
+    whole.add(points, colors)
+    chunked = DensityRaster((0, 1, 0, 1), width=16, channels=1)
+    for i in range(0, 1000, 128):
+        chunked.add(points[i:i + 128], colors[i:i + 128])
+    assert np.array_equal(whole.counts, chunked.counts)
+    assert np.allclose(whole.image(), chunked.image())
+
+@pytest.mark.parametrize("channels", [0, 1, 3])
+def test_image_shape(channels):
+    raster = DensityRaster((-1, 1, -1, 1), width=40, channels=channels)
+    points = np.random.default_rng(1).uniform(-1, 1, (500, 2))
+    raster.add(points, np.random.default_rng(2).random((500, channels)) if channels else None)
+    image = raster.image()
+    assert image.shape == (40, 40, 3)
+    assert image.min() >= 0 and image.max() <= 1
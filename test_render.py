@@ -0,0 +1,47 @@
+import pytest
+import json
+import os
+from render import load_manifest, render_manifest
+
+JOBS = [
+    {"generator": "chaos_game", "n": 3, "output": "out/chaos.png"},
+    {"generator": "chaos_game", "n": 5, "r": 0.4, "color": True, "output": "out/chaos_color.png"},
+    {"generator": "fern", "ink": "forestgreen", "output": "out/fern.png"},
+    {"generator": "variation", "n": 4, "r": 0.3, "variation": "swirl", "color": True, "output": "out/swirl.png"},
+    {"generator": "flame", "variations": {"linear": 0.7, "disc": 0.3}, "output": "out/flame.png"},
+]
+
+@pytest.fixture
+def manifest(tmp_path):
+    path = tmp_path / "gallery.json"
+    path.write_text(json.dumps({"defaults": {"steps": 5000, "width": 64}, "jobs": JOBS}))
+    return str(path)
+
+def test_load_toml_manifest(tmp_path):
+    path = tmp_path / "gallery.toml"
+    path.write_text('[defaults]\nsteps = 10\n\n[[jobs]]\ngenerator = "fern"\noutput = "fern.png"\n')
+    job, = load_manifest(str(path))
+    assert job["steps"] == 10 and job["width"] == 1000
+    assert job["output"] == str(tmp_path / "fern.png")
+
+def test_unknown_generator(tmp_path):
+    path = tmp_path / "gallery.json"
+    path.write_text(json.dumps([{"generator": "mandelbrot", "output": "m.png"}]))
+    with pytest.raises(ValueError):
+        load_manifest(str(path))
+
+def test_render_skips_up_to_date_jobs(manifest, tmp_path):
+    first = render_manifest(manifest, workers=1, out=None)
+    assert len(first["rendered"]) == len(JOBS) and not first["failed"]
+    assert all(os.path.exists(tmp_path / job["output"]) for job in JOBS)
+
+    second = render_manifest(manifest, workers=1, out=None)
+    assert second["rendered"] == [] and len(second["skipped"]) == len(JOBS)
+
+    data = json.loads(open(manifest).read())
+    data["jobs"][0]["n"] = 4
+    os.remove(tmp_path / JOBS[1]["output"])
+    with open(manifest, "w") as f:
+        json.dump(data, f)
+    third = render_manifest(manifest, workers=1, out=None)
+    assert sorted(third["rendered"]) == sorted(str(tmp_path / job["output"]) for job in JOBS[:2])
@@ -0,0 +1,61 @@
+import numpy as np
+import pytest
+from chaos_game import ChaosGame
+from rules import VertexRule
+from zoom import visible_cells
+
+
+def _pairs(Indicies):
+    index = Indicies.reshape(len(Indicies), -1).astype(int)
+    return index[:-1].reshape(-1), index[1:].reshape(-1)
+
+@pytest.mark.parametrize("rule, forbidden", [(VertexRule.no_repeat(5), [0]),
+                                             (VertexRule.no_neighbour(5), [1, 4]),
+                                             (VertexRule.forbid_offsets(6, [0, 3]), [0, 3])])
+@pytest.mark.parametrize("walkers", [1, 3])
+def test_offset_rules_are_followed(rule, forbidden, walkers):
+    game = ChaosGame(rule.n, 0.4, rule=rule)
+    game.iterate(20000, walkers=walkers, rng=np.random.default_rng(0))
+    last, picked = _pairs(game.Indicies)
+    offsets = (picked - last) % rule.n
+    assert not np.isin(offsets, forbidden).any()
+    allowed = np.setdiff1d(np.arange(rule.n), forbidden)
+    counts = np.bincount(offsets, minlength=rule.n)[allowed]
+    assert np.allclose(counts / counts.sum(), 1/len(allowed), atol=0.02)
+
+def test_general_rule_follows_its_matrix():
+    matrix = np.array([[0, 1, 3], [1, 0, 1], [2, 2, 0]], dtype=float)
+    game = ChaosGame(3, 0.5, rule=VertexRule(matrix))
+    game.iterate(100000, rng=np.random.default_rng(1))
+    last, picked = _pairs(game.Indicies)
+    counts = np.zeros((3, 3))
+    np.add.at(counts, (last, picked), 1)
+    assert np.allclose(counts / counts.sum(axis=1, keepdims=True), matrix / matrix.sum(axis=1, keepdims=True),
+                       atol=0.01)
+
+def test_second_order_rule_carries_state_between_chunks():
+    rule = VertexRule.from_function(4, lambda p, j: not (p[0] == p[1] and j == p[1]), order=2)
+    game = ChaosGame(4, 0.5, rule=rule)
+    chunks = list(game.iter_chunks(5000, chunk_size=300, discard=0, rng=np.random.default_rng(2)))
+    Indicies = np.concatenate([c[1] for c in chunks])[1:]
+    assert not np.any((Indicies[2:] == Indicies[1:-1]) & (Indicies[1:-1] == Indicies[:-2]))
+
+def test_cache_keeps_rules_apart():
+    plain = ChaosGame(5, 0.4, seed=3).iterate(500)
+    ruled = ChaosGame(5, 0.4, seed=3, rule=VertexRule.no_repeat(5)).iterate(500)
+    assert not np.array_equal(plain.Indicies, ruled.Indicies)
+
+def test_invalid_rules_raise_value_error():
+    with pytest.raises(ValueError):
+        VertexRule(np.array([[0, 1], [0, 0]]))
+    with pytest.raises(ValueError):
+        VertexRule(np.ones((3, 3)), order=2)
+    with pytest.raises(ValueError):
+        ChaosGame(4, 0.5, rule=VertexRule.no_repeat(5))
+    with pytest.raises(ValueError):
+        ChaosGame(5, 0.5, weights=np.ones(5), rule=VertexRule.no_repeat(5))
+    game = ChaosGame(5, 0.5, rule=VertexRule.no_repeat(5))
+    with pytest.raises(ValueError):
+        game.level(3)
+    with pytest.raises(ValueError):
+        visible_cells(game, (-1, 1, -1, 1))
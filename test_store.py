@@ -0,0 +1,36 @@
+import pytest
+import numpy as np
+from chaos_game import ChaosGame
+from store import PointStore
+from variations import Variations
+
+@pytest.mark.parametrize("walkers, color", [(1, None), (3, "gradient"), (2, "rgb")])
+def test_stored_run_matches_memory_run(tmp_path, walkers, color):
+    game = ChaosGame(5, 0.4)
+    X, Indicies = game.iterate(3000, walkers=walkers, rng=np.random.default_rng(0), color=color)
+    X, Indicies, colors = X.copy(), Indicies.copy(), None if color is None else game.colors.copy()
+    game.iterate(3000, walkers=walkers, rng=np.random.default_rng(0), color=color, store=str(tmp_path))
+    assert isinstance(game.X, np.memmap)
+    store = PointStore.open(str(tmp_path))
+    assert np.array_equal(store.X, X)
+    assert np.array_equal(store.Indicies, Indicies)
+    assert store.Indicies.dtype == np.uint8
+    if color is not None:
+        assert np.allclose(store.colors, colors)
+
+def test_store_chunks_and_statistics(tmp_path):
+    game = ChaosGame(4, 0.3)
+    game.iterate(5000, walkers=4, rng=np.random.default_rng(1), color="gradient", store=str(tmp_path))
+    store = PointStore.open(str(tmp_path))
+    assert sum(len(points) for points, _, _ in store.chunks(1000)) == len(store)
+    assert np.array_equal(store.corner_counts(4), np.bincount(game.Indicies.reshape(-1), minlength=4))
+    assert np.allclose(store.bounds(), [game.X.min(axis=0), game.X.max(axis=0)])
+    raster = store.raster(width=100, color=True, chunk_size=999)
+    assert raster.counts.sum() == len(store)
+
+def test_variations_read_rows_of_a_store(tmp_path):
+    ChaosGame(3).iterate(2000, rng=np.random.default_rng(2), store=str(tmp_path))
+    store = PointStore.open(str(tmp_path))
+    u, v = Variations.from_chaos_game(store, "swirl", rows=slice(100, 200)).transform()
+    expected = Variations.swirl(store.X[100:200, 0], -store.X[100:200, 1])
+    assert np.allclose(u, expected[0]) and np.allclose(v, expected[1])
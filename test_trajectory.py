@@ -0,0 +1,74 @@
+import numpy as np
+import pytest
+from chaos_game import ChaosGame
+from store import PointStore
+from trajectory import Trajectory
+from variations import Variations
+
+
+def test_views_share_the_coordinates():
+    run = ChaosGame(4, 0.3).iterate(500, rng=np.random.default_rng(0))
+    assert np.shares_memory(run.x, run.data) and np.shares_memory(run.X, run.data)
+    assert np.array_equal(run.X[:, 0], run.x) and np.array_equal(run.X[:, 1], run.y)
+    X, Indicies = run
+    assert X.shape == (len(run), 2) and Indicies.dtype == np.uint8
+    assert np.array_equal(run[0], X) and run[1] is run.Indicies
+
+@pytest.mark.parametrize("dtype, size", [(np.float32, 9), (np.float64, 17)])
+
+def test_compact_dtype(dtype, size):
+    game = ChaosGame(5, 0.4)
+    run = game.iterate(3000, rng=np.random.default_rng(1), dtype=dtype)
+    full = ChaosGame(5, 0.4).iterate(3000, rng=np.random.default_rng(1))
+    assert run.data.dtype == dtype and run.nbytes == size*len(run)
+    assert np.allclose(run.X, full.X, atol=1e-6)
+    assert np.array_equal(run.Indicies, full.Indicies)
+    assert np.shares_memory(game.X, run.data)
+
+@pytest.mark.parametrize("walkers, steps", [(1, slice(10, 50)), (1, slice(5, 90, 3)),
+                                            (3, slice(10, 50)), (3, slice(5, 90, 4))])
+
+def test_slicing_selects_steps(walkers, steps):
+    run = ChaosGame(3).iterate(200, walkers=walkers, rng=np.random.default_rng(2), color='rgb')
+    part = run[steps]
+    rows = np.arange(len(run)).reshape(-1, walkers)[steps].reshape(-1)
+    assert np.array_equal(part.X, run.X[rows])
+    assert np.array_equal(part.colors, run.colors[rows])
+    assert np.array_equal(part.Indicies, run.Indicies[steps])
+    if steps.step is None:
+        assert np.shares_memory(part.data, run.data)
+
+@pytest.mark.parametrize("color", [None, "gradient"])
+
+def test_npz_round_trip(tmp_path, color):
+    run = ChaosGame(6, 0.3).iterate(400, walkers=2, rng=np.random.default_rng(3), color=color,
+                                    dtype=np.float32)
+    run.save(tmp_path / "run.npz")
+    back = Trajectory.load(tmp_path / "run.npz")
+    assert back.data.dtype == np.float32 and back.Indicies.dtype == np.uint8
+    assert np.array_equal(back.data, run.data) and np.array_equal(back.Indicies, run.Indicies)
+    assert back.walkers == 2
+    assert (back.colors is None) == (color is None)
+
+def test_variations_use_the_trajectory():
+    game = ChaosGame(4, 0.3)
+    game.iterate(500)
+    variation = Variations.from_chaos_game(game, "swirl", rows=slice(100, 200))
+    assert np.shares_memory(variation.x, game.trajectory.data)
+    assert np.array_equal(variation.y, -game.X[100:200, 1])
+
+@pytest.mark.parametrize("rows", [slice(100, 200), slice(5, 290, 7)])
+def test_variation_rows_are_points(tmp_path, rows):
+    game = ChaosGame(4, 0.3)
+    run = game.iterate(100, walkers=3, rng=np.random.default_rng(4))
+    store = PointStore.create(str(tmp_path), len(run), run.Indicies.shape, 4)
+    store.X[:] = run.X
+    for source in (game, run, store):
+        variation = Variations.from_chaos_game(source, "swirl", rows=rows)
+        assert np.array_equal(variation.x, run.X[rows, 0]) and np.array_equal(variation.y, -run.X[rows, 1])
+
+def test_invalid_shapes():
+    with pytest.raises(ValueError):
+        Trajectory(np.zeros((2, 5)), np.zeros(4, dtype=np.uint8))
+    with pytest.raises(TypeError):
+        Trajectory.empty(5, dtype=np.int32)
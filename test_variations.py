@@ -0,0 +1,57 @@
+import pytest
+import numpy as np
+from variations import Variations
+from raster import DensityRaster
+
+NAMES = ["linear", "handkerchief", "swirl", "disc", "diamond", "power"]
+
+def test_batch_matches_single_variations():
+    rng = np.random.default_rng(0)
+    x, y = rng.uniform(-1, 1, (2, 1000))
+    results = Variations.batch(x, y, NAMES)
+    for name in NAMES:
+        u, v = Variations(x, y, name).transform()
+        assert np.allclose(results[name][0], u)
+        assert np.allclose(results[name][1], v)
+
+def test_batch_writes_into_out_buffers():
+    x, y = np.random.default_rng(1).uniform(-1, 1, (2, 100))
+    out = {"swirl": np.empty((2, 100), dtype=np.float32)}
+    results = Variations.batch(x, y, ["swirl", "disc"], out=out, dtype=np.float32)
+    assert results["swirl"][0].base is out["swirl"]
+    assert results["disc"][0].dtype == np.float32 and list(out) == ["swirl"]
+    u, v = Variations.swirl(x, y)
+    assert np.allclose(out["swirl"], [u, v], atol=1e-5)
+
+@pytest.mark.parametrize("name", ["spiral", "sweep", "from_chaos_game"])
+def test_batch_rejects_unknown_names(name):
+    with pytest.raises(ValueError):
+        Variations.batch(np.zeros(3), np.zeros(3), ["swirl", name])
+
+def test_blend_is_weighted_sum():
+    x, y = np.random.default_rng(2).uniform(-1, 1, (2, 500))
+    components = Variations.stack(x, y, ["linear", "swirl", "disc"])
+    w = np.array([0.2, 0.5, 0.3])
+    blended = Variations.blend(components, w)
+    expected = sum(wi*np.array(getattr(Variations, name)(x, y))
+                   for wi, name in zip(w, ["linear", "swirl", "disc"]))
+    assert np.allclose(blended, expected)
+
+@pytest.mark.parametrize("out", [np.empty((500, 2)).T, np.empty((2, 1000))[:, ::2],
+                                 np.empty((2, 500), dtype=np.float32)])
+def test_blend_rejects_buffers_it_can_not_fill(out):
+    components = Variations.stack(*np.random.default_rng(4).uniform(-1, 1, (2, 500)), ["linear", "swirl"])
+    with pytest.raises(ValueError):
+        Variations.blend(components, [0.5, 0.5], out=out)
+
+def test_sweep_reuses_one_raster():
+    x, y = np.random.default_rng(3).uniform(-1, 1, (2, 2000))
+    weights = np.column_stack([np.linspace(0, 1, 5), 1 - np.linspace(0, 1, 5)])
+    frames = list(Variations.sweep(x, y, ["linear", "disc"], weights))
+    assert len({id(raster) for _, raster in frames}) == 1
+    raster = frames[-1][1]
+    assert raster.counts.sum() == 2000
+    u, v = Variations.linear(x, y)
+    expected = DensityRaster(raster.extent, raster.width, raster.height)
+    expected.add(np.column_stack([u, v]))
+    assert np.array_equal(raster.counts, expected.counts)
@@ -0,0 +1,36 @@
+import pytest
+import numpy as np
+from chaos_game import ChaosGame
+from raster import DensityRaster
+from zoom import visible_cells, render_viewport
+
+def _viewport(game, zoom):
+    point = game.iterate(1000, rng=np.random.default_rng(0))[0][-1]
+    h = 0.5/zoom
+    return (point[0] - h, point[0] + h, point[1] - h, point[1] + h)
+
+@pytest.mark.parametrize("zoom", [1, 10, 1000])
+def test_cells_cover_the_viewport(zoom):
+    game = ChaosGame(3)
+    extent = _viewport(game, zoom)
+    cells = visible_cells(game, extent)
+    assert 0 < cells["prob"].sum() <= 1 + 1e-12
+    assert np.allclose(cells["scale"], 0.5**cells["depth"])
+    assert cells["scale"].max() <= extent[1] - extent[0] or zoom == 1
+    raster = render_viewport(game, extent, 10**5, width=50, rng=np.random.default_rng(1))
+    assert raster.counts.sum() > 0.2 * 10**5
+
+def test_zoom_matches_full_run():
+    game = ChaosGame(5, 0.4)
+    extent = _viewport(game, 5)
+    full = DensityRaster(extent, 4, 4, channels=1)
+    for points, _, colors in game.iter_chunks(4*10**6, 2**20, rng=np.random.default_rng(2), color="gradient"):
+        full.add(points, colors)
+    zoom = render_viewport(game, extent, 2*10**5, width=4, color=True, rng=np.random.default_rng(3))
+    hit = full.counts > 500
+    assert np.allclose(full.counts[hit]/full.counts.sum(), zoom.counts[hit]/zoom.counts.sum(), atol=0.02)
+    assert np.allclose(full.colors[0][hit]/full.counts[hit], zoom.colors[0][hit]/zoom.counts[hit], atol=0.05)
+
+def test_viewport_off_the_attractor_is_empty():
+    raster = render_viewport(ChaosGame(3), (5, 6, 5, 6), 1000, width=10)
+    assert raster.counts.sum() == 0
@@ -0,0 +1,194 @@
+import numpy as np
+
+
+class Trajectory:
+    __slots__ = ('data', 'Indicies', 'colors')
+
+    def __init__(self, data: np.ndarray, Indicies: np.ndarray, colors: np.ndarray = None)->None:
+        """
+        Constructor for Trajectory, the points of a run stored as a struct of arrays: the
+        coordinates are one (2, N) array, so x, y and the (N, 2) points X are views of it and
+        no copy is made when a module wants either layout. The coordinates may be float32 or
+        float64 and the corner indices any integer type, uint8 up to 256 corners, so a point
+        can take as little as 9 bytes instead of 24.
+        For backwards compatibility a Trajectory unpacks like the old (X, Indicies) tuple.
+        Arguments:
+            data(np.ndarray):
+                coordinates, shape (2, N)
+            Indicies(np.ndarray):
+                corner indices, shape (steps,) or (steps, walkers) with steps*walkers = N
+            colors(np.ndarray):
+                color of every point, shape (N,) or (N, 3), or None
+        """
+        data = np.asanyarray(data)
+        Indicies = np.asanyarray(Indicies)
+        if data.ndim != 2 or len(data) != 2 or Indicies.ndim not in (1, 2):
+            raise ValueError()
+        if Indicies.size != data.shape[1]:
+            raise ValueError()
+        if colors is not None and len(colors) != data.shape[1]:
+            raise ValueError()
+        self.data = data
+        self.Indicies = Indicies
+        self.colors = colors
+
+    @classmethod
+    def empty(cls, steps: int, walkers: int = 1, n: int = 3, color: str = None,
+              dtype: type = np.float64):
+        """
+        Creating a Trajectory to be filled in. The corner indices use the smallest unsigned
+        integer type that holds n - 1.
+        Arguments:
+            steps(int):
+                number of steps
+            walkers(int):
+                number of points per step
+            n(int):
+                number of corners
+            color(str):
+                None, 'gradient' or 'rgb', the kind of colors stored with the points
+            dtype(type):
+                type of the coordinates and colors, np.float32 or np.float64
+        returns:
+            Trajectory:
+                trajectory with uninitialized arrays
+        """
+        dtype = np.dtype(dtype)
+        if dtype not in (np.float32, np.float64):
+            raise TypeError()
+        N = steps*walkers
+        shape = (steps,) if walkers == 1 else (steps, walkers)
+        colors = None
+        if color is not None:
+            colors = np.empty((N, 3) if color == 'rgb' else N, dtype=dtype)
+        return cls(np.empty((2, N), dtype=dtype), np.empty(shape, dtype=np.min_scalar_type(max(n - 1, 0))),
+                   colors)
+
+    @property
+    def x(self)->np.ndarray:
+        """
+        x coordinates, a view.
+        returns:
+            np.ndarray:
+                shape (N,)
+        """
+        return self.data[0]
+
+    @property
+    def y(self)->np.ndarray:
+        """
+        y coordinates, a view.
+        returns:
+            np.ndarray:
+                shape (N,)
+        """
+        return self.data[1]
+
+    @property
+    def X(self)->np.ndarray:
+        """
+        Points as rows, a view of data.
+        returns:
+            np.ndarray:
+                shape (N, 2)
+        """
+        return self.data.T
+
+    @property
+    def walkers(self)->int:
+        """
+        Number of points per step.
+        returns:
+            int:
+                walkers
+        """
+        return 1 if self.Indicies.ndim == 1 else self.Indicies.shape[1]
+
+    @property
+    def nbytes(self)->int:
+        """
+        Memory held by the arrays.
+        returns:
+            int:
+                number of bytes
+        """
+        return sum(a.nbytes for a in (self.data, self.Indicies, self.colors) if a is not None)
+
+    def __len__(self)->int:
+        return self.data.shape[1]
+
+    def __iter__(self):
+        """
+        Unpacking as X, Indicies = trajectory.
+        """
+        return iter((self.X, self.Indicies))
+
+    def __getitem__(self, steps: slice):
+        """
+        Selecting steps. With one walker the steps are the points and the result holds views;
+        with several walkers a slice with a step other than 1 copies the coordinates.
+        An integer indexes (X, Indicies) like the old tuple.
+        Arguments:
+            steps(slice):
+                steps to keep
+        returns:
+            Trajectory:
+                the selected steps
+        """
+        if isinstance(steps, (int, np.integer)):
+            return (self.X, self.Indicies)[steps]
+        if not isinstance(steps, slice):
+            raise TypeError()
+        w = self.walkers
+        start, stop, step = steps.indices(len(self.Indicies))
+        if w == 1 or step == 1:
+            rows = slice(start*w, max(stop, start)*w) if w > 1 else steps
+            colors = None if self.colors is None else self.colors[rows]
+            return Trajectory(self.data[:, rows], self.Indicies[steps], colors)
+        data = self.data.reshape(2, -1, w)[:, steps].reshape(2, -1)
+        colors = None
+        if self.colors is not None:
+            colors = self.colors.reshape((-1, w) + self.colors.shape[1:])[steps].reshape(
+                (-1,) + self.colors.shape[1:])
+        return Trajectory(data, self.Indicies[steps], colors)
+
+    def astype(self, dtype: type):
+        """
+        Trajectory with the coordinates and colors in another float type, self if unchanged.
+        Arguments:
+            dtype(type):
+                np.float32 or np.float64
+        returns:
+            Trajectory:
+                the trajectory
+        """
+        if np.dtype(dtype) == self.data.dtype:
+            return self
+        colors = None if self.colors is None else self.colors.astype(dtype)
+        return Trajectory(self.data.astype(dtype), self.Indicies, colors)
+
+    def save(self, outfile: str)->None:
+        """
+        Writing the arrays to a .npz file.
+        Arguments:
+            outfile(str):
+                Name of the file
+        """
+        arrays = {'data': self.data, 'Indicies': self.Indicies}
+        if self.colors is not None:
+            arrays['colors'] = self.colors
+        np.savez(outfile, **arrays)
+
+    @classmethod
+    def load(cls, infile: str):
+        """
+        Reading a Trajectory written by save.
+        Arguments:
+            infile(str):
+                Name of the file
+        returns:
+            Trajectory:
+                the trajectory
+        """
+        with np.load(infile) as f:
+            return cls(f['data'], f['Indicies'], f['colors'] if 'colors' in f.files else None)
@@ -2,6 +2,8 @@ from array import array
 from calendar import c
 import numpy as np
 import matplotlib.pyplot as plt
+from raster import DensityRaster
+from chaos_game import ChaosGame, sample_polygon, _affine_scan, _colors
 
 
 def triangle_corners (points: tuple)->np.ndarray:
@@ -26,23 +28,21 @@ def triangle_corners (points: tuple)->np.ndarray:
 
 
 
-def starting_point(points: np.ndarray)->np.ndarray:
+def starting_point(points: np.ndarray, size: int = None)->np.ndarray:
 
     """
-    Picking a starting point randomly within the triangle.
+    Picking starting points uniformly within the triangle, see chaos_game.sample_polygon.
 
     Arguments:
         points (np.ndarray):
             The 3 corners of the rectangle
+        size (int):
+            number of points, one point if None
     returns: 
         np.ndarray:
-            Random starting point
+            Random starting point, or an array of shape (size, 2)
     """
-    c0, c1, c2 = points
-    weights = np.random.random(3) # np.random.random() returns random floats in the half-open interval [0.0, 1.0)
-    weights = weights/sum(weights)
-    w0, w1, w2 = weights
-    return c0*w0 + c1*w1 + c2*w2
+    return sample_polygon(points, size)
 
     
 
@@ -59,10 +59,9 @@ def plot_triangle(N: int)->None:
     corners = triangle_corners(([0,0], [1,0]))
     plt.figure()
     
-    # Generating N points to plot figure resembling Sierpinski Triangle.
-    for _ in range(N):
-        x = starting_point(corners)
-        plt.scatter(x[0], x[1], c='r')
+    # Generating N points uniformly in the triangle, drawn with a single scatter
+    x = starting_point(corners, N)
+    plt.scatter(x[:, 0], x[:, 1], c='r')
 
 
 def list_of_points_on_triangle()->None:
@@ -88,16 +87,15 @@ def plot_Sierpinski_Triangle_1d(N: int)->None:
             Number of points.
     """
 
-    corners, x_list = list_of_points_on_triangle()
-
-    for i in range(N):
-        x_list.append((x_list[i] + corners[np.random.randint(low=0, high = 3)])/2) #random.randint velger tilfeldig heltall fra 0 til og med 2
+    corners = list_of_points_on_triangle()[0]
 
-    # Turning x_list to an array 
-    x_list = np.array(x_list[6:])
+    # The chaos game on the triangle corners, N steps after the starting point
+    x_list = ChaosGame(3, corners=corners).iterate(N + 1, discard=6).X
     print(len(x_list))
+    raster = DensityRaster.fit(corners)
+    raster.add(x_list)
+    plt.imshow(raster.image(color='g'), extent=raster.extent, interpolation='nearest')
     plt.scatter(*zip(*corners), c='b')
-    plt.scatter(x_list[:,0], x_list[:,1], s = 0.1, marker = '.', c='g')
     plt.axis('equal')
     plt.axis('off')
     plt.show()
@@ -111,25 +109,18 @@ def plot_alt_1e(N: int)->None:
             N(int):
                 Number of points.
     """
-    corners, x_list = list_of_points_on_triangle()
-    colors = [0]
-    for i in range(N):
-        j = np.random.randint(low=0, high=3)#random.randint velger tilfeldig heltall fra 0 til og med 2
-        x_list.append((x_list[i] + corners[j])/2) 
-        colors.append(j)
-
-    # Turning x_list to an array 
-    x_list = np.array(x_list[6:]) #blir en liste med punkter
-    colors = np.array(colors[6:]) #en liste med corner index (altså hvilken corner det er)
-
-    red = x_list[colors == 0]  #colors == 0 gir en liste med True og False og deretter drar ut liste med punkter som korresponderer True.
-    green = x_list[colors == 1]
-    blue = x_list[colors == 2]
-  
+    corners = list_of_points_on_triangle()[0]
+
+    # x_list blir en liste med punkter, colors en liste med corner index (altså hvilken corner det er)
+    x_list, colors = ChaosGame(3, corners=corners).iterate(N + 1, discard=6)
+
+    # One RGB color per corner: red, green and blue
+    rgb = np.array([[1, 0, 0], [0, 0.5, 0], [0, 0, 1]])[colors]
+
+    raster = DensityRaster.fit(corners, channels=3)
+    raster.add(x_list, rgb)
+    plt.imshow(raster.image(), extent=raster.extent, interpolation='nearest')
     plt.scatter(*zip(*corners), c='b')
-    plt.scatter(red[:,0], red[:,1], s = 0.1, marker = '.', color = 'red')
-    plt.scatter(green[:,0], green[:,1], s = 0.1, marker = '.', color = 'green')
-    plt.scatter(blue[:,0], blue[:,1], s = 0.1, marker = '.', color = 'blue')
     plt.axis('equal')
     plt.axis('off')
     plt.show()
@@ -153,12 +144,12 @@ def Alternative_iteration_func(N: int)->np.ndarray:
     r0 = np.array([1,0,0]) #red
     r1 = np.array([0,1,0]) #green
     r2 = np.array([0,0,1]) #blue
-    r = [r0, r1, r2]
+    r = np.array([r0, r1, r2])
 
-    for i in range(N-1):
-        j = np.random.randint(3)
-        C[i+1] = (C[i] + r[j])/2
-        x_list[i+1] = ((x_list[i] + corners[j])/2) # the corners get the same index as the color list C
+    # Both recurrences are exponential filters, evaluated in blocks without a Python loop
+    j = np.random.randint(3, size=N-1)
+    C[1:] = _colors(j, C[0], r)
+    x_list[1:] = _affine_scan(x_list[0], 1/2, corners[j]/2) # the corners get the same index as the color list C
 
     return C[5:], x_list[5:]
 
@@ -172,7 +163,9 @@ def Alernative_plot_color_Sierpinski(N: int)->None:
 
     colors, x = Alternative_iteration_func(N)
 
-    plt.scatter(*zip(*x), c=colors, s=0.2)
+    raster = DensityRaster.fit(x, channels=3)
+    raster.add(x, colors)
+    plt.imshow(raster.image(), extent=raster.extent, interpolation='nearest')
     plt.axis('equal')
     plt.axis('off')
     plt.show()
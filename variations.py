@@ -1,6 +1,23 @@
 import numpy as np
 import matplotlib.pyplot as plt
 from chaos_game import ChaosGame
+from raster import DensityRaster
+from trajectory import Trajectory
+from instrument import phase
+
+
+# Names of the variations, the ones Variations.batch evaluates
+VARIATIONS = ('linear', 'handkerchief', 'swirl', 'disc', 'diamond', 'power')
+
+# Intermediates shared between the variations evaluated by Variations.batch, a read-only
+# table, the intermediates themselves live in a scratch array of every call
+_SHARED = {
+    'handkerchief': ('r', 'theta'),
+    'swirl': ('r2',),
+    'disc': ('r', 'theta'),
+    'diamond': ('r', 'sin', 'cos'),
+    'power': ('r', 'sin', 'cos'),
+}
 
 
 class Variations:
@@ -120,6 +137,197 @@ class Variations:
         return r**np.sin(theta)*np.cos(theta), r**np.sin(theta)*np.sin(theta)
         
 
+    @staticmethod
+    def batch(x: np.ndarray, y: np.ndarray, names: list, out: dict = None,
+              dtype: type = np.float64, block: int = 2**15)->dict:
+        """
+        Evaluating several variations on one point set. The shared intermediates r, r**2,
+        theta, sin(theta) and cos(theta) are computed once, only if a requested variation
+        needs them, and the results are written into preallocated buffers. The points are
+        handled in blocks, so the intermediates stay small and in cache.
+        Arguments:
+            x (np.ndarray):
+                x values
+            y (np.ndarray):
+                y values
+            names (list):
+                names of the variations, from VARIATIONS
+            out (dict):
+                buffer with shape (2, N) for some or all names, filled in place. New buffers
+                are made for the rest and returned, the dict itself is left unchanged.
+            dtype (type):
+                float type of the intermediates and new buffers, e.g. np.float32
+            block (int):
+                number of points evaluated at a time
+        returns:
+            dict:
+                new x and y values for every name, as rows of the buffers
+        """
+        if any(name not in VARIATIONS for name in names):
+            raise ValueError()
+        x = np.asarray(x, dtype=dtype).reshape(-1)
+        y = np.asarray(y, dtype=dtype).reshape(-1)
+        out = {} if out is None else dict(out)
+        for name in names:
+            if name not in out:
+                out[name] = np.empty((2, len(x)), dtype=dtype)
+
+        scratch = np.empty((9, min(block, len(x))), dtype=dtype)
+        with phase('variations.batch', len(x)):
+            for start in range(0, len(x), block):
+                sl = slice(start, start + block)
+                Variations._batch_block(x[sl], y[sl], {name: out[name][:, sl] for name in names},
+                                        scratch[:, :len(x[sl])])
+        return {name: (out[name][0], out[name][1]) for name in names}
+
+    @staticmethod
+    def _batch_block(x: np.ndarray, y: np.ndarray, out: dict, scratch: np.ndarray)->None:
+        """
+        Evaluating the variations of batch on one block of points.
+        Arguments:
+            x (np.ndarray):
+                x values of the block
+            y (np.ndarray):
+                y values of the block
+            out (dict):
+                buffer with shape (2, len(x)) for every name
+            scratch (np.ndarray):
+                work space with shape (9, len(x))
+        """
+        need = set()
+        for name in out:
+            need.update(_SHARED.get(name, ()))
+        r2, r, theta, sin, cos = scratch[:5]
+        if need & {'r2', 'r'}:
+            np.add(np.multiply(x, x, out=r2), np.multiply(y, y, out=r), out=r2)
+        if 'r' in need:
+            np.sqrt(r2, out=r)
+        if need & {'theta', 'sin', 'cos'}:
+            np.arctan2(x, y, out=theta)
+        if 'sin' in need:
+            np.sin(theta, out=sin)
+        if 'cos' in need:
+            np.cos(theta, out=cos)
+
+        tmp, s, c, w = scratch[5:]
+        for name, (u, v) in out.items():
+            if name == 'linear':
+                u[...] = x
+                v[...] = y
+            elif name == 'handkerchief':
+                np.sin(np.add(theta, r, out=tmp), out=u)
+                u *= r
+                np.cos(np.subtract(theta, r, out=tmp), out=v)
+                v *= r
+            elif name == 'swirl':
+                np.sin(r2, out=s)
+                np.cos(r2, out=c)
+                np.subtract(np.multiply(x, s, out=tmp), np.multiply(y, c, out=w), out=u)
+                np.add(np.multiply(x, c, out=tmp), np.multiply(y, s, out=w), out=v)
+            elif name == 'disc':
+                np.multiply(r, np.pi, out=tmp)
+                np.sin(tmp, out=u)
+                np.cos(tmp, out=v)
+                np.divide(theta, np.pi, out=tmp)
+                u *= tmp
+                v *= tmp
+            elif name == 'diamond':
+                np.multiply(sin, np.cos(r, out=tmp), out=u)
+                np.multiply(cos, np.sin(r, out=tmp), out=v)
+            elif name == 'power':
+                np.power(r, sin, out=tmp)
+                np.multiply(tmp, cos, out=u)
+                np.multiply(tmp, sin, out=v)
+
+    @staticmethod
+    def stack(x: np.ndarray, y: np.ndarray, names: list, dtype: type = np.float64)->np.ndarray:
+        """
+        Evaluating several variations once into one contiguous array, the input of blend.
+        Arguments:
+            x (np.ndarray):
+                x values
+            y (np.ndarray):
+                y values
+            names (list):
+                names of the variations
+            dtype (type):
+                float type of the array
+        returns:
+            np.ndarray:
+                new x and y values of every variation, shape (len(names), 2, N)
+        """
+        components = np.empty((len(names), 2, np.size(x)), dtype=dtype)
+        Variations.batch(x, y, names, out=dict(zip(names, components)), dtype=dtype)
+        return components
+
+    @staticmethod
+    def blend(components: np.ndarray, weights: np.ndarray, out: np.ndarray = None)->np.ndarray:
+        """
+        Weighted sum of variations, computed in one pass as a matrix-vector product.
+        Arguments:
+            components (np.ndarray):
+                variations returned by stack, shape (k, 2, N)
+            weights (np.ndarray):
+                weight of every variation, shape (k,)
+            out (np.ndarray):
+                C-contiguous buffer with shape (2, N) and the type of components to write
+                into, a new one if None
+        returns:
+            np.ndarray:
+                blended x and y values, shape (2, N)
+        """
+        k = len(components)
+        weights = np.asarray(weights, dtype=components.dtype).reshape(-1)
+        if len(weights) != k:
+            raise ValueError()
+        if out is None:
+            out = np.empty(components.shape[1:], dtype=components.dtype)
+        # np.dot would write into a copy of a non-contiguous buffer and leave out unchanged
+        if out.shape != components.shape[1:] or out.dtype != components.dtype or not out.flags.c_contiguous:
+            raise ValueError()
+        with phase('variations.blend', components.shape[-1]):
+            np.dot(weights, components.reshape(k, -1), out=out.reshape(-1))
+        return out
+
+    @staticmethod
+    def sweep(x: np.ndarray, y: np.ndarray, names: list, weights: np.ndarray,
+              raster: DensityRaster = None, colors: np.ndarray = None, dtype: type = np.float64):
+        """
+        Rendering a sequence of blends, one frame per weight vector. The variations are
+        evaluated once, and every frame reuses the same blend buffer and raster, so memory
+        does not grow with the number of frames.
+        Arguments:
+            x (np.ndarray):
+                x values
+            y (np.ndarray):
+                y values
+            names (list):
+                names of the variations
+            weights (np.ndarray):
+                one weight vector per frame, shape (frames, len(names))
+            raster (DensityRaster):
+                raster every frame is binned into, if None one covering all the variations,
+                which holds every frame whose weights are non-negative and sum to one
+            colors (np.ndarray):
+                color of every point, if the raster has color channels
+            dtype (type):
+                float type of the variations and the blend buffer
+        yields:
+            tuple:
+                weight vector and the raster holding the frame, cleared before the next frame
+        """
+        components = Variations.stack(x, y, names, dtype)
+        if raster is None:
+            points = components.transpose(0, 2, 1).reshape(-1, 2)
+            raster = DensityRaster.fit(points[np.isfinite(points).all(axis=1)],
+                                       channels=0 if colors is None else 1)
+        frame = np.empty(components.shape[1:], dtype=dtype)
+        for w in weights:
+            Variations.blend(components, w, out=frame)
+            raster.clear()
+            raster.add(frame.T, colors)
+            yield w, raster
+
     def transform(self)-> np.ndarray:
         """
         Transforms the coordinates.
@@ -128,20 +336,29 @@ class Variations:
                 transformed x and y values.
         """
 
-        x_new, y_new = self._func(self.x, self.y)
+        with phase('variations.' + self.name, np.size(self.x)):
+            x_new, y_new = self._func(self.x, self.y)
         return x_new, y_new
 
     @classmethod
-    def from_chaos_game(cls, instance: ChaosGame, name: float):
+    def from_chaos_game(cls, instance: ChaosGame, name: float, rows: slice = None):
         """
-        Generating ChaosGame object to Variation.
+        Generating ChaosGame object to Variation. The x values are a view of the points
+        of a Trajectory, only the flipped y values are a new array.
         Arguments:
             instance(ChaosGame):
-                instances of ChaosGame
+                instances of ChaosGame, a Trajectory or a PointStore of a stored run
             name(float):
                 Name of the transformation chosen 
+            rows(slice):
+                rows of the points X to use, all if None, also for several walkers. With a
+                PointStore only these rows are read.
         """
-        x = instance.X
+        run = getattr(instance, 'trajectory', instance)
+        if isinstance(run, Trajectory):
+            data = run.data if rows is None else run.data[:, rows]
+            return cls(data[0], -data[1], name)
+        x = instance.X if rows is None else instance.X[rows]
         return cls(x[:,0], -x[:,1], name) 
 
 
@@ -153,13 +370,13 @@ if __name__=="__main__":
     x_values = x.flatten()
     y_values = y.flatten()
     transformations = ["linear", "handkerchief", "swirl", "disc"]
-    variations = [Variations(x_values, y_values, version) for version in transformations]
+    results = Variations.batch(x_values, y_values, transformations)
     fig, axs = plt.subplots(2, 2, figsize=(9, 9))
-    for i, (ax, variation) in enumerate(zip(axs.flatten(), variations)):
-        u, v = variation.transform()
+    for i, (ax, name) in enumerate(zip(axs.flatten(), transformations)):
+        u, v = results[name]
         ax.plot(u, -v, markersize=1, marker=".", linestyle="", color="black")
         ax.scatter(u, -v, s=0.2, marker=".", color="black")
-        ax.set_title(variation.name)
+        ax.set_title(name)
         ax.axis("off")
     fig.savefig("figures/variations_4b.png")
 
@@ -171,46 +388,25 @@ if __name__=="__main__":
     transformations = ["linear", "handkerchief", "swirl", "disc"]
 
 
-    for i, (ax, variation) in enumerate(zip(axs.flatten(), transformations)):
-        var = Variations.from_chaos_game(n_gons, variation)
-        u, v = var.transform()
+    results = Variations.batch(n_gons.X[:,0], -n_gons.X[:,1], transformations)
+    for i, (ax, name) in enumerate(zip(axs.flatten(), transformations)):
+        u, v = results[name]
         ax.scatter(u, -v, s=0.2, marker=".", c=n_color)
-        ax.set_title(var.name)
+        ax.set_title(name)
         ax.axis("off")
     #plt.show()
 
     #Exercise 4d)
-    def linear_combination_wrap(V1: Variations, V2: Variations)-> tuple:
-        """
-        Arguments:
-            V1(Variations):
-                First variation
-            V2(Variations):
-                Second variation
-        returns:
-            tuple:
-                weighted linear combination of the two variations.
-        """
-        
-        u1, v1 = V1.transform()
-        u2, v2 = V2.transform()
-        return lambda w: (w*u1 + (1-w)*u2, w*v1 + (1-w)*v2)
-
-
     coeffs = np.linspace(0, 1, 4)
-    
-    variation1 = Variations.from_chaos_game(n_gons, "linear")
-    variation2 = Variations.from_chaos_game(n_gons, "disc")
+    weights = np.column_stack([coeffs, 1 - coeffs])
 
-    variation12 = linear_combination_wrap(variation1, variation2)    
-        
+    # Weighted blends of linear and disc, one raster frame per weight
+    frames = Variations.sweep(n_gons.X[:,0], -n_gons.X[:,1], ["linear", "disc"], weights,
+                              colors=n_gons.gradient_color)
     fig, axs = plt.subplots(2, 2, figsize=(9, 9))
-    for ax, w in zip(axs.flatten(), coeffs):
-        u, v = variation12(w)
-    
-        ax.scatter(u, -v, s=0.2, marker=".", c=n_color)
-        ax.set_title(f"weight = {w:.2f}")
+    for ax, (w, raster) in zip(axs.flatten(), frames):
+        xmin, xmax, ymin, ymax = raster.extent
+        ax.imshow(raster.image(), extent=(xmin, xmax, -ymax, -ymin), origin='lower', interpolation='nearest')
+        ax.set_title(f"weight = {w[0]:.2f}")
         ax.axis("off")
     plt.show()
-
-
@@ -0,0 +1,119 @@
+import numpy as np
+from raster import DensityRaster
+from instrument import phase
+from chaos_game import ChaosGame, AliasTable
+
+
+def visible_cells(game: ChaosGame, extent: tuple, max_cells: int = 2**20)->dict:
+    """
+    Finding the cells of the address tree of a ChaosGame that can put points in a viewport.
+    The cell of an address w = j1 j2 ... jk is f_w(H) = f_j1(f_j2(...f_jk(H))), where H is the
+    convex hull of the corners and f_j(x) = r_j*x + (1 - r_j)*c_j. Every f_j maps H into itself,
+    so the cell of a child address w j lies inside the cell of w. The tree is descended breadth
+    first, dropping the cells whose bounding box misses the viewport and stopping at the cells
+    that are no larger than the viewport.
+    Arguments:
+        game(ChaosGame):
+            the game
+        extent(tuple):
+            (xmin, xmax, ymin, ymax) of the viewport
+        max_cells(int):
+            largest number of cells kept at one level
+    returns:
+        dict:
+            for every cell the map f_w(x) = scale*x + offset ('scale' and 'offset'), the
+            probability of its address ('prob'), the gradient color map
+            C(f_w(x)) = color_scale*C(x) + color_offset ('color_scale', 'color_offset') and the
+            address length ('depth')
+    """
+    xmin, xmax, ymin, ymax = (float(v) for v in extent)
+    if xmax <= xmin or ymax <= ymin or game.rule is not None:
+        raise ValueError()
+    n = game.n
+    corners = game._generate_ngon()[:n]
+    ratios = np.full(n, game.r) if game.ratios is None else game.ratios
+    table = (1 - ratios[:, None]) * corners
+    probs = np.full(n, 1/n) if game.weights is None else game.weights / game.weights.sum()
+    low, high = corners.min(axis=0), corners.max(axis=0)
+    target = max(xmax - xmin, ymax - ymin)
+
+    cells = {key: [] for key in ('scale', 'offset', 'prob', 'color_scale', 'color_offset', 'depth')}
+    scale = np.ones(1)
+    offset = np.zeros((1, 2))
+    prob = np.ones(1)
+    color_scale = np.ones(1)
+    color_offset = np.zeros(1)
+    depth = 0
+    while len(scale):
+        lo = scale[:, None]*low + offset
+        hi = scale[:, None]*high + offset
+        seen = (hi[:, 0] >= xmin) & (lo[:, 0] <= xmax) & (hi[:, 1] >= ymin) & (lo[:, 1] <= ymax) & (prob > 0)
+        small = seen & (scale*(high - low).max() <= target)
+        if len(scale) * n > max_cells:
+            small = seen
+        for key, value in zip(cells, (scale, offset, prob, color_scale, color_offset)):
+            cells[key].append(value[small])
+        cells['depth'].append(np.full(int(small.sum()), depth))
+
+        grow = seen & ~small
+        scale, offset, prob = scale[grow], offset[grow], prob[grow]
+        color_scale, color_offset = color_scale[grow], color_offset[grow]
+        # Children f_w(f_j(x)) = scale*r_j*x + scale*t_j + offset
+        offset = (scale[:, None, None]*table + offset[:, None]).reshape(-1, 2)
+        color_offset = (color_offset[:, None] + color_scale[:, None]*np.arange(n)/2).reshape(-1)
+        scale = (scale[:, None]*ratios).reshape(-1)
+        prob = (prob[:, None]*probs).reshape(-1)
+        color_scale = np.repeat(color_scale/2, n)
+        depth += 1
+
+    return {key: np.concatenate(value) for key, value in cells.items()}
+
+
+def render_viewport(game: ChaosGame, extent: tuple, points: int = 10**6, width: int = 1000,
+                    color: bool = False, rng: np.random.Generator = None, chunk_size: int = 2**16,
+                    raster: DensityRaster = None)->DensityRaster:
+    """
+    Rendering a zoomed-in viewport of a ChaosGame attractor without generating the points
+    outside of it. Points y of an ordinary run of the game are mapped by the cell of a visible
+    address w, picked with the probability of w (see visible_cells). Since the invariant
+    measure is the mixture of f_w(y) over the addresses of the tree cut, the density inside
+    the viewport is the same as for a full run, while the cost does not grow with the zoom.
+    Arguments:
+        game(ChaosGame):
+            the game
+        extent(tuple):
+            (xmin, xmax, ymin, ymax) of the viewport
+        points(int):
+            number of points generated, most of them land in the viewport
+        width(int):
+            number of pixel columns of a new raster
+        color(bool):
+            accumulate the gradient color of the points or not
+        rng(np.random.Generator):
+            random generator, the global np.random state if None
+        chunk_size(int):
+            number of points generated at a time
+        raster(DensityRaster):
+            raster to add to, a new one covering extent if None
+    returns:
+        DensityRaster:
+            the raster
+    """
+    if raster is None:
+        raster = DensityRaster(extent, width, channels=int(color))
+    cells = visible_cells(game, extent)
+    if len(cells['prob']) == 0:
+        return raster
+    alias = AliasTable(cells['prob'])
+
+    with phase('zoom.render', points):
+        mode = 'gradient' if color else None
+        for chunk in game.iter_chunks(points + 5, chunk_size, rng=rng, color=mode):
+            y = chunk[0]
+            w = alias.sample(rng, len(y))
+            moved = np.take(cells['scale'], w)[:, None]*y + np.take(cells['offset'], w, axis=0)
+            shade = None
+            if color:
+                shade = np.take(cells['color_scale'], w)*chunk[2] + np.take(cells['color_offset'], w)
+            raster.add(moved, shade)
+    return raster